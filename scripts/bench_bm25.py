@@ -0,0 +1,127 @@
+"""
+BM25 检索延迟基准测试
+对比 rank_bm25.BM25Okapi 全量扫描（get_scores + argsort）与倒排索引 + MaxScore 剪枝的查询延迟
+
+用法:
+    python scripts/bench_bm25.py                       # 默认 10k / 100k / 1M
+    python scripts/bench_bm25.py --sizes 10000 100000 --baseline-max 100000
+
+语料为合成数据：词项服从 Zipf 分布，贴近 n-gram 分词后"少量高频单字 + 大量低频多字词"的形态。
+BM25Okapi 需要为每个文档维护 Python 字典，百万级语料内存开销过大，
+因此超过 --baseline-max 的规模只测倒排索引。
+"""
+import argparse
+import sys
+import os
+import time
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import numpy as np
+
+from tools.bm25_index import BM25Index
+from tools.bm25_store import open_index_file, write_index_file
+
+
+def build_corpus(n_docs: int, doc_len: int, vocab_size: int, seed: int = 42):
+    """生成合成语料，返回 (term_ids, doc_ids, tfs, doc_lens)，三元组按 doc_id 升序"""
+    rng = np.random.default_rng(seed)
+    lens = rng.integers(doc_len // 2, doc_len * 3 // 2 + 1, size=n_docs).astype(np.int64)
+    total = int(lens.sum())
+    terms = (rng.zipf(1.2, size=total) - 1) % vocab_size
+    docs = np.repeat(np.arange(n_docs, dtype=np.int64), lens)
+
+    keys, tfs = np.unique(docs * vocab_size + terms, return_counts=True)
+    return keys % vocab_size, keys // vocab_size, tfs, lens
+
+
+def build_queries(n_queries: int, terms_per_query: int, vocab_size: int, seed: int = 7):
+    """生成查询：每个查询混合高频词项与低频词项"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(n_queries):
+        common = (rng.zipf(1.2, size=terms_per_query // 2) - 1) % vocab_size
+        rare = rng.integers(0, vocab_size, size=terms_per_query - len(common))
+        queries.append([f"t{t}" for t in np.concatenate([common, rare])])
+    return queries
+
+
+def timed(fn, queries, repeat: int = 1):
+    """返回每个查询的延迟（毫秒）"""
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(q)
+        latencies.append((time.perf_counter() - start) * 1000 / repeat)
+    return np.array(latencies)
+
+
+def bench(n_docs: int, args) -> None:
+    print(f"\n[{n_docs:,} chunks]")
+    term_ids, doc_ids, tfs, lens = build_corpus(n_docs, args.doc_len, args.vocab_size)
+    vocab = {f"t{i}": i for i in range(args.vocab_size)}
+    queries = build_queries(args.queries, args.query_terms, args.vocab_size)
+
+    start = time.perf_counter()
+    index = BM25Index.from_arrays(vocab, term_ids, doc_ids.astype(np.int32), tfs.astype(np.int32), lens)
+    print(f"  倒排索引构建: {time.perf_counter() - start:.2f}s, 数组占用 {index.nbytes / 1024 / 1024:.1f} MB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.bm25")
+        write_index_file(path, index, [{"id": str(i)} for i in range(n_docs)])
+        start = time.perf_counter()
+        loaded, _, _, _, _ = open_index_file(path)
+        print(f"  索引文件 mmap 打开: {(time.perf_counter() - start) * 1000:.1f} ms, 文件 {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+        del loaded
+
+    inverted = timed(lambda q: index.search(q, args.top_k), queries)
+    print(f"  倒排索引 + MaxScore : p50 {np.median(inverted):8.2f} ms  p95 {np.percentile(inverted, 95):8.2f} ms")
+
+    if n_docs > args.baseline_max:
+        print(f"  BM25Okapi 全量扫描  : 跳过（超过 --baseline-max={args.baseline_max:,}）")
+        return
+
+    from rank_bm25 import BM25Okapi
+    corpus = [[] for _ in range(n_docs)]
+    for d, t, tf in zip(doc_ids.tolist(), term_ids.tolist(), tfs.tolist()):
+        corpus[d].extend([f"t{t}"] * tf)
+    okapi = BM25Okapi(corpus)
+    del corpus
+
+    def okapi_search(q):
+        scores = okapi.get_scores(q)
+        return scores.argsort()[-args.top_k:][::-1]
+
+    baseline = timed(okapi_search, queries[:args.baseline_queries])
+    print(f"  BM25Okapi 全量扫描  : p50 {np.median(baseline):8.2f} ms  p95 {np.percentile(baseline, 95):8.2f} ms")
+    print(f"  加速比 (p50)        : {np.median(baseline) / np.median(inverted):.1f}x")
+
+    # 校验 top-k 分数一致
+    for q in queries[:5]:
+        expected = np.sort(okapi.get_scores(q))[::-1][:args.top_k]
+        got = [s for _, s in index.search(q, args.top_k)]
+        assert np.allclose(expected[:len(got)], got), "倒排索引结果与 BM25Okapi 不一致"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 检索延迟基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--doc-len", type=int, default=40, help="平均每个文档的词项数")
+    parser.add_argument("--vocab-size", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--baseline-queries", type=int, default=10)
+    parser.add_argument("--query-terms", type=int, default=12, help="每个查询的词项数")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--baseline-max", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BM25 检索延迟基准测试")
+    print("=" * 60)
+    for n in args.sizes:
+        bench(n, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Embedding 入库吞吐基准（离线）
+用本地模拟 Embedding（tools.mock_embeddings）按给定延迟模拟接口，测量不同并发数下
+embed_documents 的吞吐，验证分批并发（embedding.batch_size / max_workers）的效果。
+
+用法:
+    python scripts/bench_embedding.py                                   # 2000 个文本块，每批次 80ms
+    python scripts/bench_embedding.py --chunks 5000 --latency-ms 120 --workers 1 2 4 8
+    python scripts/bench_embedding.py --failure-rate 0.05               # 同时观察失败批次重试的开销
+"""
+import argparse
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.mock_embeddings import MockEmbeddings
+
+ALPHABET = "建账规则会计科目凭证余额银行现金资产负债损益折旧登记编制企业新设日记调节"
+
+
+def build_chunks(n: int, length: int = 500, seed: int = 7):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(ALPHABET) for _ in range(length)) for _ in range(n)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Embedding 入库吞吐基准")
+    parser.add_argument("--chunks", type=int, default=2000, help="文本块数")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="要对比的并发数")
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="每个批次的模拟延迟")
+    parser.add_argument("--latency-per-text-ms", type=float, default=0.2, help="每个文本的额外模拟延迟")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="每个批次模拟失败的概率")
+    parser.add_argument("--dimension", type=int, default=1024)
+    args = parser.parse_args()
+
+    chunks = build_chunks(args.chunks)
+    print(f"{'并发数':>6} {'耗时(s)':>10} {'吞吐(块/s)':>12}")
+    for workers in args.workers:
+        embeddings = MockEmbeddings(
+            dimension=args.dimension,
+            latency_ms=args.latency_ms,
+            latency_per_text_ms=args.latency_per_text_ms,
+            failure_rate=args.failure_rate,
+            batch_size=args.batch_size,
+            max_workers=workers
+        )
+        start = time.perf_counter()
+        embeddings.embed_documents(chunks)
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>6} {elapsed:>10.2f} {len(chunks) / elapsed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
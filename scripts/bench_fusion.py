@@ -0,0 +1,110 @@
+"""
+混合检索融合基准测试
+对比旧的按文本前 50 字建字典融合与按文本块标识对齐 + 数组融合的延迟
+
+用法:
+    python scripts/bench_fusion.py                     # 默认 50 / 500 / 5000 个候选
+    python scripts/bench_fusion.py --sizes 100 1000 --repeat 50
+
+每路候选数为给定规模，两路约一半重合；候选带 pgvector 行ID，内容为随机中文文本。
+"""
+import argparse
+import sys
+import os
+import time
+import random
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+
+from tools.score_fusion import align_candidates, fuse_scores, rank_fused
+
+ALPHABET = "建账规则会计科目凭证余额银行现金资产负债损益"
+
+
+def build_legs(n: int, seed: int = 42):
+    """生成两路候选（各 n 个，约一半重合）"""
+    rng = random.Random(seed)
+    chunks = [
+        {"id": str(i), "document": "".join(rng.choice(ALPHABET) for _ in range(200)), "metadata": {"source": f"{i % 20}.md"}}
+        for i in range(n * 3 // 2)
+    ]
+    vector = [dict(c, vector_score=rng.random()) for c in rng.sample(chunks[:n], n)]
+    bm25 = [dict(c, bm25_score=rng.random() * 20) for c in rng.sample(chunks[n // 2:], n)]
+    vector.sort(key=lambda r: -r["vector_score"])
+    bm25.sort(key=lambda r: -r["bm25_score"])
+    return vector, bm25
+
+
+def legacy_fuse(vector_results, bm25_results, vector_weight, bm25_weight, top_k):
+    """旧实现：按文本前 50 字建字典合并，逐文档归一化打分"""
+    vector_map = {r["document"].strip()[:50]: (r, i) for i, r in enumerate(vector_results)}
+    bm25_map = {r["document"].strip()[:50]: (r, i) for i, r in enumerate(bm25_results)}
+    merged = []
+    for key in set(vector_map) | set(bm25_map):
+        v = vector_map.get(key)
+        b = bm25_map.get(key)
+        merged.append({
+            "document": (v or b)[0]["document"],
+            "vector_score": v[0]["vector_score"] if v else 0.0,
+            "bm25_score": b[0]["bm25_score"] if b else 0.0,
+        })
+
+    def minmax(values):
+        low, high = min(values), max(values)
+        return [(x - low) / (high - low) if high > low else 0.5 for x in values]
+
+    vs = minmax([m["vector_score"] for m in merged])
+    bs = minmax([m["bm25_score"] for m in merged])
+    scored = sorted(
+        ((i, vs[i] * vector_weight + bs[i] * bm25_weight) for i in range(len(merged))),
+        key=lambda x: x[1], reverse=True
+    )
+    return scored[:top_k]
+
+
+def array_fuse(vector_results, bm25_results, vector_weight, bm25_weight, top_k):
+    """新实现：按行ID对齐后在分数矩阵上融合"""
+    aligned = align_candidates(
+        [vector_results, bm25_results],
+        [("vector_score", "score"), ("bm25_score", "score")]
+    )
+    fused = fuse_scores(aligned, [vector_weight, bm25_weight], "weighted")
+    return rank_fused(fused, top_k)
+
+
+def timed(fn, repeat: int) -> float:
+    """返回平均延迟（毫秒，先预热一次）"""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="混合检索融合基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000], help="每路候选数")
+    parser.add_argument("--repeat", type=int, default=20, help="每个规模重复次数")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'候选数':>8} {'旧实现(ms)':>12} {'数组融合(ms)':>14} {'加速比':>8}")
+    for n in args.sizes:
+        vector, bm25 = build_legs(n)
+        repeat = max(1, args.repeat * 50 // max(n, 50))
+        legacy = timed(lambda: legacy_fuse(vector, bm25, 0.5, 0.5, args.top_k), repeat)
+        fused = timed(lambda: array_fuse(vector, bm25, 0.5, 0.5, args.top_k), repeat)
+        print(f"{n:>8} {legacy:>12.3f} {fused:>14.3f} {legacy / fused:>7.1f}x")
+
+    # 数组融合的内核部分（对齐之后的归一化 + 加权 + 排序）单独计时
+    print()
+    print(f"{'候选数':>8} {'融合内核(ms)':>14}")
+    for n in args.sizes:
+        vector, bm25 = build_legs(n)
+        aligned = align_candidates([vector, bm25], [("vector_score", "score"), ("bm25_score", "score")])
+        kernel = timed(lambda: rank_fused(fuse_scores(aligned, [0.5, 0.5], "weighted"), args.top_k), args.repeat * 10)
+        print(f"{n:>8} {kernel:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Rerank 后端对比基准
+对比 /rerank 接口（endpoint）与对话补全评分（chat）两种后端的延迟和解析失败率
+
+用法:
+    python scripts/bench_rerank.py --stub                        # endpoint 走本地替身服务，只测 endpoint
+    python scripts/bench_rerank.py --backends endpoint chat      # 两种后端都走真实接口（需要 API Key）
+    python scripts/bench_rerank.py --docs 30 --repeat 10
+
+每轮用同一组合成查询 / 候选文档调用 rerank_documents，后端之间不回退，
+统计来自 tools.rerank_client.get_rerank_stats。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.rerank_client import get_rerank_stats, reset_rerank_stats
+from tools.reranker_tool import rerank_documents
+from utils.config_loader import get_config
+
+QUERIES = ["新设企业如何建账", "银行存款余额调节表怎么编制", "固定资产折旧的会计科目", "现金日记账的登记规则"]
+ALPHABET = "建账规则会计科目凭证余额银行现金资产负债损益折旧登记编制企业新设日记调节"
+
+
+def build_docs(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    return [{"id": str(i), "content": "".join(rng.choice(ALPHABET) for _ in range(300))} for i in range(n)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rerank 后端对比基准")
+    parser.add_argument("--backends", nargs="+", default=["endpoint"], choices=["endpoint", "chat"])
+    parser.add_argument("--docs", type=int, default=20, help="每次请求的候选数")
+    parser.add_argument("--repeat", type=int, default=5, help="每个查询重复次数")
+    parser.add_argument("--stub", action="store_true", help="endpoint 后端使用本地替身服务")
+    args = parser.parse_args()
+
+    config = get_config()
+    config.set("rerank.fallback_to_chat", False)
+    server = None
+    if args.stub:
+        from rerank_stub_server import start_server
+        server, base_url = start_server()
+        os.environ["RERANK_STUB_BASE_URL"] = base_url
+        config.set("rerank.endpoint.base_url_env", "RERANK_STUB_BASE_URL")
+
+    docs = json.dumps(build_docs(args.docs), ensure_ascii=False)
+    reset_rerank_stats()
+    for backend in args.backends:
+        config.set("rerank.backend", backend)
+        for _ in range(args.repeat):
+            for query in QUERIES:
+                try:
+                    rerank_documents.invoke({"query": query, "documents": docs, "top_n": 5})
+                except RuntimeError as e:
+                    print(f"[{backend}] {e}")
+
+    print(f"{'后端':>10} {'调用数':>8} {'平均延迟(ms)':>14} {'失败率':>8} {'解析失败率':>10}")
+    for backend, stats in get_rerank_stats().items():
+        print(f"{backend:>10} {stats['calls']:>8} {stats['avg_ms']:>14.1f} "
+              f"{stats['error_rate']:>8.1%} {stats['parse_failure_rate']:>10.1%}")
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
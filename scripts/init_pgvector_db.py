@@ -10,7 +10,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from sqlalchemy import text
 from storage.database.db import get_engine
-from tools.vector_store import get_embeddings, get_vector_store, check_vector_store_setup
+from tools.vector_store import get_embeddings, get_vector_store, check_vector_store_setup, forget_vector_store
 from tools.document_loader import load_document
 from langchain_core.documents import Document
 
@@ -156,6 +156,7 @@ def test_vector_store():
         # 清理测试数据
         print("清理测试数据...")
         vector_store.delete_collection()
+        forget_vector_store("test_collection")
         print("✓ 测试数据已清理")
 
         return True
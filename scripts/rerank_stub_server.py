@@ -0,0 +1,101 @@
+"""
+本地 Rerank 替身服务
+实现 OpenAI 兼容的 /rerank 接口，按查询与文档的字符二元组重合度打分，用于测试和基准对比，
+不需要外部 API Key。
+
+用法:
+    python scripts/rerank_stub_server.py                    # 监听 127.0.0.1:8901
+    python scripts/rerank_stub_server.py --port 9000 --latency-ms 30
+
+    然后设置 SILICONFLOW_BASE_URL=http://127.0.0.1:8901 即可让 Rerank 走替身服务。
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+
+def _bigrams(text: str) -> set:
+    text = "".join(text.lower().split())
+    return {text[i:i + 2] for i in range(len(text) - 1)} or ({text} if text else set())
+
+
+def score_documents(query: str, documents: List[str]) -> List[float]:
+    """按查询二元组被文档覆盖的比例打分（0-1）"""
+    query_grams = _bigrams(query)
+    if not query_grams:
+        return [0.0] * len(documents)
+    return [len(query_grams & _bigrams(doc)) / len(query_grams) for doc in documents]
+
+
+def make_handler(latency_ms: float = 0.0):
+    """创建请求处理类（latency_ms 为每个请求额外的模拟延迟）"""
+
+    class RerankHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 支持 keep-alive，客户端可复用连接
+
+        def do_POST(self):
+            if self.path.rstrip("/") not in ("/rerank", "/v1/rerank"):
+                self.send_error(404)
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                query = body["query"]
+                documents = [d if isinstance(d, str) else d.get("text", "") for d in body["documents"]]
+            except (ValueError, KeyError, TypeError):
+                self.send_error(400, "invalid rerank request")
+                return
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            scores = score_documents(query, documents)
+            results = sorted(
+                ({"index": i, "relevance_score": s} for i, s in enumerate(scores)),
+                key=lambda r: -r["relevance_score"]
+            )
+            top_n = body.get("top_n")
+            if top_n:
+                results = results[:top_n]
+            payload = json.dumps({"model": body.get("model"), "results": results}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return RerankHandler
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    在后台线程启动替身服务
+
+    Returns:
+        (服务实例, base_url)；用完调用 server.shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(latency_ms))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地 Rerank 替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每个请求的模拟延迟")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.latency_ms))
+    print(f"Rerank 替身服务: http://{args.host}:{args.port}/rerank")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,7 @@ import os
 import json
 from typing import Annotated
 from langgraph.prebuilt import create_react_agent
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_model
 from langgraph.graph import MessagesState
 from langgraph.graph.message import add_messages
 from langchain_core.messages import AnyMessage
@@ -66,19 +66,15 @@ def build_agent(ctx=None):
     api_key = os.getenv("SILICONFLOW_API_KEY")
     base_url = os.getenv("SILICONFLOW_BASE_URL")
 
-    llm = ChatOpenAI(
+    llm = get_chat_model(
         model=cfg['config'].get("model"),
         api_key=api_key,
         base_url=base_url,
         temperature=cfg['config'].get('temperature', 0.7),
+        thinking=cfg['config'].get('thinking', 'disabled'),
+        headers=default_headers(ctx) if ctx else {},
         streaming=True,
-        timeout=cfg['config'].get('timeout', 600),
-        extra_body={
-            "thinking": {
-                "type": cfg['config'].get('thinking', 'disabled')
-            }
-        },
-        default_headers=default_headers(ctx) if ctx else {}
+        timeout=cfg['config'].get('timeout', 600)
     )
 
     # 构建工具列表 (精简后的核心工具集)
@@ -5,15 +5,20 @@ RAG 业务逻辑层
 import json
 import logging
 import os
+import time
 from typing import List, Optional, Dict, Any
 from langchain_core.documents import Document
-from tools.vector_store import get_vector_store
+from tools.vector_store import get_vector_store, statement_timeout
 from tools.reranker_tool import rerank_documents
-from tools.bm25_retriever import bm25_retrieve
+from tools.rerank_cache import invalidate_rerank_cache
+from tools.embedding_cache import track_embedding_cache
+from tools.bm25_retriever import bm25_retrieve, update_bm25_index
+from tools.adaptive_depth import DepthController
 from tools.question_classifier import classify_question_type, get_retrieval_strategy
 from tools.document_loader import load_document, get_document_info
 from tools.text_splitter import split_text_recursive, split_text_by_markdown_structure, hierarchical_split
 from storage.provider import get_storage_provider
+from utils.config_loader import get_config
 
 logger = logging.getLogger(__name__)
 
@@ -77,9 +82,27 @@ class RAGService:
                 "chunk_index": i
             }
             docs.append(Document(page_content=chunk, metadata=combined_meta))
-        vector_store.add_documents(docs)
+        with track_embedding_cache() as cache_stats:
+            ids = vector_store.add_documents(docs)
+        logger.info(f"入库 {os.path.basename(file_path)}: Embedding 缓存命中 {cache_stats['hits']}/{len(docs)}")
+        # 同一来源重新入库后，其文本块的 Rerank 缓存分数失效
+        invalidate_rerank_cache(source=os.path.basename(file_path))
+
+        # 5. BM25 索引增量更新（只处理本次新增的块，失败不影响入库）
+        try:
+            update_bm25_index(self.collection_name, added=[
+                {"id": doc_id, "text": doc.page_content, "metadata": doc.metadata}
+                for doc_id, doc in zip(ids, docs)
+            ])
+        except Exception as e:
+            logger.warning(f"BM25 索引增量更新失败: {e}")
         
-        return {"object_key": object_key, "chunks": len(chunks), "hierarchical": use_hierarchical}
+        return {
+            "object_key": object_key,
+            "chunks": len(chunks),
+            "hierarchical": use_hierarchical,
+            "embedding_cache": cache_stats
+        }
 
     def smart_retrieve(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """智能路由检索：分类 -> 策略选择 -> 执行检索 -> Rerank"""
@@ -99,39 +122,95 @@ class RAGService:
         strategy = strategy_data.get("strategy", {})
         method = strategy.get("method", "vector")
         use_rerank = strategy.get("use_rerank", True)
+        # BM25 参数按问题类型在查询时生效（None 时使用索引默认值）
+        bm25_k1 = strategy.get("bm25_k1")
+        bm25_b = strategy.get("bm25_b")
+        # 混合检索的融合方法与每路候选数按问题类型选择
+        fuser = strategy.get("fuser", "weighted")
+        initial_k = strategy.get("initial_k")
+        # Rerank 前的本地预排序保留 prerank_factor × top_k 个候选（检索阶段准备 top_k × 3 个）
+        prerank_factor = strategy.get("prerank_factor")
+        prune_to = int(prerank_factor * top_k) if use_rerank and prerank_factor else None
+        # Rerank 从比 top_k 更多的候选中挑选：各检索方式统一为其准备 candidate_k 个候选
+        candidate_k = top_k * 3 if use_rerank else top_k
         
         logger.info(f"Query: {query} | Type: {q_type} | Strategy: {method} | Rerank: {use_rerank}")
         
         # 3. 执行基础检索
         docs = []
+        # 行ID → 检索阶段已得到的查询-文档余弦相似度（供 Rerank 前的本地预排序使用）
+        similarities: Dict[str, float] = {}
         if method == "vector":
             vector_store = get_vector_store(collection_name=self.collection_name)
-            results = vector_store.similarity_search_with_score(query, k=top_k * 3)
+            # 自适应深度：先浅取，截断处分数间隔过小（排序不确定）时再加深
+            controller = DepthController.from_config(top_k, min_depth=candidate_k)
+            depth = controller.initial_depth if controller is not None else candidate_k
+            # 与混合检索共享截止时间：剩余时间不够再跑一轮时不加深，单次查询受 statement_timeout 约束
+            config = get_config()
+            deadline_ms = float(config.get("rag.hybrid.deadline_ms", 3000))
+            start = time.perf_counter()
+            while True:
+                round_start = time.perf_counter()
+                with statement_timeout(float(config.get("rag.hybrid.statement_timeout_ms", 5000))):
+                    results = vector_store.similarity_search_with_score(query, k=depth)
+                # pgvector 返回余弦距离，转成相似度（越大越相关）后评估
+                if controller is None or not controller.assess([[1 - s for _, s in results]], depth):
+                    break
+                now = time.perf_counter()
+                if (now - start + now - round_start) * 1000 > deadline_ms:
+                    logger.info(f"Vector depth: 剩余时间不足，停在深度 {depth}")
+                    break
+                depth = controller.next_depth(depth)
+            if controller is not None:
+                logger.info(f"Vector depth: {controller.metrics()}")
             for doc, score in results:
                 doc.metadata["vector_score"] = float(score)
+                similarities[doc.id] = 1 - float(score)
                 docs.append(doc)
         elif method == "bm25":
-            bm25_res = bm25_retrieve.invoke({"query": query, "top_k": top_k * 3})
+            # BM25 在进程内检索，没有数据库往返可省：固定取 candidate_k 个，不做自适应加深
+            bm25_res = bm25_retrieve.invoke({
+                "query": query,
+                "collection_name": self.collection_name,
+                "top_k": candidate_k,
+                "k1": bm25_k1,
+                "b": bm25_b
+            })
             docs = self._parse_json_docs(bm25_res)
         else: # hybrid
             from tools.hybrid_retriever import hybrid_retrieve
             hybrid_res = hybrid_retrieve.invoke({
                 "query": query,
                 "collection_name": self.collection_name,
-                "top_k": top_k * 3
+                "top_k": top_k,
+                "candidate_k": candidate_k,
+                "vector_weight": strategy.get("vector_weight", 0.5),
+                "bm25_weight": strategy.get("bm25_weight", 0.5),
+                "score_method": fuser,
+                "initial_k": initial_k,
+                "bm25_k1": bm25_k1,
+                "bm25_b": bm25_b
             })
             docs = self._parse_json_docs(hybrid_res)
+            try:
+                for r in json.loads(hybrid_res).get("final_results", []):
+                    if r.get("vector_rank", -1) >= 0:
+                        similarities[r.get("chunk_id")] = r.get("vector_score")
+            except (ValueError, AttributeError):
+                pass
 
         # 4. Rerank
         if use_rerank and docs:
             rerank_input = json.dumps([
-                {"content": d.page_content, "id": str(i), "metadata": d.metadata} 
+                {"content": d.page_content, "id": str(i), "chunk_id": d.id, "metadata": d.metadata,
+                 "vector_similarity": similarities.get(d.id)}
                 for i, d in enumerate(docs)
             ])
             reranked_res = rerank_documents.invoke({
                 "query": query,
                 "documents": rerank_input,
-                "top_n": top_k
+                "top_n": top_k,
+                "prune_to": prune_to
             })
             
             try:
@@ -163,6 +242,26 @@ class RAGService:
         })
         return json.loads(res)
 
+    def scoped_search(
+        self,
+        query: str,
+        source: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        child_only: bool = False,
+        top_k: int = 5
+    ) -> Dict[str, Any]:
+        """在 source / parent_id / 子块范围内做 BM25 检索（过滤在打分时生效）"""
+        from tools.document_hierarchy import search_by_hierarchy
+        res = search_by_hierarchy.invoke({
+            "collection_name": self.collection_name,
+            "query": query,
+            "source": source,
+            "parent_id": parent_id,
+            "child_only": child_only,
+            "top_k": top_k
+        })
+        return json.loads(res)
+
     def _parse_json_docs(self, json_str: str) -> List[Document]:
         """解析工具返回的 JSON 字符串为 Document 列表"""
         try:
@@ -181,7 +280,7 @@ class RAGService:
                 content = d.get("content") or d.get("page_content") or d.get("document") or ""
                 metadata = d.get("metadata") or {}
                 if content:
-                    docs.append(Document(page_content=content, metadata=metadata))
+                    docs.append(Document(page_content=content, metadata=metadata, id=d.get("chunk_id") or d.get("id")))
             return docs
         except Exception as e:
             logger.error(f"Error parsing JSON docs: {e}")
@@ -272,54 +371,35 @@ class RAGService:
         return " | ".join(location_parts) if location_parts else "未知位置"
 
     def compare_methods(self, query: str, methods: Dict[str, bool]) -> Dict[str, Any]:
-        """对比不同检索方法的结果"""
-        comparison = {}
+        """对比不同检索方法的结果
+
+        向量检索与BM25检索各执行一次，选中的方法（vector / bm25 / hybrid / hybrid_rerank）
+        作为同一候选池上的视图并发计算；time 为单独执行该方法所需的毫秒数。
+        """
+        from tools.hybrid_retriever import CandidatePool, METHOD_SCORE_FIELDS
         top_k = 5
-        
-        if methods.get('vector'):
-            vector_store = get_vector_store(collection_name=self.collection_name)
-            results = vector_store.similarity_search_with_score(query, k=top_k)
-            scores = [float(s) for d, s in results] if results else []
-            avg = sum(scores) / len(scores) if scores else 0.0
-            comparison['vector'] = {
-                "results": [{"content": d.page_content, "score": float(s), "metadata": d.metadata} for d, s in results],
-                "avg_score": avg,
-                "time": 0 # 简化处理
-            }
-            
-        if methods.get('bm25'):
-            bm25_res = bm25_retrieve.invoke({"query": query, "top_k": top_k})
-            docs = self._parse_json_docs(bm25_res)
-            scores = []
-            normalized = []
-            for d in docs:
-                sc = d.metadata.get("score") if hasattr(d, "metadata") and d.metadata else 0.0
-                scores.append(sc)
-                normalized.append({"content": d.page_content, "metadata": d.metadata, "score": sc})
-            avg = sum(scores) / len(scores) if scores else 0.0
-            comparison['bm25'] = {
-                "results": normalized,
-                "avg_score": avg,
-                "time": 0
-            }
-            
-        if methods.get('hybrid'):
-            from tools.hybrid_retriever import hybrid_retrieve
-            hybrid_res = hybrid_retrieve.invoke({"query": query, "collection_name": self.collection_name, "top_k": top_k})
-            docs = self._parse_json_docs(hybrid_res)
-            scores = []
+        selected = [name for name in METHOD_SCORE_FIELDS if methods.get(name)]
+        if not selected:
+            return {}
+
+        pool = CandidatePool(query, collection_name=self.collection_name, depth=min(top_k * 3, 50)).fetch()
+        views = pool.compare(selected, top_k)
+        logger.info(f"Compare: {query} | Legs: {pool.timings} | Missing: {pool.missing}")
+
+        comparison = {}
+        for name, view in views.items():
+            fields = METHOD_SCORE_FIELDS[name]
             normalized = []
-            for d in docs:
-                sc = d.metadata.get("score") if hasattr(d, "metadata") and d.metadata else 0.0
-                scores.append(sc)
-                normalized.append({"content": d.page_content, "metadata": d.metadata, "score": sc})
-            avg = sum(scores) / len(scores) if scores else 0.0
-            comparison['hybrid'] = {
+            for r in view["results"]:
+                sc = next((float(r[f]) for f in fields if r.get(f) is not None), 0.0)
+                normalized.append({"content": r.get("document", ""), "metadata": r.get("metadata", {}), "score": sc})
+            scores = [r["score"] for r in normalized]
+            comparison[name] = {
                 "results": normalized,
-                "avg_score": avg,
-                "time": 0
+                "avg_score": sum(scores) / len(scores) if scores else 0.0,
+                "time": view["time"],
+                "degraded": view["degraded"]
             }
-            
         return comparison
 
 _rag_service = None
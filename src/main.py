@@ -6,6 +6,7 @@ import logging
 from typing import Any, Dict, AsyncGenerator, Optional
 import uvicorn
 import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import StreamingResponse
 
@@ -94,7 +95,18 @@ class GraphService:
         return {"input_schema": {"message": "string"}, "output_schema": {"content": "string"}}
 
 service = GraphService()
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 预热向量存储注册表（连接池与集合查找），失败不影响启动
+    from tools.vector_store import warm_vector_stores
+    warmed = await asyncio.to_thread(warm_vector_stores)
+    logger.info(f"向量存储预热完成: {warmed}")
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.post("/run")
 async def http_run(request: Request) -> Dict[str, Any]:
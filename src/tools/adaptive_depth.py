@@ -0,0 +1,164 @@
+"""
+自适应候选深度
+检索先取较浅的候选，根据排序是否确定决定是否加深：
+    截断：某一路返回的候选数等于当前深度（更深处还有候选）
+    重合度：两路前 top_k 中相同文本块的比例（两路都有结果时）
+    分数间隔：第 top_k 名与候选末尾的分数差 / 第 1 名与候选末尾的分数差，
+              越小说明截断处之后的候选与入选的差不多，排序越不确定
+只有在截断且（重合度或分数间隔低于阈值）时才加深，简单查询不再为候选和 Rerank 多付开销；
+需要加深时直接取到 max_depth，每个查询最多两轮检索往返。
+每次查询的深度指标随结果返回，并汇总到 get_depth_stats 以便观察延迟 / 召回的取舍。
+"""
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from tools.score_fusion import AlignedCandidates
+
+
+class DepthController:
+    """
+    单次查询的候选深度控制器
+
+    深度从 initial_depth 开始，需要加深时直接取 max_depth（逐步加倍会让同一个查询多次往返，
+    每轮都重新取回前一轮已有的候选）。
+    """
+
+    def __init__(
+        self,
+        top_k: int,
+        start_factor: float = 2.0,
+        max_depth: int = 50,
+        min_overlap: float = 0.2,
+        min_gap: float = 0.15,
+        min_depth: int = 0
+    ):
+        """
+        Args:
+            top_k: 最终返回数量
+            start_factor: 初始深度 = top_k * start_factor
+            max_depth: 最大深度
+            min_overlap: 两路前 top_k 的重合比例低于该值视为不确定
+            min_gap: 截断处分数间隔低于该值视为不确定
+            min_depth: 初始深度下限（调用方需要的最少候选数，如 Rerank 预排序的余量），不超过 max_depth
+        """
+        self.top_k = max(int(top_k), 1)
+        self.max_depth = max(int(max_depth), self.top_k)
+        self.min_overlap = min_overlap
+        self.min_gap = min_gap
+        self.initial_depth = min(
+            max(int(np.ceil(self.top_k * start_factor)), self.top_k, int(min_depth)), self.max_depth
+        )
+        self.rounds: List[Dict[str, Any]] = []
+
+    @classmethod
+    def from_config(cls, top_k: int, min_depth: int = 0) -> Optional["DepthController"]:
+        """按配置 rag.adaptive_depth.* 创建，未启用时返回 None"""
+        from utils.config_loader import get_config
+        config = get_config()
+        if str(config.get("rag.adaptive_depth.enabled", True)).lower() not in ("true", "1"):
+            return None
+        return cls(
+            top_k,
+            start_factor=float(config.get("rag.adaptive_depth.start_factor", 2.0)),
+            max_depth=int(config.get("rag.adaptive_depth.max_depth", 50)),
+            min_overlap=float(config.get("rag.adaptive_depth.min_overlap", 0.2)),
+            min_gap=float(config.get("rag.adaptive_depth.min_gap", 0.15)),
+            min_depth=min_depth
+        )
+
+    def _gap(self, scores: np.ndarray) -> Optional[float]:
+        """按排名排列的分数在第 top_k 名处的间隔（候选不足 top_k + 1 个时为 None）"""
+        if len(scores) <= self.top_k:
+            return None
+        spread = scores[0] - scores[-1]
+        if spread <= 0:
+            return 0.0
+        return float((scores[self.top_k - 1] - scores[-1]) / spread)
+
+    def assess(self, leg_scores: Sequence[Sequence[float]], depth: int, overlap: Optional[float] = None) -> bool:
+        """
+        评估本轮候选，记录指标并决定是否加深
+
+        Args:
+            leg_scores: 各路按排名排列的分数（越大越相关）
+            depth: 本轮深度
+            overlap: 两路前 top_k 的重合比例（单路检索为 None）
+
+        Returns:
+            是否需要加深
+        """
+        truncated = any(len(scores) >= depth for scores in leg_scores)
+        gaps = [g for g in (self._gap(np.asarray(scores, dtype=np.float64)) for scores in leg_scores) if g is not None]
+        gap = min(gaps) if gaps else None
+        reasons = []
+        if overlap is not None and overlap < self.min_overlap:
+            reasons.append("overlap")
+        if gap is not None and gap < self.min_gap:
+            reasons.append("gap")
+        deepen = truncated and bool(reasons) and depth < self.max_depth
+        self.rounds.append({
+            "depth": depth,
+            "truncated": truncated,
+            "overlap": overlap,
+            "gap": gap,
+            "uncertain": reasons,
+            "deepen": deepen
+        })
+        return deepen
+
+    def assess_aligned(self, aligned: AlignedCandidates, depth: int) -> bool:
+        """按对齐后的多路候选评估（重合度取前两路）"""
+        leg_scores = []
+        for scores, ranks in zip(aligned.scores, aligned.ranks):
+            hit = np.flatnonzero(ranks >= 0)
+            leg_scores.append(scores[hit[np.argsort(ranks[hit])]])
+        overlap = None
+        if len(aligned.ranks) >= 2 and all(len(s) for s in leg_scores[:2]):
+            in_top = (aligned.ranks[:2] >= 0) & (aligned.ranks[:2] < self.top_k)
+            overlap = float((in_top[0] & in_top[1]).sum()) / self.top_k
+        return self.assess(leg_scores, depth, overlap)
+
+    def next_depth(self, depth: int) -> int:
+        return self.max_depth
+
+    def metrics(self) -> Dict[str, Any]:
+        """本次查询的深度指标（同时计入全局统计）"""
+        final = self.rounds[-1]["depth"] if self.rounds else self.initial_depth
+        metrics = {
+            "initial_depth": self.initial_depth,
+            "final_depth": final,
+            "deepened": len(self.rounds) > 1,
+            "rounds": self.rounds
+        }
+        _record(metrics)
+        return metrics
+
+
+# ==================== 全局统计 ====================
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Any] = {"queries": 0, "deepened": 0, "total_depth": 0, "by_depth": {}}
+
+
+def _record(metrics: Dict[str, Any]) -> None:
+    with _stats_lock:
+        _stats["queries"] += 1
+        _stats["deepened"] += int(metrics["deepened"])
+        _stats["total_depth"] += metrics["final_depth"]
+        key = str(metrics["final_depth"])
+        _stats["by_depth"][key] = _stats["by_depth"].get(key, 0) + 1
+
+
+def get_depth_stats() -> Dict[str, Any]:
+    """自适应深度的汇总统计（查询数、加深比例、平均最终深度、最终深度分布）"""
+    with _stats_lock:
+        queries = _stats["queries"]
+        return {
+            "queries": queries,
+            "deepened": _stats["deepened"],
+            "deepen_rate": _stats["deepened"] / queries if queries else 0.0,
+            "avg_final_depth": _stats["total_depth"] / queries if queries else 0.0,
+            "by_depth": dict(_stats["by_depth"])
+        }
@@ -0,0 +1,152 @@
+"""
+BM25 元数据过滤索引
+为指定的元数据字段预先建立 取值 → 文档ID有序集合，检索时先求出过滤集合再只对集合内的文档打分，
+而不是取 top-k 后再过滤（后过滤会悄悄丢掉结果）。
+
+source、parent_id 这类字段取值多、每个取值只覆盖少量文档，稠密位图的内存是 字段取值数 × 文档数 / 8，
+因此每个取值存为有序文档ID数组（CSR），单个字段总大小为 4 字节 × 文档数。
+"""
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 默认建立过滤索引的字段：来源文件、父块ID、是否父块（hierarchical_split 产生）
+DEFAULT_FILTER_FIELDS = ("source", "parent_id", "is_parent")
+
+
+def value_key(value: Any) -> str:
+    """元数据取值的规范化键（保留类型：False 与 "False" 不同）"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+class MetadataIndex:
+    """
+    元数据过滤索引
+
+    存储结构（每个字段）：
+        values:  取值键 → 取值序号
+        offsets: int64[K+1]，取值 k 的文档位于 docs[offsets[k]:offsets[k+1]]
+        docs:    int32[M]，文档ID（每个取值内升序）
+    """
+
+    def __init__(self, fields: Dict[str, Tuple[Dict[str, int], np.ndarray, np.ndarray]]):
+        self.fields = fields
+
+    @classmethod
+    def _from_pairs(cls, field_pairs: Dict[str, Tuple[List[str], np.ndarray, np.ndarray]]) -> "MetadataIndex":
+        """由每个字段的 (取值键列表, 取值序号数组, 文档ID数组) 构建"""
+        fields = {}
+        for field, (keys, value_ids, doc_ids) in field_pairs.items():
+            order = np.lexsort((doc_ids, value_ids))
+            offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(value_ids, minlength=len(keys)), out=offsets[1:])
+            fields[field] = (
+                {key: i for i, key in enumerate(keys)},
+                offsets,
+                np.ascontiguousarray(doc_ids[order], dtype=np.int32)
+            )
+        return cls(fields)
+
+    @classmethod
+    def build(cls, documents: Sequence[Dict[str, Any]], fields: Sequence[str] = DEFAULT_FILTER_FIELDS) -> "MetadataIndex":
+        """
+        从文档列表构建过滤索引
+
+        Args:
+            documents: 文档列表（文档ID即列表下标）
+            fields: 建立索引的元数据字段
+
+        Returns:
+            MetadataIndex 实例
+        """
+        field_pairs = {}
+        collected: Dict[str, Tuple[Dict[str, int], List[int], List[int]]] = {f: ({}, [], []) for f in fields}
+        for doc_id, doc in enumerate(documents):
+            metadata = doc.get("metadata") or {}
+            for field, (values, value_ids, doc_ids) in collected.items():
+                if field in metadata:
+                    key = value_key(metadata[field])
+                    value_ids.append(values.setdefault(key, len(values)))
+                    doc_ids.append(doc_id)
+        for field, (values, value_ids, doc_ids) in collected.items():
+            field_pairs[field] = (
+                list(values),
+                np.asarray(value_ids, dtype=np.int64),
+                np.asarray(doc_ids, dtype=np.int64)
+            )
+        return cls._from_pairs(field_pairs)
+
+    @classmethod
+    def concat(cls, parts: Sequence[Tuple["MetadataIndex", np.ndarray]]) -> "MetadataIndex":
+        """
+        合并多个段的过滤索引（只保留所有段都建立了索引的字段）
+
+        Args:
+            parts: [(过滤索引, 段内文档ID → 合并后文档ID（-1 表示丢弃）), ...]
+
+        Returns:
+            合并后的 MetadataIndex
+        """
+        common = [f for f in parts[0][0].fields if all(f in index.fields for index, _ in parts)]
+        field_pairs = {}
+        for field in common:
+            keys: Dict[str, int] = {}
+            value_parts, doc_parts = [], []
+            for index, doc_map in parts:
+                values, offsets, docs = index.fields[field]
+                by_id = sorted(values, key=values.get)
+                remap = np.array([keys.setdefault(key, len(keys)) for key in by_id], dtype=np.int64)
+                local_values = np.repeat(np.arange(len(by_id)), np.diff(offsets))
+                new_docs = np.asarray(doc_map, dtype=np.int64)[docs]
+                keep = new_docs >= 0
+                value_parts.append(remap[local_values[keep]] if len(remap) else local_values[keep])
+                doc_parts.append(new_docs[keep])
+            field_pairs[field] = (
+                list(keys),
+                np.concatenate(value_parts) if value_parts else np.zeros(0, dtype=np.int64),
+                np.concatenate(doc_parts) if doc_parts else np.zeros(0, dtype=np.int64)
+            )
+        return cls._from_pairs(field_pairs)
+
+    def lookup(self, field: str, value: Any) -> np.ndarray:
+        """某个字段取某个值的文档ID（升序）"""
+        values, offsets, docs = self.fields[field]
+        slot = values.get(value_key(value))
+        if slot is None:
+            return np.zeros(0, dtype=np.int32)
+        return docs[offsets[slot]:offsets[slot + 1]]
+
+    def resolve(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        求过滤条件对应的文档ID集合
+
+        不同字段之间取交集；字段取值为列表时表示其中任一取值（并集）。
+
+        Args:
+            filters: 字段 → 取值（或取值列表）
+
+        Returns:
+            文档ID数组（升序、无重复）
+
+        Raises:
+            ValueError: 字段没有建立过滤索引
+        """
+        result: Optional[np.ndarray] = None
+        # 先处理最小的集合，交集越早变小越省
+        sets = []
+        for field, value in filters.items():
+            if field not in self.fields:
+                raise ValueError(f"元数据字段 '{field}' 未建立过滤索引")
+            options = value if isinstance(value, (list, tuple)) else [value]
+            ids = [self.lookup(field, option) for option in options]
+            sets.append(ids[0] if len(ids) == 1 else np.unique(np.concatenate(ids)) if ids else np.zeros(0, dtype=np.int32))
+        for ids in sorted(sets, key=len):
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+            if not len(result):
+                break
+        return np.zeros(0, dtype=np.int32) if result is None else result
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(offsets.nbytes + docs.nbytes for _, offsets, docs in self.fields.values()))
@@ -0,0 +1,599 @@
+"""
+BM25 倒排索引引擎
+以紧凑数组（CSR）存储 词项 → 倒排表(doc_id, tf)，查询时使用 MaxScore 动态剪枝计算 top-k，
+避免对全量语料逐文档打分
+"""
+from collections import Counter
+from typing import List, Dict, Tuple, Sequence, Iterable, Optional
+
+import numpy as np
+
+
+def okapi_idf(df: np.ndarray, doc_count: int, epsilon: float) -> np.ndarray:
+    """
+    Okapi idf，负值替换为 epsilon * average_idf（与 BM25Okapi 一致，平均值只统计出现过的词项）
+
+    Args:
+        df: 每个词项的文档频率
+        doc_count: 文档总数
+        epsilon: idf 下限系数
+
+    Returns:
+        idf 数组（未出现的词项为 0）
+    """
+    df = np.asarray(df, dtype=np.float64)
+    present = df > 0
+    idf = np.zeros(len(df), dtype=np.float64)
+    if present.any():
+        idf[present] = np.log(doc_count - df[present] + 0.5) - np.log(df[present] + 0.5)
+        average_idf = float(idf[present].mean())
+        idf[present & (idf < 0)] = epsilon * average_idf
+    return idf
+
+
+class BM25Index:
+    """
+    BM25 倒排索引（Okapi 变体）
+
+    打分公式与 rank_bm25.BM25Okapi 保持一致（含 idf 下限 epsilon * average_idf），
+    因此替换后同一查询得到的分数不变，只是不再扫描全量文档。
+
+    存储结构：
+        vocab:      词项 → 词项ID
+        offsets:    int64[V+1]，词项 t 的倒排表位于 [offsets[t], offsets[t+1])
+        post_docs:  int32[P]，倒排表中的文档ID（每个词项内升序）
+        post_tfs:   int32[P]，对应的词频
+        doc_lens:   int32[N]，文档长度（词项个数）
+
+    k1/b 可以在查询时逐请求指定，对应的长度归一化向量与分数上界按参数缓存（见 scoring_vectors）。
+    """
+
+    # 每个索引最多缓存的 (k1, b) 参数组数
+    MAX_SCORING_PARAMS = 8
+
+    def __init__(
+        self,
+        vocab: Dict[str, int],
+        offsets: np.ndarray,
+        post_docs: np.ndarray,
+        post_tfs: np.ndarray,
+        doc_lens: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+        idf: Optional[np.ndarray] = None,
+        upper_bounds: Optional[np.ndarray] = None,
+        avgdl: Optional[float] = None
+    ):
+        """
+        Args:
+            idf / upper_bounds: 预先计算好的 idf 与词项分数上界（从磁盘加载时传入，
+                跳过 O(P) 的重新计算）
+            avgdl: 外部给定的平均文档长度（分段索引按全局统计量打分时传入）
+        """
+        self.vocab = vocab
+        self.offsets = offsets
+        self.post_docs = post_docs
+        self.post_tfs = post_tfs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self._finalize(idf, upper_bounds, avgdl)
+
+    # ==================== 构建 ====================
+
+    @classmethod
+    def from_tokenized(
+        cls,
+        tokenized_docs: Iterable[Sequence[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25
+    ) -> "BM25Index":
+        """
+        从分词后的文档列表构建索引
+
+        Args:
+            tokenized_docs: 每个文档的词项列表（可以是生成器，便于边读取边构建）
+            k1: BM25参数k1
+            b: BM25参数b
+            epsilon: idf 下限系数
+
+        Returns:
+            BM25Index 实例
+        """
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        tfs: List[int] = []
+        doc_ids: List[int] = []
+        doc_lens: List[int] = []
+
+        for doc_id, tokens in enumerate(tokenized_docs):
+            doc_lens.append(len(tokens))
+            counts = Counter(tokens)
+            term_ids.extend([vocab.setdefault(term, len(vocab)) for term in counts])
+            tfs.extend(counts.values())
+            doc_ids.extend([doc_id] * len(counts))
+
+        return cls.from_arrays(
+            vocab,
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(tfs, dtype=np.int32),
+            np.asarray(doc_lens, dtype=np.int32),
+            k1=k1,
+            b=b,
+            epsilon=epsilon
+        )
+
+    @classmethod
+    def from_arrays(
+        cls,
+        vocab: Dict[str, int],
+        term_ids: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_lens: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25
+    ) -> "BM25Index":
+        """
+        从 (term_id, doc_id, tf) 三元组构建 CSR 倒排表
+
+        三元组需按 doc_id 升序给出（同一文档内顺序任意），这样稳定排序后
+        每个词项内的文档ID也是升序的。
+
+        Args:
+            vocab: 词项 → 词项ID
+            term_ids: 词项ID数组
+            doc_ids: 文档ID数组
+            tfs: 词频数组
+            doc_lens: 文档长度数组
+
+        Returns:
+            BM25Index 实例
+        """
+        order = np.argsort(term_ids, kind="stable")
+        counts = np.bincount(term_ids, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        return cls(
+            vocab=vocab,
+            offsets=offsets,
+            post_docs=np.ascontiguousarray(doc_ids[order], dtype=np.int32),
+            post_tfs=np.ascontiguousarray(tfs[order], dtype=np.int32),
+            doc_lens=np.asarray(doc_lens, dtype=np.int32),
+            k1=k1,
+            b=b,
+            epsilon=epsilon
+        )
+
+    def add_documents(self, tokenized_docs: Sequence[Sequence[str]]) -> "BM25Index":
+        """
+        追加文档，返回新索引（原索引不变）
+
+        新文档的ID从 doc_count 开始顺延。只对新文档分词计数，已有倒排表按词项整体平移
+        到合并后的位置，不需要重新分词或重新排序全量倒排项。
+
+        Args:
+            tokenized_docs: 新文档的词项列表
+
+        Returns:
+            合并后的 BM25Index
+        """
+        if not tokenized_docs:
+            return self
+
+        # 新文档的三元组（词表共享并原地扩展，旧索引检索时会忽略超出自身范围的词项ID）
+        term_ids: List[int] = []
+        tfs: List[int] = []
+        doc_ids: List[int] = []
+        new_lens = np.zeros(len(tokenized_docs), dtype=np.int32)
+        for i, tokens in enumerate(tokenized_docs):
+            new_lens[i] = len(tokens)
+            counts = Counter(tokens)
+            term_ids.extend([self.vocab.setdefault(term, len(self.vocab)) for term in counts])
+            tfs.extend(counts.values())
+            doc_ids.extend([i] * len(counts))
+        return self.add_arrays(
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(tfs, dtype=np.int32),
+            new_lens
+        )
+
+    def add_arrays(
+        self,
+        term_ids: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_lens: np.ndarray
+    ) -> "BM25Index":
+        """
+        以 (term_id, doc_id, tf) 三元组追加文档，返回新索引（原索引不变）
+
+        词项ID需已驻留在本索引共享的词表中（见 tools.bm25_tokenizer），doc_id 为新文档的
+        批内序号（从 0 开始、升序），合并后顺延 doc_count。
+
+        Args:
+            term_ids: 词项ID数组
+            doc_ids: 批内文档ID数组
+            tfs: 词频数组
+            doc_lens: 新文档长度数组
+
+        Returns:
+            合并后的 BM25Index
+        """
+        if len(doc_lens) == 0:
+            return self
+
+        new_lens = np.asarray(doc_lens, dtype=np.int32)
+        delta = BM25Index.from_arrays(
+            self.vocab,
+            term_ids,
+            doc_ids,
+            tfs,
+            new_lens,
+            k1=self.k1,
+            b=self.b,
+            epsilon=self.epsilon
+        )
+
+        vocab_size = len(delta.offsets) - 1
+        old_counts = np.zeros(vocab_size, dtype=np.int64)
+        old_counts[:len(self.offsets) - 1] = np.diff(self.offsets)
+        new_counts = np.diff(delta.offsets)
+        offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+        np.cumsum(old_counts + new_counts, out=offsets[1:])
+
+        total = int(offsets[-1])
+        post_docs = np.empty(total, dtype=np.int32)
+        post_tfs = np.empty(total, dtype=np.int32)
+
+        # 旧倒排项：每个词项整体平移到合并后起始位置
+        old_terms = np.repeat(np.arange(vocab_size), old_counts)
+        old_dest = offsets[old_terms] + (np.arange(len(self.post_docs)) - self.offsets[old_terms])
+        post_docs[old_dest] = self.post_docs
+        post_tfs[old_dest] = self.post_tfs
+
+        # 新倒排项：文档ID顺延 doc_count，接在同一词项的旧倒排项之后（保持升序）
+        new_terms = np.repeat(np.arange(vocab_size), new_counts)
+        new_dest = offsets[new_terms] + old_counts[new_terms] + (np.arange(len(delta.post_docs)) - delta.offsets[new_terms])
+        post_docs[new_dest] = delta.post_docs + self.doc_count
+        post_tfs[new_dest] = delta.post_tfs
+
+        return BM25Index(
+            vocab=self.vocab,
+            offsets=offsets,
+            post_docs=post_docs,
+            post_tfs=post_tfs,
+            doc_lens=np.concatenate([self.doc_lens, new_lens]),
+            k1=self.k1,
+            b=self.b,
+            epsilon=self.epsilon
+        )
+
+    @classmethod
+    def concat(cls, indexes: Sequence["BM25Index"], vocab: Optional[Dict[str, int]] = None) -> "BM25Index":
+        """
+        按顺序拼接多个共享词表的索引，返回新索引
+
+        第 i 个索引的文档ID顺延前面所有索引的文档数；参数（k1/b/epsilon）取第一个索引的。
+
+        Args:
+            indexes: 共享同一词表的索引列表（至少一个）
+            vocab: 新索引使用的词表（默认第一个索引的词表；可传入同一词表的副本）
+
+        Returns:
+            拼接后的 BM25Index
+        """
+        first = indexes[0]
+        if len(indexes) == 1 and vocab is None:
+            return first
+
+        term_parts, doc_parts, tf_parts = [], [], []
+        base = 0
+        for index in indexes:
+            vocab_size = len(index.offsets) - 1
+            term_parts.append(np.repeat(np.arange(vocab_size, dtype=np.int64), np.diff(index.offsets)))
+            doc_parts.append(index.post_docs.astype(np.int64) + base)
+            tf_parts.append(np.asarray(index.post_tfs))
+            base += index.doc_count
+
+        # 每个索引内按词项排列且词项内文档ID升序，稳定排序后各词项的文档ID仍然升序
+        return cls.from_arrays(
+            first.vocab if vocab is None else vocab,
+            np.concatenate(term_parts),
+            np.concatenate(doc_parts),
+            np.concatenate(tf_parts),
+            np.concatenate([index.doc_lens for index in indexes]),
+            k1=first.k1,
+            b=first.b,
+            epsilon=first.epsilon
+        )
+
+    def remove_documents(self, doc_ids: Sequence[int]) -> "BM25Index":
+        """
+        删除文档，返回新索引（原索引不变）
+
+        剩余文档按原顺序重新编号（即删除后第 i 个存活文档的ID为 i），
+        调用方需要对自己的文档列表做同样的过滤。
+
+        Args:
+            doc_ids: 要删除的文档ID
+
+        Returns:
+            删除后的 BM25Index
+        """
+        if len(doc_ids) == 0:
+            return self
+
+        live = np.ones(self.doc_count, dtype=bool)
+        live[np.asarray(doc_ids, dtype=np.int64)] = False
+        new_ids = np.cumsum(live, dtype=np.int64) - 1
+
+        keep = live[self.post_docs]
+        vocab_size = len(self.offsets) - 1
+        terms = np.repeat(np.arange(vocab_size), np.diff(self.offsets))[keep]
+        offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=vocab_size), out=offsets[1:])
+
+        return BM25Index(
+            vocab=self.vocab,
+            offsets=offsets,
+            post_docs=new_ids[self.post_docs[keep]].astype(np.int32),
+            post_tfs=self.post_tfs[keep],
+            doc_lens=self.doc_lens[live],
+            k1=self.k1,
+            b=self.b,
+            epsilon=self.epsilon
+        )
+
+    def _finalize(
+        self,
+        idf: Optional[np.ndarray] = None,
+        upper_bounds: Optional[np.ndarray] = None,
+        avgdl: Optional[float] = None
+    ) -> None:
+        """计算 idf、长度归一化向量和每个词项的分数上界"""
+        self.doc_count = int(len(self.doc_lens))
+        if avgdl is None:
+            total_len = float(self.doc_lens.sum()) if self.doc_count else 0.0
+            avgdl = total_len / self.doc_count if self.doc_count else 0.0
+        self.avgdl = avgdl
+
+        self.df = np.diff(self.offsets).astype(np.float64)
+        if idf is None:
+            idf = okapi_idf(self.df, self.doc_count, self.epsilon)
+        self.idf = idf
+        # average_idf 为负时下限本身也是负数，累加分数不再单调，此时关闭剪枝
+        self.prunable = not bool((idf < 0).any())
+
+        self.norm = self._length_norm(self.k1, self.b)
+        if upper_bounds is None:
+            upper_bounds = self._compute_upper_bounds(self.k1, self.norm)
+        self.upper_bounds = upper_bounds
+
+        # (k1, b) → (长度归一化向量, 词项分数上界)；idf 与 k1/b 无关，所有参数共用
+        self._scoring_cache: Dict[Tuple[float, float], Tuple[np.ndarray, np.ndarray]] = {
+            (float(self.k1), float(self.b)): (self.norm, self.upper_bounds)
+        }
+
+    def _length_norm(self, k1: float, b: float) -> np.ndarray:
+        """每个文档的长度归一化项 k1 * (1 - b + b * dl / avgdl)"""
+        if self.avgdl > 0:
+            return k1 * (1 - b + b * self.doc_lens / self.avgdl)
+        return np.full(self.doc_count, k1, dtype=np.float64)
+
+    def _compute_upper_bounds(self, k1: float, norm: np.ndarray) -> np.ndarray:
+        """每个词项在所有文档上的最大得分（MaxScore 剪枝所需的上界）"""
+        present = self.df > 0
+        upper_bounds = np.zeros(len(self.df), dtype=np.float64)
+        if len(self.post_docs) and present.any():
+            tfs = self.post_tfs.astype(np.float64)
+            contrib = tfs * (k1 + 1) / (tfs + norm[self.post_docs])
+            max_contrib = np.maximum.reduceat(contrib, self.offsets[:-1][present])
+            upper_bounds[present] = self.idf[present] * max_contrib
+        return upper_bounds
+
+    def scoring_vectors(self, k1: float, b: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        获取指定 (k1, b) 下的长度归一化向量和词项分数上界
+
+        首次使用某组参数时计算一次（O(N + P)）并缓存，之后按请求切换参数不需要重建索引。
+        缓存最多保留 MAX_SCORING_PARAMS 组，超出时淘汰最早加入的非默认参数。
+
+        Args:
+            k1: BM25参数k1
+            b: BM25参数b
+
+        Returns:
+            (norm, upper_bounds)
+        """
+        key = (float(k1), float(b))
+        vectors = self._scoring_cache.get(key)
+        if vectors is None:
+            norm = self._length_norm(key[0], key[1])
+            vectors = (norm, self._compute_upper_bounds(key[0], norm))
+            default_key = (float(self.k1), float(self.b))
+            if len(self._scoring_cache) >= self.MAX_SCORING_PARAMS:
+                for old_key in list(self._scoring_cache):
+                    if old_key != default_key:
+                        self._scoring_cache.pop(old_key, None)
+                        break
+            self._scoring_cache[key] = vectors
+        return vectors
+
+    @property
+    def nbytes(self) -> int:
+        """索引数组占用的字节数（不含词表，含各组 k1/b 的缓存向量）"""
+        return int(
+            self.offsets.nbytes + self.post_docs.nbytes + self.post_tfs.nbytes
+            + self.doc_lens.nbytes + self.idf.nbytes + self.df.nbytes
+            + sum(norm.nbytes + ub.nbytes for norm, ub in list(self._scoring_cache.values()))
+        )
+
+    # ==================== 检索 ====================
+
+    def _term_scores(
+        self,
+        term_id: int,
+        weight: float,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        k1: float,
+        norm: np.ndarray
+    ) -> np.ndarray:
+        """计算一个词项对给定倒排项的得分贡献"""
+        tfs = tfs.astype(np.float64)
+        return weight * self.idf[term_id] * (tfs * (k1 + 1) / (tfs + norm[docs]))
+
+    def search(
+        self,
+        query_tokens: Sequence[str],
+        top_k: int,
+        k1: Optional[float] = None,
+        b: Optional[float] = None,
+        doc_filter: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        检索 top-k 文档（MaxScore 动态剪枝）
+
+        词项按分数上界降序处理。当剩余词项的上界之和已低于当前第 k 名分数（theta）时，
+        未出现过的文档不可能进入 top-k，此后只对候选集合做点查并持续淘汰
+        acc + remaining < theta 的候选。结果与全量打分的 top-k 一致（同分时顺序可能不同）。
+
+        Args:
+            query_tokens: 查询词项（重复词项按出现次数累加，与 BM25Okapi 一致）
+            top_k: 返回数量
+            k1: BM25参数k1（None 表示使用构建索引时的参数）
+            b: BM25参数b（None 表示使用构建索引时的参数）
+            doc_filter: 只在这些文档中检索（升序、无重复的文档ID，见 tools.bm25_filters）
+
+        Returns:
+            [(doc_id, score), ...]，按分数降序，只包含至少命中一个查询词项的文档
+        """
+        if not top_k or top_k <= 0 or self.doc_count == 0:
+            return []
+        k1 = self.k1 if k1 is None else k1
+        b = self.b if b is None else b
+        norm, upper_bounds = self.scoring_vectors(k1, b)
+
+        terms = []
+        for token, qtf in Counter(query_tokens).items():
+            term_id = self.vocab.get(token)
+            # 词表在增量更新时共享扩展，超出本索引范围的词项ID视为未出现
+            if term_id is not None and term_id < len(self.df) and self.df[term_id] > 0:
+                terms.append((term_id, float(qtf), float(qtf) * upper_bounds[term_id]))
+        if not terms:
+            return []
+        terms.sort(key=lambda t: t[2], reverse=True)
+        if doc_filter is not None:
+            return self._search_filtered(terms, top_k, np.asarray(doc_filter), k1, norm)
+
+        acc = np.zeros(self.doc_count, dtype=np.float64)
+        seen = np.zeros(self.doc_count, dtype=bool)
+        touched_parts: List[np.ndarray] = []
+        n_touched = 0
+        max_score = 0.0
+        # remaining_bounds[i]：第 i 个词项之后所有词项的上界之和（后缀和，避免累减的浮点误差）
+        remaining_bounds = np.zeros(len(terms) + 1, dtype=np.float64)
+        remaining_bounds[:-1] = np.cumsum([t[2] for t in terms][::-1])[::-1]
+        candidates = None
+
+        for i, (term_id, weight, _) in enumerate(terms):
+            remaining = remaining_bounds[i + 1]
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.post_docs[start:end]
+            tfs = self.post_tfs[start:end]
+
+            if candidates is None:
+                # OR 阶段：完整遍历倒排表
+                acc[docs] += self._term_scores(term_id, weight, docs, tfs, k1, norm)
+                new_docs = docs[~seen[docs]]
+                seen[new_docs] = True
+                touched_parts.append(new_docs)
+                n_touched += len(new_docs)
+                max_score = max(max_score, float(acc[docs].max()))
+
+                # theta 不会超过当前最高分，剩余上界仍高于它时不必计算 theta
+                if not self.prunable or n_touched < top_k or remaining >= max_score:
+                    continue
+                touched = np.concatenate(touched_parts)
+                touched_parts = [touched]
+                theta = np.partition(acc[touched], n_touched - top_k)[n_touched - top_k]
+                if remaining < theta:
+                    keep = acc[touched] + remaining >= theta
+                    candidates = np.sort(touched[keep])
+            else:
+                # 剪枝阶段：只对候选文档点查倒排表
+                pos = np.searchsorted(docs, candidates)
+                valid = pos < len(docs)
+                hit = np.zeros(len(candidates), dtype=bool)
+                hit[valid] = docs[pos[valid]] == candidates[valid]
+                if hit.any():
+                    hit_docs = candidates[hit]
+                    acc[hit_docs] += self._term_scores(term_id, weight, hit_docs, tfs[pos[hit]], k1, norm)
+                cand_scores = acc[candidates]
+                kth = len(candidates) - top_k
+                theta = np.partition(cand_scores, kth)[kth] if kth > 0 else cand_scores.min()
+                candidates = candidates[cand_scores + remaining >= theta]
+
+        pool = candidates if candidates is not None else np.concatenate(touched_parts)
+        scores = acc[pool]
+        if len(pool) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            pool, scores = pool[top], scores[top]
+        order = np.lexsort((pool, -scores))
+        return [(int(pool[i]), float(scores[i])) for i in order]
+
+    def _search_filtered(
+        self,
+        terms: List[Tuple[int, float, float]],
+        top_k: int,
+        doc_filter: np.ndarray,
+        k1: float,
+        norm: np.ndarray
+    ) -> List[Tuple[int, float]]:
+        """
+        只对过滤集合内的文档打分
+
+        每个词项用较短的一方在较长的一方中二分查找（过滤集合与倒排表都是升序），
+        代价为 min(|过滤集合|, 倒排表长度) * log(max(...))，不会扫描过滤集合之外的倒排项。
+        """
+        if not len(doc_filter):
+            return []
+        acc = np.zeros(len(doc_filter), dtype=np.float64)
+        matched = np.zeros(len(doc_filter), dtype=bool)
+        for term_id, weight, _ in terms:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.post_docs[start:end]
+            tfs = self.post_tfs[start:end]
+            if len(doc_filter) <= len(docs):
+                pos = np.searchsorted(docs, doc_filter)
+                valid = pos < len(docs)
+                hit = np.zeros(len(doc_filter), dtype=bool)
+                hit[valid] = docs[pos[valid]] == doc_filter[valid]
+                slots = np.flatnonzero(hit)
+                hit_docs, hit_tfs = doc_filter[slots], tfs[pos[slots]]
+            else:
+                pos = np.searchsorted(doc_filter, docs)
+                valid = pos < len(doc_filter)
+                hit = np.zeros(len(docs), dtype=bool)
+                hit[valid] = doc_filter[pos[valid]] == docs[valid]
+                slots = pos[hit]
+                hit_docs, hit_tfs = docs[hit], tfs[hit]
+            if len(slots):
+                acc[slots] += self._term_scores(term_id, weight, hit_docs, hit_tfs, k1, norm)
+                matched[slots] = True
+
+        slots = np.flatnonzero(matched)
+        pool, scores = doc_filter[slots].astype(np.int64), acc[slots]
+        if len(pool) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            pool, scores = pool[top], scores[top]
+        order = np.lexsort((pool, -scores))
+        return [(int(pool[i]), float(scores[i])) for i in order]
@@ -0,0 +1,449 @@
+"""
+BM25 位置索引
+为部分词项记录出现位置，对 BM25 候选结果做短语匹配与词项邻近度加权
+
+只记录分词器认为有意义的位置词项（n-gram 模式下只记录最长的 n-gram，更长的短语由相邻
+n-gram 串联验证），并按文档频率从低到高选入，直到达到字节预算——高频词项（单字、常见词）
+最先被舍弃，因此位置索引的大小有上限，不会让索引内存翻倍。
+"""
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tools.bm25_index import BM25Index
+from tools.bm25_tokenizer import BaseTokenizer
+
+_SEGMENT = re.compile(r"\w+")
+
+
+class PositionalIndex:
+    """
+    位置倒排表
+
+    存储结构：
+        term_slots:   int32[V]，词项ID → 槽位（-1 表示未记录位置）
+        slot_offsets: int64[S+1]，槽位 s 的条目位于 [slot_offsets[s], slot_offsets[s+1])
+        pos_docs:     int32[E]，条目的文档ID（槽位内升序）
+        pos_starts:   int64[E+1]，条目 e 的位置位于 positions[pos_starts[e]:pos_starts[e+1]]
+        positions:    int32[Q]，出现位置（条目内升序）
+    """
+
+    def __init__(
+        self,
+        term_slots: np.ndarray,
+        slot_offsets: np.ndarray,
+        pos_docs: np.ndarray,
+        pos_starts: np.ndarray,
+        positions: np.ndarray
+    ):
+        self.term_slots = term_slots
+        self.slot_offsets = slot_offsets
+        self.pos_docs = pos_docs
+        self.pos_starts = pos_starts
+        self.positions = positions
+
+    # ==================== 构建 ====================
+
+    @classmethod
+    def build(
+        cls,
+        index: BM25Index,
+        texts: Sequence[str],
+        tokenizer: BaseTokenizer,
+        max_bytes: int,
+        batch_size: int = 2000
+    ) -> "PositionalIndex":
+        """
+        为索引构建位置倒排表
+
+        Args:
+            index: BM25 索引（用于词表、文档频率和词频统计）
+            texts: 与索引文档一一对应的文本
+            tokenizer: 构建索引时使用的分词器
+            max_bytes: 位置倒排表的字节预算
+            batch_size: 每批分词的文本数
+
+        Returns:
+            PositionalIndex 实例
+        """
+        vocab_size = len(index.df)
+        occurrences = np.bincount(
+            np.repeat(np.arange(vocab_size), np.diff(index.offsets)),
+            weights=index.post_tfs,
+            minlength=vocab_size
+        )
+        # 先扫一遍位置词项确定候选（不遍历词表：分段索引的词表由所有段共享，远大于本段）
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        positional_terms = np.zeros(vocab_size, dtype=bool)
+        for batch in batches:
+            _, term_ids, _ = tokenizer.token_positions(list(batch), index.vocab)
+            positional_terms[term_ids[term_ids < vocab_size]] = True
+        eligible = np.flatnonzero(positional_terms & (index.df > 0))
+
+        term_slots = cls._select_terms(eligible, index.df, occurrences, max_bytes, vocab_size)
+        parts = [cls._collect(term_slots, tokenizer, index.vocab, batch, i * batch_size)
+                 for i, batch in enumerate(batches)]
+        return cls._from_triples(term_slots, *cls._concat(parts))
+
+    @staticmethod
+    def _select_terms(
+        eligible: np.ndarray,
+        df: np.ndarray,
+        occurrences: np.ndarray,
+        max_bytes: int,
+        vocab_size: int
+    ) -> np.ndarray:
+        """按文档频率从低到高为候选词项分配槽位，累计大小超出预算后停止"""
+        term_slots = np.full(vocab_size, -1, dtype=np.int32)
+        if len(eligible):
+            # 文档频率低的词项区分度高、位置少，优先选入
+            eligible = eligible[np.lexsort((eligible, df[eligible]))]
+            cost = occurrences[eligible] * 4 + df[eligible] * 12 + 8
+            selected = eligible[np.cumsum(cost) <= max_bytes]
+            term_slots[selected] = np.arange(len(selected), dtype=np.int32)
+        return term_slots
+
+    @classmethod
+    def concat(
+        cls,
+        parts: Sequence[Tuple["PositionalIndex", BM25Index, np.ndarray]],
+        merged: BM25Index,
+        max_bytes: int
+    ) -> "PositionalIndex":
+        """
+        合并多个段的位置索引（不重新分词）
+
+        只有在每个包含该词项的段中都记录了位置的词项才能保留（否则合并后的位置不完整），
+        再按合并后的文档频率重新做预算选择。
+
+        Args:
+            parts: [(位置索引, 该段的 BM25 索引, 段内文档ID → 合并后文档ID（-1 表示丢弃）), ...]
+            merged: 合并后的 BM25 索引
+            max_bytes: 位置倒排表的字节预算
+
+        Returns:
+            合并后的 PositionalIndex
+        """
+        vocab_size = len(merged.df)
+        covered = np.ones(vocab_size, dtype=bool)
+        recorded = np.zeros(vocab_size, dtype=bool)
+        for positional, index, _ in parts:
+            size = min(len(index.df), len(positional.term_slots), vocab_size)
+            has_positions = np.zeros(vocab_size, dtype=bool)
+            has_positions[:size] = positional.term_slots[:size] >= 0
+            present = np.zeros(vocab_size, dtype=bool)
+            present[:min(len(index.df), vocab_size)] = index.df[:vocab_size] > 0
+            covered &= ~present | has_positions
+            recorded |= has_positions
+
+        occurrences = np.bincount(
+            np.repeat(np.arange(vocab_size), np.diff(merged.offsets)),
+            weights=merged.post_tfs,
+            minlength=vocab_size
+        )
+        eligible = np.flatnonzero(covered & recorded & (merged.df > 0))
+        term_slots = cls._select_terms(eligible, merged.df, occurrences, max_bytes, vocab_size)
+
+        slot_parts, doc_parts, pos_parts = [], [], []
+        for positional, _, doc_map in parts:
+            slots, docs, positions = positional._triples()
+            slot_terms = np.full(len(positional.slot_offsets) - 1, -1, dtype=np.int64)
+            assigned = np.flatnonzero(positional.term_slots >= 0)
+            slot_terms[positional.term_slots[assigned]] = assigned
+            terms = slot_terms[slots]
+            new_slots = np.where(terms < vocab_size, term_slots[np.minimum(terms, vocab_size - 1)], -1)
+            new_docs = np.asarray(doc_map, dtype=np.int64)[docs]
+            keep = (new_slots >= 0) & (new_docs >= 0)
+            slot_parts.append(new_slots[keep].astype(np.int64))
+            doc_parts.append(new_docs[keep])
+            pos_parts.append(positions[keep])
+        return cls._from_triples(term_slots, *cls._concat(list(zip(slot_parts, doc_parts, pos_parts))))
+
+    @staticmethod
+    def _collect(
+        term_slots: np.ndarray,
+        tokenizer: BaseTokenizer,
+        vocab: Dict[str, int],
+        texts: Sequence[str],
+        doc_offset: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """对一批文本产出 (槽位, 文档ID, 位置) 三元组，只保留已分配槽位的词项"""
+        docs, term_ids, positions = tokenizer.token_positions(list(texts), vocab)
+        in_range = term_ids < len(term_slots)
+        slots = np.full(len(term_ids), -1, dtype=np.int64)
+        slots[in_range] = term_slots[term_ids[in_range]]
+        keep = slots >= 0
+        return slots[keep], docs[keep].astype(np.int64) + doc_offset, positions[keep]
+
+    @staticmethod
+    def _concat(parts) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    @classmethod
+    def _from_triples(
+        cls,
+        term_slots: np.ndarray,
+        slots: np.ndarray,
+        docs: np.ndarray,
+        positions: np.ndarray
+    ) -> "PositionalIndex":
+        n_slots = int(term_slots.max()) + 1 if len(term_slots) else 0
+        order = np.lexsort((positions, docs, slots))
+        slots, docs, positions = slots[order], docs[order], positions[order]
+
+        if len(slots):
+            changed = (np.diff(slots) != 0) | (np.diff(docs) != 0)
+            entry_starts = np.concatenate([[0], np.flatnonzero(changed) + 1])
+        else:
+            entry_starts = np.zeros(0, dtype=np.int64)
+        slot_offsets = np.zeros(max(n_slots, 0) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(slots[entry_starts], minlength=n_slots), out=slot_offsets[1:])
+
+        return cls(
+            term_slots=term_slots,
+            slot_offsets=slot_offsets,
+            pos_docs=docs[entry_starts].astype(np.int32),
+            pos_starts=np.append(entry_starts, len(positions)).astype(np.int64),
+            positions=np.ascontiguousarray(positions, dtype=np.int32)
+        )
+
+    def _triples(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """展开为 (槽位, 文档ID, 位置) 三元组"""
+        lengths = np.diff(self.pos_starts)
+        entry_slots = np.repeat(np.arange(len(self.slot_offsets) - 1), np.diff(self.slot_offsets))
+        return (
+            np.repeat(entry_slots, lengths),
+            np.repeat(self.pos_docs.astype(np.int64), lengths),
+            np.asarray(self.positions)
+        )
+
+    def add_documents(
+        self,
+        texts: Sequence[str],
+        tokenizer: BaseTokenizer,
+        vocab: Dict[str, int],
+        doc_offset: int
+    ) -> "PositionalIndex":
+        """
+        追加文档的位置，返回新位置索引（原索引不变）
+
+        词项选择保持不变：只记录已分配槽位的词项，新出现的词项在下次全量构建时参与选择。
+
+        Args:
+            texts: 新文档文本
+            tokenizer: 分词器
+            vocab: 索引词表
+            doc_offset: 新文档的起始文档ID
+
+        Returns:
+            新的 PositionalIndex
+        """
+        if not len(texts):
+            return self
+        new = self._collect(self.term_slots, tokenizer, vocab, texts, doc_offset)
+        return self._from_triples(self.term_slots, *self._concat([self._triples(), new]))
+
+    def remove_documents(self, doc_ids: Sequence[int], doc_count: int) -> "PositionalIndex":
+        """
+        删除文档的位置并按 BM25Index.remove_documents 的规则重新编号
+
+        Args:
+            doc_ids: 要删除的文档ID
+            doc_count: 删除前的文档总数
+
+        Returns:
+            新的 PositionalIndex
+        """
+        if len(doc_ids) == 0:
+            return self
+        live = np.ones(doc_count, dtype=bool)
+        live[np.asarray(doc_ids, dtype=np.int64)] = False
+        new_ids = np.cumsum(live, dtype=np.int64) - 1
+
+        slots, docs, positions = self._triples()
+        keep = live[docs]
+        return self._from_triples(self.term_slots, slots[keep], new_ids[docs[keep]], positions[keep])
+
+    @property
+    def nbytes(self) -> int:
+        return int(
+            self.term_slots.nbytes + self.slot_offsets.nbytes + self.pos_docs.nbytes
+            + self.pos_starts.nbytes + self.positions.nbytes
+        )
+
+    # ==================== 打分 ====================
+
+    def _occurrences(self, term_id: int, candidates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """返回词项在候选文档中的出现：(候选下标, 位置)"""
+        slot = self.term_slots[term_id]
+        start, end = self.slot_offsets[slot], self.slot_offsets[slot + 1]
+        docs = self.pos_docs[start:end]
+        idx = np.searchsorted(docs, candidates)
+        hit = np.zeros(len(candidates), dtype=bool)
+        valid = idx < len(docs)
+        hit[valid] = docs[idx[valid]] == candidates[valid]
+
+        entries = start + idx[hit]
+        begins = self.pos_starts[entries]
+        lengths = self.pos_starts[entries + 1] - begins
+        total = int(lengths.sum())
+        gather = np.repeat(begins - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths) + np.arange(total)
+        return np.repeat(np.flatnonzero(hit), lengths), self.positions[gather].astype(np.int64)
+
+    def _match_segment(
+        self,
+        unit_ids: List[Optional[int]],
+        candidates: np.ndarray
+    ) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        在候选文档中匹配一个查询片段
+
+        第 i 个单元出现在位置 p 时，片段起点（锚点）为 p - i；同一锚点上连续的单元构成一段短语匹配。
+
+        Returns:
+            (每个候选的最长连续单元数, 出现的候选下标, 对应锚点)；片段含未记录位置的词项时返回 None
+        """
+        cand_parts, anchor_parts, unit_parts = [], [], []
+        for i, term_id in enumerate(unit_ids):
+            if term_id is None:
+                continue        # 词表中没有该单元：任何文档都不包含，串联自然中断
+            if term_id >= len(self.term_slots) or self.term_slots[term_id] < 0:
+                return None     # 有该词项但未记录位置（被预算舍弃），无法判断
+            cand_idx, positions = self._occurrences(term_id, candidates)
+            cand_parts.append(cand_idx)
+            anchor_parts.append(positions - i)
+            unit_parts.append(np.full(len(cand_idx), i, dtype=np.int64))
+
+        longest = np.zeros(len(candidates), dtype=np.int64)
+        if not cand_parts:
+            return longest, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        cands = np.concatenate(cand_parts)
+        anchors = np.concatenate(anchor_parts)
+        units = np.concatenate(unit_parts)
+        if not len(cands):
+            return longest, cands, anchors
+
+        order = np.lexsort((units, anchors, cands))
+        cands, anchors, units = cands[order], anchors[order], units[order]
+        # 同一候选、同一锚点且单元序号连续时属于同一段匹配
+        breaks = np.ones(len(cands), dtype=bool)
+        breaks[1:] = (np.diff(cands) != 0) | (np.diff(anchors) != 0) | (np.diff(units) != 1)
+        run_ids = np.cumsum(breaks) - 1
+        run_lengths = np.bincount(run_ids)
+        np.maximum.at(longest, cands[breaks], run_lengths)
+        return longest, cands, anchors
+
+    @staticmethod
+    def _min_distance(
+        n_candidates: int,
+        first: Tuple[np.ndarray, np.ndarray],
+        second: Tuple[np.ndarray, np.ndarray]
+    ) -> np.ndarray:
+        """两个片段在每个候选文档中锚点的最小距离（未同时出现时为 inf）"""
+        cands = np.concatenate([first[0], second[0]])
+        anchors = np.concatenate([first[1], second[1]])
+        flags = np.concatenate([np.zeros(len(first[0]), dtype=np.int8), np.ones(len(second[0]), dtype=np.int8)])
+        distance = np.full(n_candidates, np.inf)
+        if len(cands) < 2:
+            return distance
+        order = np.lexsort((anchors, cands))
+        cands, anchors, flags = cands[order], anchors[order], flags[order]
+        adjacent = (cands[1:] == cands[:-1]) & (flags[1:] != flags[:-1])
+        np.minimum.at(distance, cands[1:][adjacent], (anchors[1:] - anchors[:-1])[adjacent].astype(np.float64))
+        return distance
+
+    def rerank(
+        self,
+        hits: List[Tuple[int, float]],
+        query: str,
+        tokenizer: BaseTokenizer,
+        vocab: Dict[str, int],
+        phrase_boost: float = 0.5,
+        proximity_boost: float = 0.3,
+        proximity_window: int = 16,
+        latency_budget_ms: Optional[float] = None
+    ) -> Tuple[List[Tuple[int, float]], Dict[str, Any]]:
+        """
+        对 BM25 候选做短语 / 邻近度加权
+
+        查询按非词字符切成片段：
+            短语分：片段在文档中最长连续匹配覆盖的比例（至少连续两个单元才计分）
+            邻近分：相邻片段在文档中最近出现的距离，max(0, 1 - 距离 / proximity_window)
+        最终分数 = BM25 分数 × (1 + phrase_boost × 平均短语分 + proximity_boost × 平均邻近分)。
+        超出延迟预算时放弃加权，原样返回 BM25 排序。
+
+        Args:
+            hits: BM25 候选 [(doc_id, score), ...]
+            query: 查询文本
+            tokenizer: 构建索引时使用的分词器
+            vocab: 索引词表
+            phrase_boost: 短语匹配加权系数
+            proximity_boost: 邻近度加权系数
+            proximity_window: 邻近度窗口（分词器的位置单位）
+            latency_budget_ms: 延迟预算（毫秒），None 表示不限制
+
+        Returns:
+            (重排后的 [(doc_id, score), ...], 统计信息)
+        """
+        start = time.perf_counter()
+        info: Dict[str, Any] = {"applied": False, "phrases": 0, "boosted": 0, "budget_exhausted": False}
+        if not hits:
+            return hits, info
+
+        candidates = np.array([doc_id for doc_id, _ in hits], dtype=np.int64)
+        scores = np.array([score for _, score in hits], dtype=np.float64)
+        sort_order = np.argsort(candidates)
+        sorted_cands = candidates[sort_order]
+
+        phrase_scores: List[np.ndarray] = []
+        segment_anchors: List[Optional[Tuple[np.ndarray, np.ndarray]]] = []
+        for segment in _SEGMENT.findall(query):
+            units = tokenizer.phrase_units(segment)
+            if not units:
+                segment_anchors.append(None)
+                continue
+            matched = self._match_segment([vocab.get(u) for u in units], sorted_cands)
+            if matched is None:
+                segment_anchors.append(None)
+                continue
+            longest, cand_idx, anchors = matched
+            segment_anchors.append((cand_idx, anchors))
+            if len(units) >= 2:
+                span = np.array([tokenizer.phrase_span(int(m)) for m in longest], dtype=np.float64)
+                phrase_scores.append(np.where(longest >= 2, span / tokenizer.phrase_span(len(units)), 0.0))
+
+            if latency_budget_ms is not None and (time.perf_counter() - start) * 1000 > latency_budget_ms:
+                info["budget_exhausted"] = True
+                return hits, info
+
+        proximity_scores: List[np.ndarray] = []
+        present = [a for a in segment_anchors if a is not None]
+        for first, second in zip(present, present[1:]):
+            distance = self._min_distance(len(sorted_cands), first, second)
+            proximity_scores.append(np.clip(1 - distance / max(proximity_window, 1), 0.0, 1.0))
+
+        if not phrase_scores and not proximity_scores:
+            return hits, info
+
+        boost = np.ones(len(sorted_cands), dtype=np.float64)
+        if phrase_scores:
+            boost += phrase_boost * np.mean(phrase_scores, axis=0)
+        if proximity_scores:
+            boost += proximity_boost * np.mean(proximity_scores, axis=0)
+
+        # 加权结果按候选文档ID排列，映射回原始顺序
+        multiplier = np.empty(len(candidates), dtype=np.float64)
+        multiplier[sort_order] = boost
+        boosted = scores * multiplier
+        order = np.lexsort((candidates, -boosted))
+
+        info.update({
+            "applied": True,
+            "phrases": len(phrase_scores),
+            "boosted": int((multiplier > 1).sum())
+        })
+        return [(int(candidates[i]), float(boosted[i])) for i in order], info
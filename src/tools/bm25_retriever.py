@@ -2,40 +2,163 @@
 BM25 全文检索工具
 基于关键词的全文检索，与向量检索互补
 """
+import os
+import sys
 import json
-import pickle
+import time
 import hashlib
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Iterator
 from pathlib import Path
+
+import numpy as np
 from langchain.tools import tool
 from langchain_core.documents import Document
 
-# 动态导入rank_bm25，避免静态类型检查错误
-try:
-    from rank_bm25 import BM25Okapi
-    _BM25_AVAILABLE = True
-except ImportError:
-    _BM25_AVAILABLE = False
-    BM25Okapi = None
-
-# 导入向量存储
-from tools.vector_store import get_vector_store
+# 倒排索引引擎（替代 rank_bm25.BM25Okapi 的全量扫描打分）
+from tools.bm25_index import BM25Index
+# 索引磁盘格式（mmap 打开，多 worker 共享页缓存）
+from tools.bm25_store import INDEX_FILE_SUFFIX, write_index_file
+# 分词器（批量 n-gram / 词典分词，词项直接驻留到索引词表）
+from tools.bm25_tokenizer import BaseTokenizer, EncodedBatch, get_tokenizer
+# 位置索引（短语 / 邻近度加权）
+from tools.bm25_positional import PositionalIndex
+# 分段索引（不可变段 + 快照读取 + 后台合并）
+from tools.bm25_segments import LOG_FILE_SUFFIX, SegmentedIndex, SegmentSnapshot
+# 元数据过滤索引（按 source / parent_id / is_parent 等字段限定检索范围）
+from tools.bm25_filters import DEFAULT_FILTER_FIELDS, MetadataIndex
+from utils.cache import LRUCache
 
 
 # BM25索引缓存目录
 BM25_CACHE_DIR = "/tmp/bm25_cache"
 
+# 进程内已加载的集合索引（集合名称 → 分段索引）；检索读取其当前快照，不需要加锁
+_collection_indexes: Dict[str, SegmentedIndex] = {}
+# 只在加载 / 全量构建集合索引时持有，增量写入由各分段索引自己的写锁串行化
+_index_lock = threading.RLock()
+
+# 按请求文档内容哈希缓存的临时索引（调用方传入 documents 时使用），首次使用时按配置创建
+_adhoc_indexes: Optional[LRUCache] = None
+_adhoc_lock = threading.Lock()
+
 
 def _get_cache_path(collection_name: str) -> str:
     """获取BM25索引的缓存文件路径"""
     Path(BM25_CACHE_DIR).mkdir(parents=True, exist_ok=True)
-    return f"{BM25_CACHE_DIR}/{collection_name}.pkl"
+    return f"{BM25_CACHE_DIR}/{collection_name}{INDEX_FILE_SUFFIX}"
 
 
 def _compute_docs_hash(documents: List[str]) -> str:
-    """计算文档内容的哈希值"""
-    content = "\n".join(documents)
-    return hashlib.md5(content.encode()).hexdigest()
+    """计算文档内容的哈希值（逐个文档带长度前缀，避免拼接歧义）"""
+    digest = hashlib.md5()
+    for text in documents:
+        data = text.encode("utf-8", errors="surrogatepass")
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _index_nbytes(entry: Dict[str, Any]) -> int:
+    """估算临时索引占用的内存（倒排数组 + 词表 + 位置索引）"""
+    bm25 = entry["bm25"]
+    vocab = bm25.vocab
+    positional = entry.get("positional")
+    return (
+        bm25.nbytes + sys.getsizeof(vocab) + sum(sys.getsizeof(term) for term in vocab)
+        + (positional.nbytes if positional is not None else 0)
+    )
+
+
+def _positional_config() -> Dict[str, Any]:
+    """位置索引配置（bm25.positional.*）"""
+    from utils.config_loader import get_config
+    config = get_config()
+    return {
+        "enabled": str(config.get("bm25.positional.enabled", False)).lower() in ("true", "1"),
+        "max_mb": float(config.get("bm25.positional.max_mb", 64)),
+        "max_ratio": float(config.get("bm25.positional.max_ratio", 0.5)),
+        "phrase_boost": float(config.get("bm25.positional.phrase_boost", 0.5)),
+        "proximity_boost": float(config.get("bm25.positional.proximity_boost", 0.3)),
+        "proximity_window": int(config.get("bm25.positional.proximity_window", 16)),
+        "candidate_factor": int(config.get("bm25.positional.candidate_factor", 3)),
+        "latency_budget_ms": float(config.get("bm25.positional.latency_budget_ms", 10))
+    }
+
+
+def _positional_budget(bm25: BM25Index) -> Optional[int]:
+    """位置索引字节预算：max_mb 与 max_ratio × 倒排索引大小中较小者，未启用时返回 None"""
+    config = _positional_config()
+    if not config["enabled"]:
+        return None
+    return int(min(config["max_mb"] * 1024 * 1024, config["max_ratio"] * bm25.nbytes))
+
+
+def _build_positional(bm25: BM25Index, texts: List[str], tokenizer: BaseTokenizer) -> Optional[PositionalIndex]:
+    """按配置构建位置索引，未启用时返回 None"""
+    budget = _positional_budget(bm25)
+    if budget is None:
+        return None
+    return PositionalIndex.build(bm25, texts, tokenizer, budget)
+
+
+def _segment_config() -> Dict[str, Any]:
+    """分段索引的合并策略配置（bm25.segments.*）"""
+    from utils.config_loader import get_config
+    config = get_config()
+    return {
+        "positional_budget": _positional_budget,
+        "max_segments": int(config.get("bm25.segments.max_segments", 8)),
+        "major_merge_ratio": float(config.get("bm25.segments.major_merge_ratio", 0.1)),
+        "max_deleted_ratio": float(config.get("bm25.segments.max_deleted_ratio", 0.2)),
+        "background_merge": str(config.get("bm25.segments.background_merge", True)).lower() in ("true", "1"),
+        "filter_fields": list(config.get("bm25.filter_fields", DEFAULT_FILTER_FIELDS))
+    }
+
+
+def _parse_filters(filters: Any) -> Optional[Dict[str, Any]]:
+    """
+    解析元数据过滤条件（JSON 字符串或字典），空条件返回 None
+
+    Raises:
+        ValueError: 过滤条件不是 JSON 对象
+    """
+    if not filters:
+        return None
+    if isinstance(filters, str):
+        try:
+            filters = json.loads(filters)
+        except json.JSONDecodeError:
+            raise ValueError(f"元数据过滤条件不是合法的JSON: {filters}")
+    if not isinstance(filters, dict):
+        raise ValueError("元数据过滤条件必须是JSON对象（字段 → 取值或取值列表）")
+    return filters or None
+
+
+def _get_adhoc_cache() -> LRUCache:
+    """获取临时索引 LRU（容量由 bm25.adhoc_cache_entries / bm25.adhoc_cache_mb 配置）"""
+    global _adhoc_indexes
+    if _adhoc_indexes is None:
+        with _adhoc_lock:
+            if _adhoc_indexes is None:
+                from utils.config_loader import get_config
+                config = get_config()
+                _adhoc_indexes = LRUCache(
+                    max_entries=int(config.get("bm25.adhoc_cache_entries", 32)),
+                    max_bytes=int(float(config.get("bm25.adhoc_cache_mb", 256)) * 1024 * 1024),
+                    sizeof=_index_nbytes
+                )
+    return _adhoc_indexes
+
+
+def get_bm25_cache_stats() -> Dict[str, Any]:
+    """临时索引缓存的统计信息（条目数、字节数、命中/未命中/淘汰次数）"""
+    return _get_adhoc_cache().get_stats()
+
+
+def get_bm25_segment_stats() -> Dict[str, Any]:
+    """各集合分段索引的统计信息（段数、文档数、删除数、合并次数）"""
+    return {name: index.get_stats() for name, index in list(_collection_indexes.items())}
 
 
 def _tokenize(text: str, language: str = "zh") -> List[str]:
@@ -52,26 +175,9 @@ def _tokenize(text: str, language: str = "zh") -> List[str]:
     if not text:
         return []
 
-    # 中文分词（简单实现：按字符分词+保留完整词）
+    # 中文分词：由配置的分词器处理（默认 1~4 字 n-gram）
     if language == "zh":
-        # 先尝试保留中文词组（长度2-4）
-        tokens = []
-        i = 0
-        while i < len(text):
-            # 尝试匹配4字词
-            if i + 3 < len(text):
-                tokens.append(text[i:i+4])
-            # 尝试匹配3字词
-            if i + 2 < len(text):
-                tokens.append(text[i:i+3])
-            # 尝试匹配2字词
-            if i + 1 < len(text):
-                tokens.append(text[i:i+2])
-            # 单字
-            if text[i].strip():
-                tokens.append(text[i])
-            i += 1
-        return tokens
+        return get_tokenizer().tokenize(text)
     else:
         # 英文分词：按空格和标点分割
         import re
@@ -79,9 +185,114 @@ def _tokenize(text: str, language: str = "zh") -> List[str]:
         return tokens
 
 
+def _stream_collection_rows(collection_name: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """
+    以服务端游标分批读取集合中的全部文档块
+
+    Args:
+        collection_name: 集合名称
+        batch_size: 每批行数
+
+    Yields:
+        每批文档列表，每个文档包含 id（pgvector 行ID）、text、metadata
+    """
+    from sqlalchemy import text
+    from storage.database.db import get_engine
+
+    sql = text(
+        "SELECT e.id, e.document, e.cmetadata "
+        "FROM langchain_pg_embedding e "
+        "JOIN langchain_pg_collection c ON e.collection_id = c.uuid "
+        "WHERE c.name = :name"
+    )
+    with get_engine().connect() as conn:
+        # stream_results 让 psycopg 使用服务端游标，避免一次性把整个集合拉进内存
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            sql, {"name": collection_name}
+        )
+        for rows in result.partitions():
+            yield [
+                {"id": str(row.id), "text": row.document or "", "metadata": row.cmetadata or {}}
+                for row in rows
+            ]
+
+
+def _encode_documents(
+    documents: List[Dict[str, Any]],
+    vocab: Dict[str, int],
+    tokenizer: BaseTokenizer
+) -> EncodedBatch:
+    """批量分词并驻留到词表，返回 (doc_ids, term_ids, tfs, doc_lens)"""
+    texts = [doc.get("text", doc.get("page_content", "")) or "" for doc in documents]
+    return tokenizer.encode_batch(texts, vocab)
+
+
+def _snapshot_data(index: SegmentedIndex) -> Dict[str, Any]:
+    """取分段索引的当前快照，组装成检索使用的索引数据"""
+    snapshot = index.snapshot
+    return {
+        "bm25": snapshot,
+        "documents": snapshot.documents,
+        "doc_count": snapshot.doc_count,
+        "cache_path": index.path,
+        "tokenizer": index.tokenizer.name
+    }
+
+
+def _load_cached_index(collection_name: str) -> Optional[SegmentedIndex]:
+    """
+    从进程内注册表或磁盘索引文件加载集合索引，均不存在时返回 None
+
+    索引文件或操作日志被其他 worker 改写后（inode/mtime/size 变化）会重新打开；
+    文件由其他分词器构建时视为不存在（需要重建）。
+    """
+    index = _collection_indexes.get(collection_name)
+    if index is not None and not index.is_stale():
+        return index
+
+    with _index_lock:
+        index = _collection_indexes.get(collection_name)
+        if index is not None and not index.is_stale():
+            return index
+
+        cache_path = _get_cache_path(collection_name)
+        if os.path.exists(cache_path):
+            try:
+                loaded = SegmentedIndex.open(cache_path, **_segment_config())
+                if loaded.tokenizer.name != get_tokenizer().name:
+                    print(f"BM25索引文件的分词器为 {loaded.tokenizer.name}，与当前配置不一致，将重建索引")
+                    loaded.close()
+                    return None
+                if index is not None:
+                    index.close()
+                _collection_indexes[collection_name] = loaded
+                return loaded
+            except Exception as e:
+                print(f"加载BM25索引文件失败: {e}, 将重建索引")
+        return index
+
+
+def _save_index_cache(index_data: Dict[str, Any], cache_path: str) -> None:
+    """将索引写入磁盘（先写临时文件再原子替换，避免并发读到半个文件）"""
+    try:
+        write_index_file(
+            cache_path,
+            index_data["bm25"],
+            index_data["documents"],
+            extra_header={"tokenizer": index_data.get("tokenizer", "ngram")},
+            positional=index_data.get("positional")
+        )
+    except Exception as e:
+        print(f"缓存BM25索引失败: {e}")
+
+
 def _build_bm25_index(collection_name: str, force_rebuild: bool = False) -> Dict[str, Any]:
     """
-    构建或加载BM25索引
+    构建或加载BM25索引，返回集合分段索引当前快照的索引数据
+
+    优先使用进程内已加载的索引，其次是磁盘上的基础段文件（重放操作日志），都没有时从
+    langchain_pg_embedding 流式读取集合内容全量构建。之后的新增/删除通过 update_bm25_index
+    写成新段和墓碑，不会阻塞检索。
 
     Args:
         collection_name: 集合名称
@@ -92,60 +303,106 @@ def _build_bm25_index(collection_name: str, force_rebuild: bool = False) -> Dict
     """
     cache_path = _get_cache_path(collection_name)
 
-    # 尝试从缓存加载
-    if not force_rebuild and Path(cache_path).exists():
+    if not force_rebuild:
+        index = _load_cached_index(collection_name)
+        if index is not None:
+            return _snapshot_data(index)
+
+    with _index_lock:
+        if not force_rebuild:
+            index = _load_cached_index(collection_name)
+            if index is not None:
+                return _snapshot_data(index)
+
         try:
-            with open(cache_path, 'rb') as f:
-                return pickle.load(f)
-        except Exception as e:
-            print(f"加载BM25缓存失败: {e}, 将重建索引")
+            from utils.config_loader import get_config
+            batch_size = int(get_config().get("bm25.build_batch_size", 2000))
+
+            tokenizer = get_tokenizer()
+            vocab: Dict[str, int] = {}
+            documents: List[Dict[str, Any]] = []
+            parts: List[EncodedBatch] = []
+
+            # 每批文本一次性分词并驻留词表，只保留 (doc, term, tf) 数组
+            for batch in _stream_collection_rows(collection_name, batch_size):
+                doc_ids, term_ids, tfs, doc_lens = _encode_documents(batch, vocab, tokenizer)
+                parts.append((doc_ids + len(documents), term_ids, tfs, doc_lens))
+                documents.extend(batch)
+
+            if not parts:
+                parts.append(_encode_documents([], vocab, tokenizer))
+            doc_ids, term_ids, tfs, doc_lens = (np.concatenate(column) for column in zip(*parts))
+            bm25 = BM25Index.from_arrays(vocab, term_ids, doc_ids, tfs, doc_lens)
+            index = SegmentedIndex.create(
+                bm25,
+                documents,
+                tokenizer,
+                path=cache_path,
+                positional=_build_positional(bm25, [doc["text"] for doc in documents], tokenizer),
+                **_segment_config()
+            )
+            previous = _collection_indexes.get(collection_name)
+            if previous is not None:
+                previous.close()
+            _collection_indexes[collection_name] = index
+            return _snapshot_data(index)
 
-    # 从向量数据库获取所有文档
-    try:
-        vector_store = get_vector_store(collection_name=collection_name)
+        except Exception as e:
+            print(f"构建BM25索引失败: {e}")
+            return {
+                "bm25": None,
+                "documents": [],
+                "doc_count": 0,
+                "error": str(e),
+                "cache_path": cache_path
+            }
+
+
+def update_bm25_index(
+    collection_name: str,
+    added: Optional[List[Dict[str, Any]]] = None,
+    deleted_ids: Optional[List[str]] = None,
+    deleted_source: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    将新增/删除增量应用到集合索引
 
-        # 获取所有文档
-        # 注意：这里需要根据具体的向量存储实现调整
-        # 暂时使用简化的方法，实际可能需要调用底层API
-        all_docs = []
+    新增文档分词后写成一个新段，删除只记录墓碑，随后发布新快照：正在检索的线程继续使用
+    旧快照，段的合并在后台进行。索引尚未构建时不做任何事，下一次检索会从数据库全量构建
+    （届时已包含本次变更）。
 
-        # 尝试获取文档（简化实现）
-        # 实际应该通过vector_store的API获取所有文档
-        # 这里先返回空索引，实际使用时需要完善
-        print(f"警告: BM25索引构建需要访问向量数据库中的所有文档")
-        print(f"当前集合: {collection_name}")
+    Args:
+        collection_name: 集合名称
+        added: 新增文档列表，每个文档包含 id、text、metadata
+        deleted_ids: 要删除的 pgvector 行ID
+        deleted_source: 要删除的来源文件名（metadata.source）
 
-        # 返回空索引
-        return {
-            "bm25": None,
-            "documents": [],
-            "tokenized_docs": [],
-            "doc_count": 0,
-            "cache_path": cache_path
-        }
+    Returns:
+        实际新增和删除的文档数
+    """
+    index = _load_cached_index(collection_name)
+    if index is None:
+        return {"added": 0, "deleted": 0}
 
-    except Exception as e:
-        print(f"构建BM25索引失败: {e}")
-        return {
-            "bm25": None,
-            "documents": [],
-            "tokenized_docs": [],
-            "doc_count": 0,
-            "error": str(e),
-            "cache_path": cache_path
-        }
+    deleted = index.delete(deleted_ids, deleted_source) if (deleted_ids or deleted_source) else 0
+    return {"added": index.add(added or []), "deleted": deleted}
 
 
 def _build_bm25_index_from_documents(
     documents: List[Dict[str, Any]],
-    cache_path: Optional[str] = None
+    cache_path: Optional[str] = None,
+    use_cache: bool = True
 ) -> Dict[str, Any]:
     """
     从文档列表构建BM25索引
 
+    索引只取决于文档文本和分词器，因此以二者的哈希为键缓存在进程内 LRU 中；
+    对同一批候选文档重复检索时直接复用，不再重新分词建索引。
+
     Args:
         documents: 文档列表，每个文档包含 text 和 metadata
         cache_path: 缓存文件路径（可选）
+        use_cache: 是否使用内存 LRU 缓存
 
     Returns:
         包含BM25索引和元数据的字典
@@ -154,46 +411,147 @@ def _build_bm25_index_from_documents(
         return {
             "bm25": None,
             "documents": [],
-            "tokenized_docs": [],
             "doc_count": 0
         }
 
-    # 提取文本并分词
-    tokenized_docs = []
-    for doc in documents:
-        text = doc.get("text", doc.get("page_content", ""))
-        tokens = _tokenize(text, language="zh")
-        tokenized_docs.append(tokens)
-
-    # 构建BM25索引
-    bm25 = BM25Okapi(tokenized_docs)
+    tokenizer = get_tokenizer()
+    texts = [doc.get("text", doc.get("page_content", "")) or "" for doc in documents]
+    cache_key = (tokenizer.name, _compute_docs_hash(texts))
+
+    entry = _get_adhoc_cache().get(cache_key) if use_cache else None
+    if entry is None:
+        # 批量分词并构建倒排索引
+        vocab: Dict[str, int] = {}
+        doc_ids, term_ids, tfs, doc_lens = tokenizer.encode_batch(texts, vocab)
+        bm25 = BM25Index.from_arrays(vocab, term_ids, doc_ids, tfs, doc_lens)
+        entry = {
+            "bm25": bm25,
+            "tokenizer": tokenizer.name,
+            "positional": _build_positional(bm25, texts, tokenizer)
+        }
+        if use_cache:
+            _get_adhoc_cache().set(cache_key, entry)
 
+    # 缓存中只保存索引本身，文档（含 metadata）始终使用本次请求传入的
     index_data = {
-        "bm25": bm25,
+        "bm25": entry["bm25"],
         "documents": documents,
-        "tokenized_docs": tokenized_docs,
-        "doc_count": len(documents)
+        "doc_count": len(documents),
+        "tokenizer": entry["tokenizer"],
+        "positional": entry.get("positional")
     }
 
     # 缓存索引
     if cache_path:
-        try:
-            Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
-            with open(cache_path, 'wb') as f:
-                pickle.dump(index_data, f)
-        except Exception as e:
-            print(f"缓存BM25索引失败: {e}")
+        _save_index_cache(index_data, cache_path)
 
     return index_data
 
 
+def _search_index(
+    index_data: Dict[str, Any],
+    query: str,
+    top_k: int,
+    k1: Optional[float] = None,
+    b: Optional[float] = None,
+    diagnostics: Optional[Dict[str, Any]] = None,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    在索引上执行检索并组装结果
+
+    索引带有位置索引且配置启用时，先取 candidate_factor 倍的 BM25 候选，
+    再按短语匹配 / 邻近度加权重排后截取 top_k（分段索引在每个段内加权后再跨段归并）。
+    有元数据过滤条件时只对过滤集合内的文档打分（集合索引使用预先建立的过滤索引，
+    请求传入的文档按过滤字段现场建立）。
+
+    Args:
+        index_data: 索引数据（_build_bm25_index / _build_bm25_index_from_documents 的返回值）
+        query: 查询文本
+        top_k: 返回的文档数量
+        k1: BM25参数k1（None 表示使用索引默认值）
+        b: BM25参数b（None 表示使用索引默认值）
+        diagnostics: 可选字典，写入位置加权的统计信息（键 positional）
+        filters: 元数据过滤条件（字段 → 取值或取值列表）
+
+    Returns:
+        结果列表，每项包含 id（文档ID，没有时为 None）、document、metadata、bm25_score、index
+    """
+    # 对查询进行分词（必须使用构建索引时的分词器）
+    tokenizer = get_tokenizer(index_data.get("tokenizer"))
+    tokenized_query = tokenizer.tokenize(query)
+    bm25 = index_data["bm25"]
+    segmented = isinstance(bm25, SegmentSnapshot)
+    doc_filter = None
+    if filters and not segmented:
+        doc_filter = MetadataIndex.build(index_data["documents"], list(filters)).resolve(filters)
+
+    has_positional = bm25.has_positional if segmented else index_data.get("positional") is not None
+    config = _positional_config() if has_positional else None
+    if config is not None and config["enabled"]:
+        # 倒排索引 + MaxScore 剪枝取候选，再做短语 / 邻近度加权；延迟预算由所有段共享
+        start = time.perf_counter()
+        infos: List[Dict[str, Any]] = []
+
+        def rescore(index: BM25Index, positional: Optional[PositionalIndex], hits):
+            if positional is None:
+                return hits
+            remaining = config["latency_budget_ms"] - (time.perf_counter() - start) * 1000
+            hits, info = positional.rerank(
+                hits,
+                query,
+                tokenizer,
+                index.vocab,
+                phrase_boost=config["phrase_boost"],
+                proximity_boost=config["proximity_boost"],
+                proximity_window=config["proximity_window"],
+                latency_budget_ms=max(remaining, 0.0)
+            )
+            infos.append(info)
+            return hits
+
+        depth = top_k * max(config["candidate_factor"], 1)
+        if segmented:
+            hits = bm25.search(tokenized_query, depth, k1=k1, b=b, rescore=rescore, filters=filters)[:top_k]
+        else:
+            hits = bm25.search(tokenized_query, depth, k1=k1, b=b, doc_filter=doc_filter)
+            hits = rescore(bm25, index_data["positional"], hits)[:top_k]
+        if diagnostics is not None:
+            diagnostics["positional"] = {
+                "applied": any(info["applied"] for info in infos),
+                "phrases": max((info["phrases"] for info in infos), default=0),
+                "boosted": sum(info["boosted"] for info in infos),
+                "budget_exhausted": any(info["budget_exhausted"] for info in infos)
+            }
+    else:
+        # 倒排索引 + MaxScore 剪枝，只对命中查询词项的文档打分；k1/b 按请求生效，不需要重建索引
+        if segmented:
+            hits = bm25.search(tokenized_query, top_k, k1=k1, b=b, filters=filters)
+        else:
+            hits = bm25.search(tokenized_query, top_k, k1=k1, b=b, doc_filter=doc_filter)
+
+    results = []
+    for idx, score in hits:
+        if idx < len(index_data["documents"]):
+            doc = index_data["documents"][idx]
+            results.append({
+                "id": doc.get("id"),
+                "document": doc.get("text", doc.get("page_content", "")),
+                "metadata": doc.get("metadata", {}),
+                "bm25_score": score,
+                "index": idx
+            })
+    return results
+
+
 def _bm25_retrieve_internal(
     query: str,
     documents: str = "[]",
     collection_name: Optional[str] = "knowledge_base",
     top_k: Optional[int] = 5,
     k1: Optional[float] = 1.5,
-    b: Optional[float] = 0.75
+    b: Optional[float] = 0.75,
+    filters: Optional[str] = None
 ) -> str:
     """
     BM25 全文检索（内部函数，供其他工具调用）
@@ -205,6 +563,8 @@ def _bm25_retrieve_internal(
         top_k: 返回的文档数量
         k1: BM25参数k1（控制词频饱和度，默认1.5）
         b: BM25参数b（控制文档长度归一化，默认0.75）
+        filters: 元数据过滤条件（JSON对象字符串），如 {"source": "a.md"}、
+            {"parent_id": "parent_3"}、{"is_parent": false}；不同字段取交集，取值为列表时取并集
 
     Returns:
         JSON 格式的检索结果
@@ -238,27 +598,12 @@ def _bm25_retrieve_internal(
         }, ensure_ascii=False, indent=2)
 
     try:
-        # 对查询进行分词
-        tokenized_query = _tokenize(query, language="zh")
-
-        # 执行BM25检索
         bm25 = index_data["bm25"]
-        scores = bm25.get_scores(tokenized_query)
-
-        # 获取top_k结果
-        top_indices = scores.argsort()[-top_k:][::-1]
-
-        # 构建结果
-        results = []
-        for idx in top_indices:
-            if idx < len(index_data["documents"]):
-                doc = index_data["documents"][idx]
-                results.append({
-                    "document": doc.get("text", doc.get("page_content", "")),
-                    "metadata": doc.get("metadata", {}),
-                    "bm25_score": float(scores[idx]),
-                    "index": int(idx)
-                })
+        k1 = bm25.k1 if k1 is None else k1
+        b = bm25.b if b is None else b
+        diagnostics: Dict[str, Any] = {}
+        filter_dict = _parse_filters(filters)
+        results = _search_index(index_data, query, top_k, k1=k1, b=b, diagnostics=diagnostics, filters=filter_dict)
 
         # 格式化输出
         output = {
@@ -267,11 +612,14 @@ def _bm25_retrieve_internal(
             "parameters": {
                 "k1": k1,
                 "b": b,
-                "top_k": top_k
+                "top_k": top_k,
+                "filters": filter_dict
             },
             "results": results,
             "count": len(results)
         }
+        if "positional" in diagnostics:
+            output["positional"] = diagnostics["positional"]
 
         return json.dumps(output, ensure_ascii=False, indent=2)
 
@@ -292,7 +640,8 @@ def bm25_retrieve(
     collection_name: Optional[str] = "knowledge_base",
     top_k: Optional[int] = 5,
     k1: Optional[float] = 1.5,
-    b: Optional[float] = 0.75
+    b: Optional[float] = 0.75,
+    filters: Optional[str] = None
 ) -> str:
     """
     BM25 全文检索（工具函数，供Agent调用）
@@ -304,6 +653,8 @@ def bm25_retrieve(
         top_k: 返回的文档数量
         k1: BM25参数k1（控制词频饱和度，默认1.5）
         b: BM25参数b（控制文档长度归一化，默认0.75）
+        filters: 元数据过滤条件（JSON对象字符串），如 {"source": "a.md"}、
+            {"parent_id": "parent_3"}、{"is_parent": false}；不同字段取交集，取值为列表时取并集
 
     Returns:
         JSON 格式的检索结果
@@ -337,27 +688,12 @@ def bm25_retrieve(
         }, ensure_ascii=False, indent=2)
 
     try:
-        # 对查询进行分词
-        tokenized_query = _tokenize(query, language="zh")
-
-        # 执行BM25检索
         bm25 = index_data["bm25"]
-        scores = bm25.get_scores(tokenized_query)
-
-        # 获取top_k结果
-        top_indices = scores.argsort()[-top_k:][::-1]
-
-        # 构建结果
-        results = []
-        for idx in top_indices:
-            if idx < len(index_data["documents"]):
-                doc = index_data["documents"][idx]
-                results.append({
-                    "document": doc.get("text", doc.get("page_content", "")),
-                    "metadata": doc.get("metadata", {}),
-                    "bm25_score": float(scores[idx]),
-                    "index": int(idx)
-                })
+        k1 = bm25.k1 if k1 is None else k1
+        b = bm25.b if b is None else b
+        diagnostics: Dict[str, Any] = {}
+        filter_dict = _parse_filters(filters)
+        results = _search_index(index_data, query, top_k, k1=k1, b=b, diagnostics=diagnostics, filters=filter_dict)
 
         # 格式化输出
         output = {
@@ -366,11 +702,14 @@ def bm25_retrieve(
             "parameters": {
                 "k1": k1,
                 "b": b,
-                "top_k": top_k
+                "top_k": top_k,
+                "filters": filter_dict
             },
             "count": len(results),
             "results": results
         }
+        if "positional" in diagnostics:
+            output["positional"] = diagnostics["positional"]
 
         return json.dumps(output, ensure_ascii=False, indent=2)
 
@@ -396,6 +735,18 @@ def clear_bm25_cache(collection_name: Optional[str] = None) -> str:
         操作结果
     """
     try:
+        # 同时丢弃进程内已加载的索引，下次检索时重新构建
+        with _index_lock:
+            if collection_name:
+                removed = [_collection_indexes.pop(collection_name, None)]
+            else:
+                removed = list(_collection_indexes.values())
+                _collection_indexes.clear()
+                _get_adhoc_cache().clear()
+            for index in removed:
+                if index is not None:
+                    index.close()
+
         cache_dir = Path(BM25_CACHE_DIR)
 
         if not cache_dir.exists():
@@ -403,15 +754,26 @@ def clear_bm25_cache(collection_name: Optional[str] = None) -> str:
 
         if collection_name:
             # 清除特定集合的缓存
-            cache_path = cache_dir / f"{collection_name}.pkl"
-            if cache_path.exists():
-                cache_path.unlink()
+            cache_paths = [
+                cache_dir / f"{collection_name}{INDEX_FILE_SUFFIX}",
+                cache_dir / f"{collection_name}{INDEX_FILE_SUFFIX}{LOG_FILE_SUFFIX}",
+                cache_dir / f"{collection_name}.pkl"
+            ]
+            existing = [p for p in cache_paths if p.exists()]
+            if existing:
+                for p in existing:
+                    p.unlink()
                 return f"已清除集合 '{collection_name}' 的BM25缓存"
             else:
                 return f"集合 '{collection_name}' 的BM25缓存不存在"
         else:
             # 清除所有缓存
-            cache_files = list(cache_dir.glob("*.pkl"))
+            # 旧版 pickle 缓存（*.pkl）已不再读取，一并清除
+            cache_files = (
+                list(cache_dir.glob(f"*{INDEX_FILE_SUFFIX}"))
+                + list(cache_dir.glob(f"*{INDEX_FILE_SUFFIX}{LOG_FILE_SUFFIX}"))
+                + list(cache_dir.glob("*.pkl"))
+            )
             for f in cache_files:
                 f.unlink()
             return f"已清除 {len(cache_files)} 个BM25缓存文件"
@@ -0,0 +1,915 @@
+"""
+BM25 分段索引（LSM 风格）
+索引由若干不可变段组成：段 0 是全量构建 / 全量合并产生的基础段（即磁盘上的 mmap 索引文件），
+之后的增量写入各自生成一个小段；删除只在段上记录墓碑（删除掩码），由合并时真正丢弃。
+
+读取方始终使用一个不可变快照（段列表 + 删除掩码 + 全局统计量），写入方构建好新快照后整体
+替换引用：检索不需要加锁，也永远不会看到构建到一半的索引。后台线程按合并策略把小段合并成
+一个段，或把所有段合并成新的基础段写回磁盘。
+
+各段按快照的全局统计量（存活文档数、平均文档长度、文档频率）打分，因此分段检索的分数与
+对全部存活文档构建单个索引完全一致。
+
+磁盘上除基础段文件（格式见 tools.bm25_store）外，还有同名的 .log 操作日志：
+    第一行     {"generation": ...}，与基础段文件头的 generation 一致时日志才有效
+    之后每行   {"op": "add", "docs": [...]} 或
+               {"op": "delete", "ids": [...], "source": ..., "base": [基础段内的文档ID]}
+打开索引时 mmap 基础段并重放日志；全量合并写出新的基础段后日志随之重写。
+
+多个进程（如 Web 服务与 Agent 服务）可以共用同一组文件：追加日志与全量合并发布都持有同名
+.lock 文件上的排他锁（fcntl.flock），并在写入前先应用其他进程已写入的操作，因此任何一方的
+写入都不会被另一方的全量合并覆盖掉。
+
+每个段带有元数据过滤索引（tools.bm25_filters），随段一起构建、合并和写盘，
+带元数据过滤条件的检索只对过滤集合内的存活文档打分。
+"""
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tools.bm25_filters import DEFAULT_FILTER_FIELDS, MetadataIndex
+from tools.bm25_index import BM25Index, okapi_idf
+from tools.bm25_positional import PositionalIndex
+from tools.bm25_store import DocumentTable, open_index_file, write_index_file
+from tools.bm25_tokenizer import BaseTokenizer, get_tokenizer
+
+try:
+    import fcntl
+except ImportError:     # Windows：没有 flock，退化为只有进程内互斥
+    fcntl = None
+
+LOG_FILE_SUFFIX = ".log"
+LOCK_FILE_SUFFIX = ".lock"
+
+# 段级检索结果重排回调：(该段的打分视图, 该段的位置索引, [(段内文档ID, 分数), ...]) → 重排后的结果
+Rescorer = Callable[[BM25Index, Optional[PositionalIndex], List[Tuple[int, float]]], List[Tuple[int, float]]]
+
+
+def _file_stamp(path: str) -> Optional[tuple]:
+    """文件的 (inode, mtime, size)，用于发现其他 worker 写入的新版本"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def files_stamp(path: str) -> Tuple[Optional[tuple], Optional[tuple]]:
+    """基础段文件与操作日志的版本戳"""
+    return _file_stamp(path), _file_stamp(path + LOG_FILE_SUFFIX)
+
+
+@contextmanager
+def _file_lock(path: Optional[str], shared: bool = False):
+    """
+    持有基础段文件旁 .lock 文件上的跨进程锁
+
+    flock 锁属于打开的文件描述，同一进程内的两个索引实例之间同样互斥。
+    path 为 None（纯内存索引）或平台不支持 flock 时不加锁。
+    """
+    if not path or fcntl is None:
+        yield
+        return
+    with open(path + LOCK_FILE_SUFFIX, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _write_log(path: str, generation: Optional[str], ops: Sequence[Dict[str, Any]]) -> None:
+    """重写操作日志（先写临时文件再原子替换）"""
+    log_path = path + LOG_FILE_SUFFIX
+    tmp_path = f"{log_path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"generation": generation}) + "\n")
+        for op in ops:
+            f.write(json.dumps(op, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, log_path)
+
+
+def _read_log(
+    path: str,
+    generation: Optional[str],
+    offset: int = 0
+) -> Tuple[Optional[List[Dict[str, Any]]], int]:
+    """
+    读取操作日志中 offset 之后的操作；末尾不完整的行忽略
+
+    Args:
+        path: 基础段文件路径
+        generation: 基础段的 generation
+        offset: 已应用到的字节偏移（0 表示从头读）
+
+    Returns:
+        (操作列表, 已读完整行的结束偏移)；日志不存在或属于其他基础段时操作列表为 None
+    """
+    ops: List[Dict[str, Any]] = []
+    try:
+        with open(path + LOG_FILE_SUFFIX, "rb") as f:
+            if json.loads(f.readline()).get("generation") != generation:
+                return None, 0
+            if offset:
+                f.seek(offset)
+            else:
+                offset = f.tell()
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break       # 写入中断留下的半行
+                try:
+                    ops.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+                offset += len(line)
+    except (OSError, ValueError):
+        return None, 0
+    return ops, offset
+
+
+def _doc_text(doc: Dict[str, Any]) -> str:
+    return doc.get("text", doc.get("page_content", "")) or ""
+
+
+def _select_documents(documents: Sequence[Dict[str, Any]], keep: np.ndarray) -> Sequence[Dict[str, Any]]:
+    if isinstance(documents, DocumentTable):
+        return documents.select(keep)
+    return [doc for doc, kept in zip(documents, keep) if kept]
+
+
+class Segment:
+    """
+    不可变段：倒排索引 + 文档 + 可选的位置索引 / 元数据过滤索引
+
+    同一快照中所有段的索引共享一个词表，词项ID在段之间通用。
+    """
+
+    def __init__(
+        self,
+        bm25: BM25Index,
+        documents: Sequence[Dict[str, Any]],
+        positional: Optional[PositionalIndex] = None,
+        metadata: Optional[MetadataIndex] = None
+    ):
+        self.bm25 = bm25
+        self.documents = documents
+        self.positional = positional
+        self.metadata = metadata
+        self.doc_count = bm25.doc_count
+        # (删除掩码, 存活文档的文档频率, 存活文档总长度)；掩码写时复制，按对象身份缓存
+        self._live_stats: Optional[Tuple[Optional[np.ndarray], np.ndarray, float]] = None
+        # 每个词项的最大 tf 饱和项（见 saturation_bounds）与 文档ID → 段内文档ID（见 find），首次使用时计算
+        self._saturation: Optional[np.ndarray] = None
+        self._id_positions: Optional[Dict[Any, List[int]]] = None
+
+    def saturation_bounds(self) -> np.ndarray:
+        """
+        每个词项在本段上的最大 tf 饱和项 tf * (k1 + 1) / (tf + norm)（按段自身的平均文档长度）
+
+        与全局统计量无关，段不可变，因此只计算一次（O(P)）；快照由它和全局 idf / 平均文档长度
+        得到保守的分数上界（见 SegmentSnapshot._view），发布新快照时不再遍历倒排表。
+        """
+        if self._saturation is None:
+            bm25 = self.bm25
+            present = bm25.df > 0
+            saturation = np.zeros(len(bm25.df), dtype=np.float64)
+            if len(bm25.post_docs) and present.any():
+                tfs = bm25.post_tfs.astype(np.float64)
+                contrib = tfs * (bm25.k1 + 1) / (tfs + bm25.norm[bm25.post_docs])
+                saturation[present] = np.maximum.reduceat(contrib, bm25.offsets[:-1][present])
+            self._saturation = saturation
+        return self._saturation
+
+    def find(self, ids: set, source: Optional[str]) -> np.ndarray:
+        """
+        段内文档ID在 ids 中或来源文件名为 source 的文档（含已删除文档）
+
+        来源文件名走元数据过滤索引；文档ID → 段内文档ID 的映射在首次按ID删除时建立一次。
+
+        Returns:
+            段内文档ID（升序、无重复）
+        """
+        parts = []
+        if ids:
+            if self._id_positions is None:
+                positions: Dict[Any, List[int]] = {}
+                for j, doc in enumerate(self.documents):
+                    positions.setdefault(doc.get("id"), []).append(j)
+                self._id_positions = positions
+            parts.extend(self._id_positions[doc_id] for doc_id in ids if doc_id in self._id_positions)
+        if source:
+            if self.metadata is not None and "source" in self.metadata.fields:
+                parts.append(self.metadata.lookup("source", source))
+            else:
+                parts.append([
+                    j for j, doc in enumerate(self.documents)
+                    if (doc.get("metadata") or {}).get("source") == source
+                ])
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate([np.asarray(part, dtype=np.int64) for part in parts]))
+
+    def live_stats(self, deleted: Optional[np.ndarray]) -> Tuple[np.ndarray, float]:
+        """
+        存活文档的文档频率与总长度
+
+        Args:
+            deleted: 删除掩码（None 表示没有删除）
+
+        Returns:
+            (df, total_len)
+        """
+        cached = self._live_stats
+        if cached is not None and cached[0] is deleted:
+            return cached[1], cached[2]
+
+        bm25 = self.bm25
+        if deleted is None or not deleted.any():
+            df, total_len = bm25.df, float(bm25.doc_lens.sum())
+        else:
+            vocab_size = len(bm25.offsets) - 1
+            terms = np.repeat(np.arange(vocab_size), np.diff(bm25.offsets))
+            dead_df = np.bincount(terms[deleted[bm25.post_docs]], minlength=vocab_size)
+            df = bm25.df - dead_df
+            total_len = float(bm25.doc_lens[~deleted].sum())
+        self._live_stats = (deleted, df, total_len)
+        return df, total_len
+
+
+class SegmentDocuments(Sequence):
+    """快照内所有段文档的只读拼接视图（全局文档ID = 段起始位置 + 段内文档ID，含已删除文档）"""
+
+    def __init__(self, segments: Sequence[Segment], starts: np.ndarray):
+        self._segments = segments
+        self._starts = starts
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("document index out of range")
+        seg = int(np.searchsorted(self._starts, i, side="right")) - 1
+        return self._segments[seg].documents[i - int(self._starts[seg])]
+
+
+class SegmentSnapshot:
+    """
+    分段索引的不可变快照
+
+    构建时计算全局统计量，并为每个段生成共享倒排数组、按全局 idf / 平均文档长度打分的
+    BM25Index 视图，检索时不再有任何 O(P) 的准备工作。
+
+    视图的 MaxScore 分数上界由段缓存的 tf 饱和项（Segment.saturation_bounds）乘全局 idf 得到，
+    全局平均文档长度大于段自身的平均文档长度时按比例放宽（保守上界，剪枝结果不变），
+    因此发布快照只需 O(V + N)，不随倒排表大小增长；合并生成的新段按合并后的统计量重新计算，上界随之收紧。
+    """
+
+    def __init__(
+        self,
+        segments: Sequence[Segment],
+        deleted: Sequence[Optional[np.ndarray]],
+        generation: Optional[str] = None
+    ):
+        self.segments = tuple(segments)
+        self.deleted = tuple(deleted)
+        self.generation = generation
+
+        first = self.segments[0].bm25
+        self.vocab = first.vocab
+        self.k1 = first.k1
+        self.b = first.b
+        self.epsilon = first.epsilon
+
+        self.starts = np.zeros(len(self.segments) + 1, dtype=np.int64)
+        np.cumsum([segment.doc_count for segment in self.segments], out=self.starts[1:])
+        self.deleted_counts = [int(mask.sum()) if mask is not None else 0 for mask in self.deleted]
+        self.doc_count = int(self.starts[-1]) - sum(self.deleted_counts)
+
+        vocab_size = max(len(segment.bm25.df) for segment in self.segments)
+        df = np.zeros(vocab_size, dtype=np.float64)
+        total_len = 0.0
+        for segment, mask in zip(self.segments, self.deleted):
+            segment_df, segment_len = segment.live_stats(mask)
+            df[:len(segment_df)] += segment_df
+            total_len += segment_len
+        self.df = df
+        self.avgdl = total_len / self.doc_count if self.doc_count else 0.0
+        self.idf = okapi_idf(df, self.doc_count, self.epsilon)
+
+        self.views = [self._view(segment) for segment in self.segments]
+        self.documents = SegmentDocuments(self.segments, self.starts)
+
+    def _view(self, segment: Segment) -> BM25Index:
+        """
+        段的打分视图（共享倒排数组，按全局统计量打分）
+
+        tf 饱和项随平均文档长度单调：avgdl 增大 r 倍时长度归一化项至少缩小为 1/r，饱和项至多放大 r 倍，
+        且始终小于 k1 + 1，所以 idf × min(饱和项 × max(1, r), k1 + 1) 是全局统计量下的有效上界。
+        """
+        bm25 = segment.bm25
+        idf = self.idf[:len(bm25.df)]
+        saturation = segment.saturation_bounds()
+        if bm25.avgdl > 0:
+            saturation = np.minimum(saturation * max(1.0, self.avgdl / bm25.avgdl), self.k1 + 1)
+        else:
+            saturation = np.where(saturation > 0, self.k1 + 1, 0.0)
+        return BM25Index(
+            vocab=bm25.vocab,
+            offsets=bm25.offsets,
+            post_docs=bm25.post_docs,
+            post_tfs=bm25.post_tfs,
+            doc_lens=bm25.doc_lens,
+            k1=self.k1,
+            b=self.b,
+            epsilon=self.epsilon,
+            idf=idf,
+            upper_bounds=idf * saturation,
+            avgdl=self.avgdl
+        )
+
+    @property
+    def has_positional(self) -> bool:
+        return any(segment.positional is not None for segment in self.segments)
+
+    def search(
+        self,
+        query_tokens: Sequence[str],
+        top_k: int,
+        k1: Optional[float] = None,
+        b: Optional[float] = None,
+        rescore: Optional[Rescorer] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        检索 top-k 存活文档
+
+        每个段用 MaxScore 取 top_k + 该段删除数 个结果（保证过滤墓碑后仍有 top_k 个），
+        分数基于全局统计量，可以直接跨段归并。有元数据过滤条件时，每个段先由过滤索引
+        求出过滤集合并去掉墓碑，只对集合内的文档打分。
+
+        Args:
+            query_tokens: 查询词项
+            top_k: 返回数量
+            k1: BM25参数k1（None 表示使用索引默认值）
+            b: BM25参数b（None 表示使用索引默认值）
+            rescore: 可选的段级重排回调（如位置索引加权），在归并前对每个段的结果调用
+            filters: 元数据过滤条件（字段 → 取值或取值列表，见 MetadataIndex.resolve）
+
+        Returns:
+            [(全局文档ID, score), ...]，按分数降序
+
+        Raises:
+            ValueError: 过滤字段没有建立过滤索引
+        """
+        if not top_k or top_k <= 0 or self.doc_count == 0:
+            return []
+
+        pool: List[Tuple[int, float]] = []
+        for start, view, segment, mask, n_deleted in zip(
+            self.starts, self.views, self.segments, self.deleted, self.deleted_counts
+        ):
+            if view.doc_count == n_deleted:
+                continue
+            if filters:
+                if segment.metadata is None:
+                    raise ValueError("BM25段没有元数据过滤索引")
+                allowed = segment.metadata.resolve(filters)
+                if n_deleted:
+                    allowed = allowed[~mask[allowed]]
+                if not len(allowed):
+                    continue
+                hits = view.search(query_tokens, top_k, k1=k1, b=b, doc_filter=allowed)
+            else:
+                hits = view.search(query_tokens, min(top_k + n_deleted, view.doc_count), k1=k1, b=b)
+                if n_deleted:
+                    hits = [(doc_id, score) for doc_id, score in hits if not mask[doc_id]][:top_k]
+            if rescore is not None:
+                hits = rescore(view, segment.positional, hits)
+            pool.extend((int(start) + doc_id, score) for doc_id, score in hits)
+
+        pool.sort(key=lambda hit: (-hit[1], hit[0]))
+        return pool[:top_k]
+
+
+def _open_base(path: str, filter_fields: Sequence[str]) -> Tuple[SegmentSnapshot, BaseTokenizer]:
+    """mmap 打开基础段文件，返回只含基础段的快照和构建它的分词器"""
+    bm25, documents, positional, metadata, header = open_index_file(path)
+    if metadata is None or any(field not in metadata.fields for field in filter_fields):
+        # 旧文件或过滤字段配置变化：从文档重建一次，下次全量合并时写回文件
+        metadata = MetadataIndex.build(documents, filter_fields)
+    snapshot = SegmentSnapshot([Segment(bm25, documents, positional, metadata)], [None], header.get("generation"))
+    return snapshot, get_tokenizer(header.get("tokenizer", "ngram"))
+
+
+class SegmentedIndex:
+    """
+    分段索引的写入端：持有当前快照，负责增量写入、墓碑删除、操作日志与合并
+
+    合并策略：
+        小段合并：小段数超过 max_segments，或某个小段的删除比例超过 max_deleted_ratio 时，
+                  把所有小段合并成一个（只在内存中进行，日志不变）
+        全量合并：小段文档总数超过基础段的 major_merge_ratio 倍，或基础段删除比例超过
+                  max_deleted_ratio 时，合并所有段并写出新的基础段文件（新 generation）
+
+    合并在后台线程中进行（background_merge=False 时在写入调用返回前同步进行），期间写入
+    与检索照常；合并完成后把合并期间新增的段和删除应用到新段上，再替换快照。
+    """
+
+    def __init__(
+        self,
+        snapshot: SegmentSnapshot,
+        tokenizer: BaseTokenizer,
+        path: Optional[str] = None,
+        positional_budget: Optional[Callable[[BM25Index], Optional[int]]] = None,
+        max_segments: int = 8,
+        major_merge_ratio: float = 0.1,
+        max_deleted_ratio: float = 0.2,
+        background_merge: bool = True,
+        filter_fields: Sequence[str] = DEFAULT_FILTER_FIELDS
+    ):
+        """
+        Args:
+            snapshot: 初始快照
+            tokenizer: 分词器（必须与构建基础段时一致）
+            path: 基础段文件路径（None 表示只在内存中维护，不写日志）
+            positional_budget: 根据段的倒排索引返回位置索引字节预算，返回 None 表示不建位置索引
+            max_segments: 允许的最大小段数
+            major_merge_ratio: 触发全量合并的小段文档数 / 基础段文档数
+            max_deleted_ratio: 触发合并的段内删除比例
+            background_merge: 是否在后台线程中合并
+            filter_fields: 建立元数据过滤索引的字段
+        """
+        self.snapshot = snapshot
+        self.tokenizer = tokenizer
+        self.path = path
+        self.positional_budget = positional_budget
+        self.max_segments = max_segments
+        self.major_merge_ratio = major_merge_ratio
+        self.max_deleted_ratio = max_deleted_ratio
+        self.background_merge = background_merge
+        self.filter_fields = tuple(filter_fields)
+        self.file_stamp = files_stamp(path) if path else None
+        # 已应用的日志字节偏移（0 表示日志头之后），与 file_stamp 一同推进
+        self._log_offset = 0
+
+        self._write_lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._merge_event = threading.Event()
+        self._merge_thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._stats = {"minor_merges": 0, "major_merges": 0, "merge_errors": 0}
+
+    # ==================== 创建 / 打开 ====================
+
+    @classmethod
+    def create(
+        cls,
+        bm25: BM25Index,
+        documents: Sequence[Dict[str, Any]],
+        tokenizer: BaseTokenizer,
+        path: Optional[str] = None,
+        positional: Optional[PositionalIndex] = None,
+        **kwargs
+    ) -> "SegmentedIndex":
+        """
+        以全量构建的索引为基础段创建分段索引，并写出基础段文件和空日志
+
+        写盘失败时仍返回内存中的索引（下次进程启动会重新构建）。
+        """
+        generation = uuid.uuid4().hex
+        metadata = MetadataIndex.build(documents, kwargs.get("filter_fields", DEFAULT_FILTER_FIELDS))
+        stamp = None
+        if path:
+            try:
+                with _file_lock(path):
+                    write_index_file(
+                        path, bm25, documents,
+                        extra_header={"tokenizer": tokenizer.name, "generation": generation},
+                        positional=positional,
+                        metadata=metadata
+                    )
+                    _write_log(path, generation, [])
+                    stamp = files_stamp(path)
+            except Exception as e:
+                print(f"写入BM25基础段失败: {e}")
+        snapshot = SegmentSnapshot([Segment(bm25, documents, positional, metadata)], [None], generation)
+        index = cls(snapshot, tokenizer, path, **kwargs)
+        if stamp is not None:
+            index.file_stamp = stamp
+        return index
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> "SegmentedIndex":
+        """
+        mmap 打开基础段文件并重放操作日志
+
+        Raises:
+            ValueError: 文件格式或版本不匹配
+        """
+        # 共享锁保证读到的基础段与日志是同一次写入后的一致状态
+        with _file_lock(path, shared=True):
+            stamp = files_stamp(path)
+            snapshot, tokenizer = _open_base(path, kwargs.get("filter_fields", DEFAULT_FILTER_FIELDS))
+            index = cls(snapshot, tokenizer, path, **kwargs)
+            index._replay_log()
+            index.file_stamp = stamp
+        index._schedule_merge()
+        return index
+
+    def _replay_log(self) -> bool:
+        """
+        应用日志中尚未应用的操作（连续的新增合并成一个段）
+
+        Returns:
+            日志是否属于当前基础段（False 表示基础段已被其他进程的全量合并替换）
+        """
+        ops, offset = _read_log(self.path, self.snapshot.generation, self._log_offset)
+        if ops is None:
+            return False
+        pending: List[Dict[str, Any]] = []
+        for op in ops:
+            if op.get("op") == "add":
+                pending.extend(op.get("docs") or [])
+                continue
+            if pending:
+                self._publish_add(pending)
+                pending = []
+            if op.get("op") == "delete":
+                self._publish_delete(set(op.get("ids") or []), op.get("source"), op.get("base"))
+        if pending:
+            self._publish_add(pending)
+        self._log_offset = offset
+        return True
+
+    def _sync_from_disk(self) -> None:
+        """
+        应用其他进程在上次同步之后写入的变更（须持有 _write_lock 与文件排他锁）
+
+        日志仍属于当前基础段时只重放新追加的操作；基础段已被全量合并替换时重新打开基础段并
+        重放新日志。其他进程的写入都已在磁盘上，本进程的写入也都已落盘，重新打开不会丢失变更。
+        版本戳只在应用完磁盘上的全部写入后才更新。
+        """
+        if not self.path:
+            return
+        stamp = files_stamp(self.path)
+        if stamp == self.file_stamp:
+            return
+        if not self._replay_log():
+            self.snapshot, _ = _open_base(self.path, self.filter_fields)
+            self._log_offset = 0
+            self._replay_log()
+        self.file_stamp = stamp
+
+    def is_stale(self) -> bool:
+        """磁盘上的基础段或日志是否已被其他 worker 改写"""
+        return bool(self.path) and files_stamp(self.path) != self.file_stamp
+
+    # ==================== 写入 ====================
+
+    def _build_segment(self, documents: Sequence[Dict[str, Any]], vocab) -> Segment:
+        """对文档分词（词项驻留到共享词表）并构建新段"""
+        texts = [_doc_text(doc) for doc in documents]
+        doc_ids, term_ids, tfs, doc_lens = self.tokenizer.encode_batch(texts, vocab)
+        first = self.snapshot.segments[0].bm25
+        bm25 = BM25Index.from_arrays(
+            vocab, term_ids, doc_ids, tfs, doc_lens, k1=first.k1, b=first.b, epsilon=first.epsilon
+        )
+        positional = None
+        budget = self.positional_budget(bm25) if self.positional_budget else None
+        if budget is not None:
+            positional = PositionalIndex.build(bm25, texts, self.tokenizer, budget)
+        documents = list(documents)
+        return Segment(bm25, documents, positional, MetadataIndex.build(documents, self.filter_fields))
+
+    def _append_log(self, op: Dict[str, Any]) -> None:
+        """追加一条操作（须持有文件排他锁且已 _sync_from_disk，追加后版本戳只覆盖本进程已应用的写入）"""
+        if not self.path:
+            return
+        try:
+            log_path = self.path + LOG_FILE_SUFFIX
+            if not os.path.exists(log_path):
+                _write_log(self.path, self.snapshot.generation, [])
+            with open(log_path, "ab") as f:
+                f.write((json.dumps(op, ensure_ascii=False) + "\n").encode("utf-8"))
+                self._log_offset = f.tell()
+            self.file_stamp = files_stamp(self.path)
+        except Exception as e:
+            print(f"写入BM25操作日志失败: {e}")
+
+    def _publish_add(self, documents: List[Dict[str, Any]]) -> None:
+        snapshot = self.snapshot
+        segment = self._build_segment(documents, snapshot.vocab)
+        self.snapshot = SegmentSnapshot(
+            snapshot.segments + (segment,), snapshot.deleted + (None,), snapshot.generation
+        )
+
+    def _publish_delete(self, ids: set, source: Optional[str], base: Optional[List[int]] = None) -> List[int]:
+        """
+        给匹配的存活文档打上墓碑并发布新快照
+
+        Args:
+            ids: 要删除的文档ID
+            source: 要删除的来源文件名
+            base: 基础段内要删除的文档ID（重放日志时给出，跳过对基础段的扫描）
+
+        Returns:
+            每个段新删除的文档数
+        """
+        snapshot = self.snapshot
+        deleted = list(snapshot.deleted)
+        counts = [0] * len(snapshot.segments)
+        for i, (segment, mask) in enumerate(zip(snapshot.segments, snapshot.deleted)):
+            if i == 0 and base is not None:
+                matched = np.asarray([j for j in base if j < segment.doc_count], dtype=np.int64)
+            else:
+                matched = segment.find(ids, source)
+            if mask is not None and len(matched):
+                matched = matched[~mask[matched]]
+            if len(matched):
+                new_mask = np.zeros(segment.doc_count, dtype=bool) if mask is None else mask.copy()
+                new_mask[matched] = True
+                deleted[i] = new_mask
+                counts[i] = len(matched)
+        if any(counts):
+            self.snapshot = SegmentSnapshot(snapshot.segments, deleted, snapshot.generation)
+        return counts
+
+    def add(self, documents: Sequence[Dict[str, Any]]) -> int:
+        """
+        新增文档（生成一个新段）
+
+        Args:
+            documents: 文档列表，每个文档包含 id、text、metadata
+
+        Returns:
+            新增的文档数
+        """
+        documents = list(documents)
+        if not documents:
+            return 0
+        with self._write_lock, _file_lock(self.path):
+            self._sync_from_disk()
+            self._publish_add(documents)
+            self._append_log({"op": "add", "docs": documents})
+        self._schedule_merge()
+        return len(documents)
+
+    def delete(self, ids: Optional[Sequence[str]] = None, source: Optional[str] = None) -> int:
+        """
+        按文档ID或来源文件名删除文档（记录墓碑）
+
+        Args:
+            ids: 要删除的文档ID（pgvector 行ID）
+            source: 要删除的来源文件名（metadata.source）
+
+        Returns:
+            删除的文档数
+        """
+        id_set = set(ids or [])
+        if not id_set and not source:
+            return 0
+        with self._write_lock, _file_lock(self.path):
+            self._sync_from_disk()
+            before = self.snapshot.deleted[0]
+            counts = self._publish_delete(id_set, source)
+            if not any(counts):
+                return 0
+            # 基础段的删除按段内文档ID记录，重放时不必再扫描基础段文档
+            after = self.snapshot.deleted[0]
+            base: List[int] = []
+            if after is not before:
+                base = np.flatnonzero(after if before is None else after & ~before).tolist()
+            self._append_log({"op": "delete", "ids": sorted(id_set), "source": source, "base": base})
+        self._schedule_merge()
+        return sum(counts)
+
+    # ==================== 合并 ====================
+
+    def _plan_merge(self, snapshot: SegmentSnapshot) -> Optional[str]:
+        """按合并策略决定下一次合并：'major' / 'minor' / None"""
+        base = snapshot.segments[0]
+        small = snapshot.segments[1:]
+        small_docs = sum(segment.doc_count for segment in small)
+        if small_docs > self.major_merge_ratio * base.doc_count:
+            return "major"
+        if snapshot.deleted_counts[0] > self.max_deleted_ratio * base.doc_count:
+            return "major"
+        if len(small) > self.max_segments:
+            return "minor"
+        for segment, n_deleted in zip(small, snapshot.deleted_counts[1:]):
+            if n_deleted > self.max_deleted_ratio * segment.doc_count:
+                return "minor"
+        return None
+
+    def _merge_segments(
+        self,
+        snapshot: SegmentSnapshot,
+        first: int,
+        vocab
+    ) -> Tuple[Segment, List[np.ndarray]]:
+        """
+        合并快照中从 first 开始的所有段，丢弃已删除文档
+
+        Returns:
+            (合并后的段, 每个源段的 段内文档ID → 合并后文档ID 映射（已删除为 -1）)
+        """
+        indexes: List[BM25Index] = []
+        documents: List[Sequence[Dict[str, Any]]] = []
+        doc_maps: List[np.ndarray] = []
+        base = 0
+        for segment, mask in zip(snapshot.segments[first:], snapshot.deleted[first:]):
+            if mask is not None and mask.any():
+                live = ~mask
+                indexes.append(segment.bm25.remove_documents(np.flatnonzero(mask)))
+                documents.append(_select_documents(segment.documents, live))
+                doc_maps.append(np.where(live, np.cumsum(live) - 1 + base, -1))
+            else:
+                indexes.append(segment.bm25)
+                documents.append(segment.documents)
+                doc_maps.append(np.arange(segment.doc_count, dtype=np.int64) + base)
+            base += indexes[-1].doc_count
+
+        bm25 = BM25Index.concat(indexes, vocab=vocab)
+        merged_docs = documents[0]
+        for part in documents[1:]:
+            merged_docs = merged_docs + list(part)
+
+        positional = None
+        segments = snapshot.segments[first:]
+        budget = self.positional_budget(bm25) if self.positional_budget else None
+        if budget is not None and all(segment.positional is not None for segment in segments):
+            positional = PositionalIndex.concat(
+                [(segment.positional, segment.bm25, doc_map) for segment, doc_map in zip(segments, doc_maps)],
+                bm25,
+                budget
+            )
+        metadata = None
+        if all(segment.metadata is not None for segment in segments):
+            metadata = MetadataIndex.concat(
+                [(segment.metadata, doc_map) for segment, doc_map in zip(segments, doc_maps)]
+            )
+        return Segment(bm25, merged_docs, positional, metadata), doc_maps
+
+    def merge(self, major: Optional[bool] = None) -> bool:
+        """
+        执行一次合并
+
+        Args:
+            major: True 全量合并，False 小段合并，None 按合并策略决定
+
+        Returns:
+            是否发生了合并
+        """
+        with self._merge_lock:
+            with self._write_lock:
+                snapshot = self.snapshot
+                if major is None:
+                    plan = self._plan_merge(snapshot)
+                    if plan is None:
+                        return False
+                    major = plan == "major"
+                # 写出基础段时词表会被遍历，使用副本避免与并发写入冲突
+                vocab = snapshot.vocab.copy() if major and self.path else None
+            first = 0 if major else 1
+            if len(snapshot.segments) <= first:
+                return False
+
+            merged, doc_maps = self._merge_segments(snapshot, first, vocab)
+            generation = snapshot.generation
+            staged_path = None
+            if major and self.path:
+                # 先写到临时文件，持有文件锁后再与新日志一起替换上线
+                generation = uuid.uuid4().hex
+                staged_path = f"{self.path}.merge.{generation}"
+                write_index_file(
+                    staged_path, merged.bm25, merged.documents,
+                    extra_header={"tokenizer": self.tokenizer.name, "generation": generation},
+                    positional=merged.positional,
+                    metadata=merged.metadata
+                )
+
+            try:
+                with self._write_lock, _file_lock(self.path if staged_path else None):
+                    if staged_path:
+                        # 其他进程在合并期间的写入先应用到当前快照，随后一并写入新日志
+                        self._sync_from_disk()
+                    current = self.snapshot
+                    n_merged = len(snapshot.segments)
+                    if current.segments[:n_merged] != snapshot.segments:
+                        # 其他进程的全量合并已替换基础段，本次合并结果作废
+                        return False
+                    self._publish_merge(snapshot, current, first, merged, doc_maps, generation, staged_path)
+            finally:
+                if staged_path and os.path.exists(staged_path):
+                    os.remove(staged_path)
+            self._stats["major_merges" if major else "minor_merges"] += 1
+            return True
+
+    def _publish_merge(
+        self,
+        snapshot: SegmentSnapshot,
+        current: SegmentSnapshot,
+        first: int,
+        merged: Segment,
+        doc_maps: List[np.ndarray],
+        generation: Optional[str],
+        staged_path: Optional[str]
+    ) -> None:
+        """
+        发布合并结果（须持有 _write_lock；staged_path 不为空时还须持有文件排他锁）
+
+        Args:
+            snapshot: 合并开始时的快照
+            current: 当前快照（包含合并期间的新增与删除）
+            first: 被合并的第一个段
+            merged: 合并后的段
+            doc_maps: 每个源段的 段内文档ID → 合并后文档ID 映射
+            generation: 合并后的 generation
+            staged_path: 全量合并写出的新基础段临时文件
+        """
+        n_merged = len(snapshot.segments)
+
+        # 合并期间新增的删除映射到合并后的段上
+        merged_mask = np.zeros(merged.doc_count, dtype=bool)
+        for i, doc_map in zip(range(first, n_merged), doc_maps):
+            now, then = current.deleted[i], snapshot.deleted[i]
+            if now is not None and now is not then:
+                newly = now & ~then if then is not None else now
+                targets = doc_map[newly]
+                merged_mask[targets[targets >= 0]] = True
+
+        later = list(zip(current.segments[n_merged:], current.deleted[n_merged:]))
+        if staged_path:
+            # 基础段改为 mmap 打开的新文件，合并期间新增的段按新词表重新分词
+            os.replace(staged_path, self.path)
+            bm25, documents, positional, metadata, _ = open_index_file(self.path)
+            merged = Segment(bm25, documents, positional, metadata)
+            later = [(self._build_segment(segment.documents, bm25.vocab), mask) for segment, mask in later]
+            ops = [
+                {"op": "add", "docs": [doc for j, doc in enumerate(segment.documents) if mask is None or not mask[j]]}
+                for segment, mask in later
+            ]
+            if merged_mask.any():
+                ops.append({"op": "delete", "ids": [], "source": None, "base": np.flatnonzero(merged_mask).tolist()})
+            _write_log(self.path, generation, ops)
+            self._log_offset = os.path.getsize(self.path + LOG_FILE_SUFFIX)
+            self.file_stamp = files_stamp(self.path)
+
+        self.snapshot = SegmentSnapshot(
+            current.segments[:first] + (merged,) + tuple(segment for segment, _ in later),
+            current.deleted[:first] + (merged_mask if merged_mask.any() else None,) + tuple(mask for _, mask in later),
+            generation
+        )
+
+    def _run_merges(self) -> None:
+        """按合并策略合并，直到不再需要合并（失败时保留当前快照，等待下一次触发）"""
+        try:
+            while self.merge():
+                pass
+        except Exception as e:
+            self._stats["merge_errors"] += 1
+            print(f"BM25段合并失败: {e}")
+
+    def _merge_loop(self) -> None:
+        while not self._closed:
+            self._merge_event.wait()
+            self._merge_event.clear()
+            if not self._closed:
+                self._run_merges()
+
+    def _schedule_merge(self) -> None:
+        if self._plan_merge(self.snapshot) is None:
+            return
+        if not self.background_merge:
+            self._run_merges()
+            return
+        if self._merge_thread is None or not self._merge_thread.is_alive():
+            self._merge_thread = threading.Thread(target=self._merge_loop, name="bm25-merge", daemon=True)
+            self._merge_thread.start()
+        self._merge_event.set()
+
+    def close(self) -> None:
+        """停止后台合并线程（正在进行的合并会完成）"""
+        self._closed = True
+        self._merge_event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """段数、文档数、删除数与合并次数"""
+        snapshot = self.snapshot
+        return {
+            "segments": len(snapshot.segments),
+            "doc_count": snapshot.doc_count,
+            "deleted": sum(snapshot.deleted_counts),
+            "generation": snapshot.generation,
+            **self._stats
+        }
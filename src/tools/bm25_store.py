@@ -0,0 +1,354 @@
+"""
+BM25 索引磁盘格式
+版本化的二进制文件，通过 mmap 打开：多个 worker 共享操作系统页缓存，冷启动只需读取文件头。
+
+文件布局：
+    [0:8)    魔数 b"BM25MMAP"
+    [8:12)   格式版本 (uint32, little-endian)
+    [12:16)  文件头 JSON 长度 (uint32)
+    [16:..)  文件头 JSON（参数、文档数、各数据段的偏移/长度/类型）
+    数据区（从 64 字节对齐处开始，每个数据段同样 64 字节对齐）：
+        vocab_offsets  uint64[V+1]  词表：按 UTF-8 字节序排序的词项在 vocab_blob 中的偏移
+        vocab_blob     uint8[]      词项 UTF-8 拼接
+        offsets        int64[V+1]   CSR 倒排表偏移（词项ID即排序后的位置）
+        post_docs      int32[P]     倒排表文档ID
+        post_tfs       int32[P]     倒排表词频
+        doc_lens       int32[N]     文档长度
+        idf            float64[V]   idf
+        upper_bounds   float64[V]   词项分数上界（默认 k1/b 下）
+        doc_offsets    uint64[N+1]  文档偏移表：第 i 个文档在 doc_blob 中的范围
+        doc_blob       uint8[]      文档 JSON（id / text / metadata）拼接
+    可选的位置索引数据段（文件头 positional 为 true 时存在，见 tools.bm25_positional）：
+        pos_term_slots   int32[V]    词项ID（排序后）→ 槽位
+        pos_slot_offsets int64[S+1]
+        pos_docs         int32[E]
+        pos_starts       int64[E+1]
+        pos_positions    int32[Q]
+    可选的元数据过滤索引数据段（文件头 metadata 存在时，见 tools.bm25_filters）：
+        文件头 metadata: {字段名: [取值键, ...]}，第 i 个字段的数据段为
+        meta_{i}_offsets int64[K+1]
+        meta_{i}_docs    int32[M]
+"""
+import os
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tools.bm25_filters import MetadataIndex
+from tools.bm25_index import BM25Index
+from tools.bm25_positional import PositionalIndex
+
+MAGIC = b"BM25MMAP"
+FORMAT_VERSION = 1
+INDEX_FILE_SUFFIX = ".bm25"
+_PREFIX = struct.Struct("<8sII")
+_ALIGN = 64
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class MmapVocabulary:
+    """
+    基于 mmap 的只读词表（二分查找），新增词项记录在进程内的覆盖字典中
+
+    提供 BM25Index 所需的 dict 子集接口：get / setdefault / __len__ / items。
+    """
+
+    def __init__(self, mm: mmap.mmap, term_offsets: np.ndarray, blob_start: int):
+        self._mm = mm
+        self._term_offsets = term_offsets
+        self._blob_start = blob_start
+        self._base_size = len(term_offsets) - 1
+        self._overlay: Dict[str, int] = {}
+
+    def _term_bytes(self, i: int) -> bytes:
+        start = self._blob_start + int(self._term_offsets[i])
+        end = self._blob_start + int(self._term_offsets[i + 1])
+        return self._mm[start:end]
+
+    def _lookup(self, key: bytes) -> Optional[int]:
+        lo, hi = 0, self._base_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            term = self._term_bytes(mid)
+            if term < key:
+                lo = mid + 1
+            elif term > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def get(self, term: str, default: Optional[int] = None) -> Optional[int]:
+        term_id = self._lookup(term.encode("utf-8"))
+        if term_id is not None:
+            return term_id
+        return self._overlay.get(term, default)
+
+    def setdefault(self, term: str, default: int) -> int:
+        term_id = self.get(term)
+        if term_id is None:
+            term_id = self._overlay.setdefault(term, default)
+        return term_id
+
+    def __len__(self) -> int:
+        return self._base_size + len(self._overlay)
+
+    def __contains__(self, term: str) -> bool:
+        return self.get(term) is not None
+
+    def items(self):
+        for i in range(self._base_size):
+            yield self._term_bytes(i).decode("utf-8"), i
+        yield from list(self._overlay.items())
+
+    def copy(self) -> "MmapVocabulary":
+        """复制词表（共享 mmap，只复制覆盖字典），用于在其他线程继续追加词项时得到稳定视图"""
+        vocab = MmapVocabulary(self._mm, self._term_offsets, self._blob_start)
+        vocab._overlay = dict(self._overlay)
+        return vocab
+
+
+class DocumentTable(Sequence):
+    """
+    基于 mmap 的文档表，按需解析单个文档的 JSON
+
+    支持追加（__add__）和按掩码筛选（select），都只产生新的视图，不复制文件内容。
+    """
+
+    def __init__(
+        self,
+        mm: mmap.mmap,
+        doc_offsets: np.ndarray,
+        blob_start: int,
+        extra: Optional[List[Dict[str, Any]]] = None,
+        positions: Optional[np.ndarray] = None
+    ):
+        self._mm = mm
+        self._doc_offsets = doc_offsets
+        self._blob_start = blob_start
+        self._base_size = len(doc_offsets) - 1
+        self._extra = extra or []
+        # 逻辑位置 → 物理位置（None 表示一一对应）；物理位置 >= base_size 指向 extra
+        self._positions = positions
+
+    def __len__(self) -> int:
+        if self._positions is not None:
+            return len(self._positions)
+        return self._base_size + len(self._extra)
+
+    def _physical(self, p: int) -> Dict[str, Any]:
+        if p >= self._base_size:
+            return self._extra[p - self._base_size]
+        start = self._blob_start + int(self._doc_offsets[p])
+        end = self._blob_start + int(self._doc_offsets[p + 1])
+        return json.loads(self._mm[start:end].decode("utf-8"))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("document index out of range")
+        p = int(self._positions[i]) if self._positions is not None else i
+        return self._physical(p)
+
+    def __add__(self, other: List[Dict[str, Any]]) -> "DocumentTable":
+        other = list(other)
+        positions = self._positions
+        if positions is not None:
+            start = self._base_size + len(self._extra)
+            positions = np.concatenate([positions, np.arange(start, start + len(other))])
+        return DocumentTable(self._mm, self._doc_offsets, self._blob_start, self._extra + other, positions)
+
+    def select(self, keep: np.ndarray) -> "DocumentTable":
+        """按布尔掩码保留文档（掩码长度等于 len(self)）"""
+        positions = self._positions if self._positions is not None else np.arange(len(self))
+        return DocumentTable(self._mm, self._doc_offsets, self._blob_start, self._extra, positions[keep])
+
+
+def _terms_by_id(vocab, vocab_size: int) -> List[str]:
+    """按词项ID排列词表（只取本索引范围内的词项）"""
+    terms: List[Optional[str]] = [None] * vocab_size
+    for term, term_id in vocab.items():
+        if term_id < vocab_size:
+            terms[term_id] = term
+    return terms
+
+
+def write_index_file(
+    path: str,
+    index: BM25Index,
+    documents: Sequence[Dict[str, Any]],
+    extra_header: Optional[Dict[str, Any]] = None,
+    positional: Optional[PositionalIndex] = None,
+    metadata: Optional[MetadataIndex] = None
+) -> None:
+    """
+    将索引和文档写入二进制文件（先写临时文件再原子替换）
+
+    Args:
+        path: 目标文件路径
+        index: BM25 索引
+        documents: 文档列表（与索引中的文档ID一一对应）
+        extra_header: 额外写入文件头的字段
+        positional: 位置索引（可选）
+        metadata: 元数据过滤索引（可选）
+    """
+    vocab_size = len(index.offsets) - 1
+    encoded = [term.encode("utf-8") for term in _terms_by_id(index.vocab, vocab_size)]
+
+    # 词项按字节序重新编号，读取时即可对 mmap 中的词表二分查找
+    order = np.array(sorted(range(vocab_size), key=encoded.__getitem__), dtype=np.int64)
+    counts = np.diff(index.offsets)[order]
+    offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    gather = np.repeat(index.offsets[:-1][order] - offsets[:-1], counts) + np.arange(int(offsets[-1]))
+
+    sorted_terms = [encoded[i] for i in order]
+    term_offsets = np.zeros(vocab_size + 1, dtype=np.uint64)
+    np.cumsum([len(t) for t in sorted_terms], out=term_offsets[1:])
+
+    doc_bytes = [json.dumps(doc, ensure_ascii=False).encode("utf-8") for doc in documents]
+    doc_offsets = np.zeros(len(doc_bytes) + 1, dtype=np.uint64)
+    np.cumsum([len(d) for d in doc_bytes], out=doc_offsets[1:])
+
+    sections = [
+        ("vocab_offsets", term_offsets),
+        ("vocab_blob", np.frombuffer(b"".join(sorted_terms), dtype=np.uint8)),
+        ("offsets", offsets),
+        ("post_docs", np.ascontiguousarray(index.post_docs[gather], dtype=np.int32)),
+        ("post_tfs", np.ascontiguousarray(index.post_tfs[gather], dtype=np.int32)),
+        ("doc_lens", np.ascontiguousarray(index.doc_lens, dtype=np.int32)),
+        ("idf", np.ascontiguousarray(index.idf[order], dtype=np.float64)),
+        ("upper_bounds", np.ascontiguousarray(index.upper_bounds[order], dtype=np.float64)),
+        ("doc_offsets", doc_offsets),
+        ("doc_blob", np.frombuffer(b"".join(doc_bytes), dtype=np.uint8)),
+    ]
+    if positional is not None:
+        # 槽位随词项一起按排序后的词项ID重排，位置数据本身与词项ID无关
+        term_slots = np.full(vocab_size, -1, dtype=np.int32)
+        covered = min(vocab_size, len(positional.term_slots))
+        term_slots[:covered] = positional.term_slots[:covered]
+        sections += [
+            ("pos_term_slots", np.ascontiguousarray(term_slots[order], dtype=np.int32)),
+            ("pos_slot_offsets", np.ascontiguousarray(positional.slot_offsets, dtype=np.int64)),
+            ("pos_docs", np.ascontiguousarray(positional.pos_docs, dtype=np.int32)),
+            ("pos_starts", np.ascontiguousarray(positional.pos_starts, dtype=np.int64)),
+            ("pos_positions", np.ascontiguousarray(positional.positions, dtype=np.int32)),
+        ]
+    metadata_values = None
+    if metadata is not None:
+        metadata_values = {}
+        for i, (field, (values, offsets, docs)) in enumerate(metadata.fields.items()):
+            metadata_values[field] = sorted(values, key=values.get)
+            sections += [
+                (f"meta_{i}_offsets", np.ascontiguousarray(offsets, dtype=np.int64)),
+                (f"meta_{i}_docs", np.ascontiguousarray(docs, dtype=np.int32)),
+            ]
+
+    table = {}
+    position = 0
+    for name, array in sections:
+        table[name] = [position, int(array.size), array.dtype.str]
+        position = _align(position + array.nbytes)
+
+    header = {
+        "doc_count": index.doc_count,
+        "vocab_size": vocab_size,
+        "k1": index.k1,
+        "b": index.b,
+        "epsilon": index.epsilon,
+        "positional": positional is not None,
+        "metadata": metadata_values,
+        "sections": table,
+        **(extra_header or {})
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = _align(_PREFIX.size + len(header_bytes))
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_start - _PREFIX.size - len(header_bytes)))
+        written = 0
+        for name, array in sections:
+            f.write(array.tobytes())
+            written += array.nbytes
+            f.write(b"\0" * (_align(written) - written))
+            written = _align(written)
+    os.replace(tmp_path, path)
+
+
+def open_index_file(
+    path: str
+) -> Tuple[BM25Index, DocumentTable, Optional[PositionalIndex], Optional[MetadataIndex], Dict[str, Any]]:
+    """
+    以 mmap 方式打开索引文件
+
+    只解析文件头，倒排表等数组直接是 mmap 上的只读视图，不会复制到进程堆内。
+
+    Args:
+        path: 索引文件路径
+
+    Returns:
+        (BM25Index, DocumentTable, PositionalIndex 或 None, MetadataIndex 或 None, 文件头字典)
+
+    Raises:
+        ValueError: 文件格式或版本不匹配
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, header_len = _PREFIX.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise ValueError(f"不是BM25索引文件: {path}")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"BM25索引文件版本不兼容: {version}（当前支持 {FORMAT_VERSION}）")
+
+    header = json.loads(mm[_PREFIX.size:_PREFIX.size + header_len].decode("utf-8"))
+    data_start = _align(_PREFIX.size + header_len)
+
+    def section(name: str) -> np.ndarray:
+        offset, count, dtype = header["sections"][name]
+        return np.frombuffer(mm, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+
+    vocab = MmapVocabulary(mm, section("vocab_offsets"), data_start + header["sections"]["vocab_blob"][0])
+    index = BM25Index(
+        vocab=vocab,
+        offsets=section("offsets"),
+        post_docs=section("post_docs"),
+        post_tfs=section("post_tfs"),
+        doc_lens=section("doc_lens"),
+        k1=header["k1"],
+        b=header["b"],
+        epsilon=header["epsilon"],
+        idf=section("idf"),
+        upper_bounds=section("upper_bounds")
+    )
+    documents = DocumentTable(mm, section("doc_offsets"), data_start + header["sections"]["doc_blob"][0])
+    positional = None
+    if header.get("positional"):
+        positional = PositionalIndex(
+            term_slots=section("pos_term_slots"),
+            slot_offsets=section("pos_slot_offsets"),
+            pos_docs=section("pos_docs"),
+            pos_starts=section("pos_starts"),
+            positions=section("pos_positions")
+        )
+    metadata = None
+    if header.get("metadata") is not None:
+        metadata = MetadataIndex({
+            field: ({key: j for j, key in enumerate(keys)}, section(f"meta_{i}_offsets"), section(f"meta_{i}_docs"))
+            for i, (field, keys) in enumerate(header["metadata"].items())
+        })
+    return index, documents, positional, metadata, header
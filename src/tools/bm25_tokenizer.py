@@ -0,0 +1,362 @@
+"""
+BM25 分词器
+将文本切分为词项，并批量驻留（intern）到索引共享的词表中，直接产出 (doc_id, term_id, tf) 数组
+
+两种模式（配置项 bm25.tokenizer）：
+    ngram: 1~4 字 n-gram，与旧版 _tokenize 结果完全一致（兼容模式，默认）
+    dict:  词典 + Trie 正向最大匹配，词项数量远少于 n-gram，索引更小
+"""
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 编码结果：(doc_ids, term_ids, tfs, doc_lens)，三元组按 doc_id 升序，可直接交给 BM25Index.from_arrays
+EncodedBatch = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+# 位置结果：(doc_ids, term_ids, positions)
+PositionBatch = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# Unicode 空白字符（str.isspace 为真的码点都不超过 U+3000）
+_WHITESPACE = np.array([c for c in range(0x3001) if chr(c).isspace()], dtype=np.uint32)
+
+
+def _code_points(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+
+
+def _decode(key) -> str:
+    return key.tobytes().decode("utf-32-le", errors="surrogatepass")
+
+
+def _intern(terms: List[str], vocab: Dict[str, int]) -> List[int]:
+    """查词表并为新词项顺序分配ID（terms 内部不重复）"""
+    ids = list(map(vocab.get, terms))
+    missing = [i for i, term_id in enumerate(ids) if term_id is None]
+    if missing and isinstance(vocab, dict):
+        new_ids = range(len(vocab), len(vocab) + len(missing))
+        vocab.update(zip([terms[i] for i in missing], new_ids))
+        for i, term_id in zip(missing, new_ids):
+            ids[i] = term_id
+    else:
+        for i in missing:
+            ids[i] = vocab.setdefault(terms[i], len(vocab))
+    return ids
+
+
+class BaseTokenizer(ABC):
+    """分词器基类：子类实现 tokenize，encode_batch 默认逐文档计数后驻留词表"""
+
+    name = "base"
+
+    @abstractmethod
+    def tokenize(self, text: str) -> List[str]:
+        """把文本切分为词项（按出现顺序，含重复）"""
+
+    def encode_batch(self, texts: Sequence[str], vocab: Dict[str, int]) -> EncodedBatch:
+        """
+        批量分词并驻留词表
+
+        Args:
+            texts: 文本列表
+            vocab: 词项 → 词项ID（原地扩展，新词项ID从 len(vocab) 开始）
+
+        Returns:
+            (doc_ids, term_ids, tfs, doc_lens)，doc_id 为批内序号
+        """
+        doc_ids: List[int] = []
+        term_ids: List[int] = []
+        tfs: List[int] = []
+        doc_lens = np.zeros(len(texts), dtype=np.int32)
+        for i, text in enumerate(texts):
+            tokens = self.tokenize(text)
+            doc_lens[i] = len(tokens)
+            counts = Counter(tokens)
+            term_ids.extend([vocab.setdefault(term, len(vocab)) for term in counts])
+            tfs.extend(counts.values())
+            doc_ids.extend([i] * len(counts))
+        return (
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(tfs, dtype=np.int32),
+            doc_lens
+        )
+
+    # ---------- 位置索引（短语 / 邻近度加权）所需接口 ----------
+
+    def token_positions(self, texts: Sequence[str], vocab: Dict[str, int]) -> PositionBatch:
+        """
+        批量产出已在词表中的位置词项出现位置（不扩展词表）
+
+        位置的单位由分词器决定，只要求同一短语中相邻单元（phrase_units）的位置相差 1。
+
+        Args:
+            texts: 文本列表
+            vocab: 词项 → 词项ID
+
+        Returns:
+            (doc_ids, term_ids, positions)，doc_id 为批内序号
+        """
+        doc_ids: List[int] = []
+        term_ids: List[int] = []
+        positions: List[int] = []
+        for i, text in enumerate(texts):
+            for position, token in enumerate(self.tokenize(text)):
+                term_id = vocab.get(token)
+                if term_id is not None and self.positional_term(token):
+                    doc_ids.append(i)
+                    term_ids.append(term_id)
+                    positions.append(position)
+        return (
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(positions, dtype=np.int32)
+        )
+
+    def positional_term(self, term: str) -> bool:
+        """该词项是否需要记录位置"""
+        return True
+
+    def phrase_units(self, segment: str) -> List[str]:
+        """把查询片段拆成相邻位置依次加 1 的位置词项序列"""
+        return self.tokenize(segment)
+
+    def phrase_span(self, units: int) -> int:
+        """连续匹配 units 个单元时覆盖的片段长度（与 phrase_span(len(phrase_units(s))) 同一量纲）"""
+        return units
+
+
+class NgramTokenizer(BaseTokenizer):
+    """
+    n-gram 分词器（兼容模式）
+
+    每个位置产出长度 max_n..min_n 的子串，单字为空白时跳过；结果的多重集合与旧版 _tokenize
+    完全一致。批量编码时把整批文本拼成一个码点数组，用滑动窗口视图一次性生成所有 n-gram，
+    每个不同的 n-gram 在一批内只解码、查词表一次。
+    """
+
+    name = "ngram"
+
+    def __init__(self, min_n: int = 1, max_n: int = 4):
+        self.min_n = min_n
+        self.max_n = max_n
+
+    def tokenize(self, text: str) -> List[str]:
+        if not text:
+            return []
+        cps = _code_points(text)
+        tokens: List[str] = []
+        for n in range(self.min_n, self.max_n + 1):
+            if len(cps) < n:
+                break
+            windows = sliding_window_view(cps, n)
+            if n == 1:
+                windows = windows[~np.isin(cps, _WHITESPACE)]
+            keys = np.ascontiguousarray(windows).view(f"V{4 * n}").ravel()
+            uniq, counts = np.unique(keys, return_counts=True)
+            for key, count in zip(uniq, counts.tolist()):
+                tokens.extend([_decode(key)] * count)
+        return tokens
+
+    def _iter_ngrams(self, texts: Sequence[str], sizes: Sequence[int]):
+        """
+        按长度逐个产出整批文本的 n-gram
+
+        Yields:
+            (文档ID数组, 文档内位置数组, 不同 n-gram 列表, 每个窗口在该列表中的下标)
+        """
+        lengths = np.array([len(t) for t in texts], dtype=np.int64)
+        if not lengths.sum():
+            return
+
+        # 码点先映射到批内字母表，n 个字母编码成一个 int64 键（字母表过大时退回字节键）
+        alphabet, letters = np.unique(_code_points("".join(texts)), return_inverse=True)
+        letters = letters.ravel().astype(np.int64)
+        base = np.int64(len(alphabet))
+        packed = len(alphabet) ** self.max_n < 2 ** 62
+
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        pos_doc = np.repeat(np.arange(len(texts)), lengths)
+        pos_end = ends[pos_doc]
+        not_space = ~np.isin(alphabet, _WHITESPACE)[letters]
+
+        for n in sizes:
+            count = len(letters) - n + 1
+            if count <= 0:
+                break
+            # 只保留不跨越文档边界的窗口
+            valid = np.arange(count) + n <= pos_end[:count]
+            if n == 1:
+                valid &= not_space[:count]
+            windows = sliding_window_view(letters, n)[valid]
+            if not len(windows):
+                continue
+            if packed:
+                keys = np.zeros(len(windows), dtype=np.int64)
+                for j in range(n):
+                    keys = keys * base + windows[:, j]
+                uniq, inverse = np.unique(keys, return_inverse=True)
+                digits = np.empty((len(uniq), n), dtype=np.int64)
+                rest = uniq
+                for j in range(n - 1, -1, -1):
+                    digits[:, j] = rest % base
+                    rest = rest // base
+            else:
+                keys = np.ascontiguousarray(windows).view(f"V{8 * n}").ravel()
+                uniq, inverse = np.unique(keys, return_inverse=True)
+                digits = uniq.view(np.int64).reshape(-1, n)
+            # 一次解码所有不同的 n-gram，再按 n 个字符切开
+            joined = _decode(np.ascontiguousarray(alphabet[digits]))
+            terms = list(map(joined.__getitem__, map(slice, range(0, len(joined), n), range(n, len(joined) + n, n))))
+            positions = np.flatnonzero(valid)
+            docs = pos_doc[positions]
+            yield docs, positions - starts[docs], terms, inverse.ravel()
+
+    def encode_batch(self, texts: Sequence[str], vocab: Dict[str, int]) -> EncodedBatch:
+        doc_parts: List[np.ndarray] = [np.zeros(0, dtype=np.int64)]
+        term_parts: List[np.ndarray] = [np.zeros(0, dtype=np.int64)]
+        for docs, _, terms, inverse in self._iter_ngrams(texts, range(self.min_n, self.max_n + 1)):
+            ids = np.array(_intern(terms, vocab), dtype=np.int64)
+            doc_parts.append(docs)
+            term_parts.append(ids[inverse])
+
+        docs = np.concatenate(doc_parts)
+        terms = np.concatenate(term_parts)
+        doc_lens = np.bincount(docs, minlength=len(texts)).astype(np.int32)
+
+        # (doc, term) 去重计数，结果按 doc_id 升序
+        width = np.int64(max(len(vocab), 1))
+        pairs, tfs = np.unique(docs * width + terms, return_counts=True)
+        return (pairs // width).astype(np.int32), pairs % width, tfs.astype(np.int32), doc_lens
+
+    def token_positions(self, texts: Sequence[str], vocab: Dict[str, int]) -> PositionBatch:
+        # 只有最长的 n-gram 需要位置：更短的短语本身就是一个词项，更长的短语由相邻 max_n-gram 串联验证
+        doc_parts: List[np.ndarray] = [np.zeros(0, dtype=np.int64)]
+        term_parts: List[np.ndarray] = [np.zeros(0, dtype=np.int64)]
+        pos_parts: List[np.ndarray] = [np.zeros(0, dtype=np.int64)]
+        for docs, positions, terms, inverse in self._iter_ngrams(texts, [self.max_n]):
+            ids = np.array([-1 if i is None else i for i in map(vocab.get, terms)], dtype=np.int64)[inverse]
+            known = ids >= 0
+            doc_parts.append(docs[known])
+            term_parts.append(ids[known])
+            pos_parts.append(positions[known])
+        return (
+            np.concatenate(doc_parts).astype(np.int32),
+            np.concatenate(term_parts),
+            np.concatenate(pos_parts).astype(np.int32)
+        )
+
+    def positional_term(self, term: str) -> bool:
+        return len(term) == self.max_n
+
+    def phrase_units(self, segment: str) -> List[str]:
+        n = self.max_n
+        return [segment[i:i + n] for i in range(len(segment) - n + 1)]
+
+    def phrase_span(self, units: int) -> int:
+        return units + self.max_n - 1 if units else 0
+
+
+class DictionaryTokenizer(BaseTokenizer):
+    """
+    词典分词器（Trie 正向最大匹配）
+
+    中文按词典做最长匹配，未登录字按单字输出；字母数字串整体小写输出；空白和标点丢弃。
+    """
+
+    name = "dict"
+    _WORD = re.compile(r"[0-9a-z_]+")
+
+    def __init__(self, words: Sequence[str] = ()):
+        self._trie: Dict[str, dict] = {}
+        self.max_len = 1
+        for word in words:
+            self.add_word(word)
+
+    @classmethod
+    def from_file(cls, path: str) -> "DictionaryTokenizer":
+        """从词典文件加载（每行一个词，# 开头为注释；每行第一列为词）"""
+        words = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    words.append(line.split()[0])
+        return cls(words)
+
+    def add_word(self, word: str) -> None:
+        word = word.strip().lower()
+        if not word:
+            return
+        node = self._trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+        self.max_len = max(self.max_len, len(word))
+
+    def tokenize(self, text: str) -> List[str]:
+        if not text:
+            return []
+        text = text.lower()
+        tokens: List[str] = []
+        i, n = 0, len(text)
+        while i < n:
+            ch = text[i]
+            if ch.isspace() or not ch.isalnum():
+                i += 1
+                continue
+            if ch.isascii():
+                match = self._WORD.match(text, i)
+                if match:
+                    tokens.append(match.group())
+                    i = match.end()
+                    continue
+            # 最长匹配：沿 Trie 向前走，记录最后一个完整词的位置
+            node, end, j = self._trie, i + 1, i
+            while j < n and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if "" in node:
+                    end = j
+            tokens.append(text[i:end])
+            i = end
+        return tokens
+
+
+_tokenizers: Dict[str, BaseTokenizer] = {}
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer(name: Optional[str] = None) -> BaseTokenizer:
+    """
+    获取分词器实例（按名称缓存）
+
+    Args:
+        name: 分词器名称（ngram / dict），默认读取配置 bm25.tokenizer
+
+    Returns:
+        分词器实例
+    """
+    from utils.config_loader import get_config
+    config = get_config()
+    name = name or config.get("bm25.tokenizer", "ngram")
+
+    with _tokenizer_lock:
+        tokenizer = _tokenizers.get(name)
+        if tokenizer is None:
+            if name == "ngram":
+                tokenizer = NgramTokenizer()
+            elif name == "dict":
+                path = Path(config.get("bm25.dictionary_path", "config/bm25_dict.txt"))
+                if not path.is_absolute():
+                    path = Path(__file__).resolve().parent.parent.parent / path
+                tokenizer = DictionaryTokenizer.from_file(str(path)) if path.exists() else DictionaryTokenizer()
+            else:
+                raise ValueError(f"未知的BM25分词器: {name}")
+            _tokenizers[name] = tokenizer
+        return tokenizer
@@ -252,15 +252,29 @@ def get_hierarchy_path(
 def search_by_hierarchy(
     collection_name: str = "knowledge_base",
     level: Optional[int] = None,
-    section_title: Optional[str] = None
+    section_title: Optional[str] = None,
+    query: Optional[str] = None,
+    source: Optional[str] = None,
+    parent_id: Optional[str] = None,
+    child_only: bool = False,
+    top_k: int = 5
 ) -> str:
     """
     根据文档结构搜索
 
+    给出 query 时在指定范围内做 BM25 全文检索：范围由 source（来源文件）、parent_id（父块）
+    和 child_only（只检索子块，即 is_parent 为 false 的文本块）限定，过滤在打分时生效，
+    返回的始终是范围内的 top_k，而不是全库 top_k 过滤后的剩余部分。
+
     Args:
         collection_name: 向量集合名称
         level: 层级（可选）
         section_title: 章节标题（可选）
+        query: 检索文本（可选）
+        source: 只检索该来源文件（可选）
+        parent_id: 只检索该父块下的文本块（可选）
+        child_only: 是否只检索子块
+        top_k: 返回的文本块数量
 
     Returns:
         JSON 格式的搜索结果
@@ -275,6 +289,40 @@ def search_by_hierarchy(
             "results": []
         }
 
+        if query:
+            from tools.bm25_retriever import _bm25_retrieve_internal
+
+            metadata_filters: Dict[str, Any] = {}
+            if source:
+                metadata_filters["source"] = source
+            if parent_id:
+                metadata_filters["parent_id"] = parent_id
+            if child_only:
+                metadata_filters["is_parent"] = False
+            result["filters"].update(metadata_filters)
+
+            bm25_result = json.loads(_bm25_retrieve_internal(
+                query,
+                collection_name=collection_name,
+                top_k=top_k,
+                filters=json.dumps(metadata_filters, ensure_ascii=False) if metadata_filters else None
+            ))
+            result["query"] = query
+            result["results"] = [
+                {
+                    "document_name": item["metadata"].get("source", ""),
+                    "parent_id": item["metadata"].get("parent_id"),
+                    "chunk_index": item["metadata"].get("chunk_index"),
+                    "content": item["document"],
+                    "score": item["bm25_score"],
+                    "match_type": "bm25"
+                }
+                for item in bm25_result.get("results", [])
+            ]
+            if bm25_result.get("error"):
+                result["error"] = bm25_result["error"]
+            return json.dumps(result, ensure_ascii=False, indent=2)
+
         # 模拟搜索结果
         if section_title:
             result["results"] = [
@@ -0,0 +1,202 @@
+"""
+持久化 Embedding 缓存（按内容寻址）
+在 Embedding 模型前加一层 SQLite 缓存，键为 (模型, sha256(文本块内容))，值为 float32 向量。
+重新入库同一文档时，内容未变的文本块直接取缓存向量，只有未命中的文本块才调用 API。
+
+    CachedEmbeddings:        包装任意 LangChain Embeddings，embed_documents 先查缓存
+    track_embedding_cache(): 统计一次入库（当前上下文内）的命中 / 未命中数，用于按入库报告命中率
+
+查询向量（embed_query）不写入磁盘缓存。
+"""
+import contextvars
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def text_hash(text: str) -> str:
+    """文本块内容哈希"""
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite 向量缓存（线程安全）"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite 文件路径（":memory:" 为内存库）
+        """
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+        self._hits = 0
+        self._misses = 0
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        """批量读取向量，返回命中的 哈希 → 向量"""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite 默认最多 999 个绑定参数
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                    [model, *part]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            hits = sum(1 for h in hashes if h in found)
+            self._hits += hits
+            self._misses += len(hashes) - hits
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        """批量写入向量"""
+        rows = []
+        for key, vector in items.items():
+            array = np.asarray(vector, dtype=np.float32)
+            rows.append((model, key, int(array.shape[0]), array.tobytes()))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计（命中 / 未命中按文本块计）"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self._hits + self._misses
+            return {
+                "path": self.path,
+                "entries": entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+
+_ingest_stats: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("embedding_cache_ingest", default=None)
+
+
+@contextmanager
+def track_embedding_cache() -> Iterator[Dict[str, Any]]:
+    """
+    统计当前上下文内的 Embedding 缓存命中情况
+
+    用法:
+        with track_embedding_cache() as stats:
+            vector_store.add_documents(docs)
+        stats  # {"hits", "misses", "hit_rate"}
+    """
+    stats = {"hits": 0, "misses": 0, "hit_rate": 0.0}
+    token = _ingest_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _ingest_stats.reset(token)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+
+
+class CachedEmbeddings(Embeddings):
+    """带持久化缓存的 Embeddings 包装（只把未命中的文本块送给底层模型）"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: Optional[str] = None):
+        """
+        Args:
+            embeddings: 底层 Embeddings
+            cache: 向量缓存
+            model: 缓存键中的模型名（默认取底层 Embeddings 的 model 属性）
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+
+    def _lookup(self, texts: List[str]) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+        """查缓存，返回 (各文本哈希, 命中的向量, 需要嵌入的 哈希 → 文本)"""
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model, hashes)
+        stats = _ingest_stats.get()
+        if stats is not None:
+            hits = sum(1 for h in hashes if h in vectors)
+            stats["hits"] += hits
+            stats["misses"] += len(texts) - hits
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(hashes, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        return hashes, vectors, missing
+
+    def _store(self, missing: Dict[str, str], embedded: List[List[float]], vectors: Dict[str, List[float]]) -> None:
+        # 与缓存读出的精度一致，同一文本块每次入库得到相同的向量
+        new_vectors = {
+            key: np.asarray(vector, dtype=np.float32).tolist()
+            for key, vector in zip(missing.keys(), embedded)
+        }
+        self.cache.put_many(self.model, new_vectors)
+        vectors.update(new_vectors)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        hashes, vectors, missing = self._lookup(texts)
+        if missing:
+            self._store(missing, self.embeddings.embed_documents(list(missing.values())), vectors)
+        return [vectors[key] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # SQLite 读写是本地小查询，直接在事件循环内执行；只有未命中的文本块异步请求 API
+        if not texts:
+            return []
+        hashes, vectors, missing = self._lookup(texts)
+        if missing:
+            self._store(missing, await self.embeddings.aembed_documents(list(missing.values())), vectors)
+        return [vectors[key] for key in hashes]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """获取全局 Embedding 缓存（embedding.cache.enabled 关闭时返回 None）"""
+    global _cache
+    from utils.config_loader import get_config
+    config = get_config()
+    if str(config.get("embedding.cache.enabled", True)).lower() not in ("true", "1"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(config.get("embedding.cache.path", "tmp/embedding_cache.sqlite3"))
+    return _cache
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    """Embedding 缓存统计（未创建时为空）"""
+    return _cache.get_stats() if _cache is not None else {}
@@ -8,7 +8,7 @@ from typing import Optional
 import glob
 from langchain.tools import tool
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_model
 from utils.runtime_ctx import Context, default_headers
 
 
@@ -21,19 +21,15 @@ def _call_llm(ctx: Context, messages: list, config: dict) -> str:
     api_key = os.getenv(llm_cfg.get("api_key_env", "SILICONFLOW_API_KEY"))
     base_url = os.getenv(llm_cfg.get("base_url_env", "SILICONFLOW_BASE_URL"))
 
-    llm = ChatOpenAI(
+    llm = get_chat_model(
         model=llm_cfg.get("model", "deepseek-ai/DeepSeek-V3.2"),
         api_key=api_key,
         base_url=base_url,
-        streaming=True,
         temperature=config.get("temperature", llm_cfg.get("temperature", 0.2)),
-        max_completion_tokens=config.get("max_completion_tokens", llm_cfg.get("max_tokens", 2048)),
-        extra_body={
-            "thinking": {
-                "type": config.get("thinking", llm_cfg.get("thinking", "disabled"))
-            }
-        },
-        default_headers=default_headers(ctx) if ctx else {}
+        thinking=config.get("thinking", llm_cfg.get("thinking", "disabled")),
+        headers=default_headers(ctx) if ctx else {},
+        streaming=True,
+        max_completion_tokens=config.get("max_completion_tokens", llm_cfg.get("max_tokens", 2048))
     )
 
     full_response = ""
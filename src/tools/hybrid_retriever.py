@@ -3,194 +3,238 @@
 结合向量检索和BM25全文检索，实现更精确的检索
 """
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from langchain.tools import tool
 
 # 导入相关工具
 from tools.bm25_retriever import _bm25_retrieve_internal as bm25_retrieve_func
 from tools.reranker_tool import rerank_documents
+from tools.adaptive_depth import DepthController
+from tools.score_fusion import AlignedCandidates, align_candidates, available_fusers, fuse_scores, rank_fused
+
+# 向量 / BM25 两路检索共用的线程池，首次使用时按配置创建
+_leg_executor: Optional[ThreadPoolExecutor] = None
+_leg_executor_lock = threading.Lock()
+# 对比检索的视图计算（含 Rerank）使用独立的有界线程池，不占用检索路的线程
+_compare_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _hybrid_config() -> Dict[str, Any]:
+    """混合检索并发配置（rag.hybrid.*）"""
+    from utils.config_loader import get_config
+    config = get_config()
+    return {
+        "deadline_ms": float(config.get("rag.hybrid.deadline_ms", 3000)),
+        "max_workers": int(config.get("rag.hybrid.max_workers", 8)),
+        "compare_workers": int(config.get("rag.hybrid.compare_workers", 4)),
+        "statement_timeout_ms": float(config.get("rag.hybrid.statement_timeout_ms", 5000))
+    }
 
 
-def _normalize_scores(scores: List[float], method: str = "minmax") -> List[float]:
-    """
-    归一化分数到[0, 1]区间
+def _get_leg_executor() -> ThreadPoolExecutor:
+    """获取检索线程池（容量由 rag.hybrid.max_workers 配置）"""
+    global _leg_executor
+    if _leg_executor is None:
+        with _leg_executor_lock:
+            if _leg_executor is None:
+                _leg_executor = ThreadPoolExecutor(
+                    max_workers=_hybrid_config()["max_workers"],
+                    thread_name_prefix="hybrid-leg"
+                )
+    return _leg_executor
+
+
+def _get_compare_executor() -> ThreadPoolExecutor:
+    """获取对比检索视图计算的线程池（容量由 rag.hybrid.compare_workers 配置）"""
+    global _compare_executor
+    if _compare_executor is None:
+        with _leg_executor_lock:
+            if _compare_executor is None:
+                _compare_executor = ThreadPoolExecutor(
+                    max_workers=_hybrid_config()["compare_workers"],
+                    thread_name_prefix="hybrid-compare"
+                )
+    return _compare_executor
 
-    Args:
-        scores: 原始分数列表
-        method: 归一化方法（minmax=最小-最大归一化，sigmoid=Sigmoid归一化）
 
-    Returns:
-        归一化后的分数列表
+def _run_legs(
+    legs: Dict[str, Callable[[], List[Dict[str, Any]]]],
+    deadline_ms: float,
+    executor: Optional[ThreadPoolExecutor] = None
+) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, float], List[str]]:
     """
-    if not scores:
-        return []
+    并发执行各路检索，最多等待 deadline_ms
 
-    # 转换为numpy数组
-    scores_array = np.array(scores, dtype=float)
+    超时或失败的一路不再等待，返回结果中缺少该路，由调用方标记为降级。
+    已在执行的任务无法取消，会在后台跑完（结果丢弃）并继续占用线程，
+    因此各路检索自身必须有硬超时（查询向量的 embedding.query_timeout、pgvector 的 statement_timeout），
+    线程池不会被卡住的请求耗尽。
 
-    if method == "minmax":
-        # 最小-最大归一化
-        min_score = float(np.min(scores_array))
-        max_score = float(np.max(scores_array))
-        if max_score - min_score > 0:
-            normalized = (scores_array - min_score) / (max_score - min_score)
-        else:
-            normalized = np.ones_like(scores_array) * 0.5
-    elif method == "sigmoid":
-        # Sigmoid归一化（适合分数范围较大的情况）
-        normalized = 1 / (1 + np.exp(-scores_array))
-    else:
-        # 默认使用minmax
-        return _normalize_scores(scores, "minmax")
+    Args:
+        legs: 检索路名称 → 返回文档列表的函数
+        deadline_ms: 截止时间（毫秒，从调用开始计）
+        executor: 执行各路的线程池（None 表示检索路线程池）
 
-    return normalized.tolist()
+    Returns:
+        (各路结果, 各路耗时（毫秒，只含按时完成的）, 超时或失败的检索路)
+    """
+    start = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    def timed(name: str, func: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        leg_start = time.perf_counter()
+        try:
+            return func()
+        finally:
+            timings[name] = (time.perf_counter() - leg_start) * 1000
+
+    executor = executor or _get_leg_executor()
+    futures = {name: executor.submit(timed, name, func) for name, func in legs.items()}
+    wait(list(futures.values()), timeout=max(deadline_ms, 0.0) / 1000)
+
+    outputs: Dict[str, List[Dict[str, Any]]] = {}
+    missing: List[str] = []
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            missing.append(name)
+            print(f"{name}检索超过截止时间 {deadline_ms:.0f}ms，跳过")
+            continue
+        try:
+            outputs[name] = future.result()
+        except Exception as e:
+            missing.append(name)
+            print(f"{name}检索失败: {e}")
+    timings = {name: timings[name] for name in outputs if name in timings}
+    timings["total"] = (time.perf_counter() - start) * 1000
+    return outputs, timings, missing
 
 
 def _merge_results(
     vector_results: List[Dict[str, Any]],
-    bm25_results: List[Dict[str, Any]],
-    vector_weight: float,
-    bm25_weight: float
-) -> List[Dict[str, Any]]:
+    bm25_results: List[Dict[str, Any]]
+) -> AlignedCandidates:
     """
-    融合向量检索和BM25检索的结果
+    按文本块标识对齐向量检索和BM25检索的结果
+
+    两路结果都带有 pgvector 行ID（id）时按行ID对齐，否则按去空白后的内容哈希对齐。
 
     Args:
         vector_results: 向量检索结果
         bm25_results: BM25检索结果
-        vector_weight: 向量检索权重
-        bm25_weight: BM25检索权重
 
     Returns:
-        融合后的结果列表
+        对齐后的候选（第 0 行为向量检索，第 1 行为BM25检索）
     """
-    # 创建文档ID到结果的映射
-    vector_map = {}
-    for i, result in enumerate(vector_results):
-        # 使用文档内容或索引作为唯一标识
-        doc_id = result.get("document", "").strip()[:50]  # 使用前50个字符作为ID
-        vector_map[doc_id] = {
-            "result": result,
-            "vector_score": result.get("vector_score", result.get("score", 0)),
-            "bm25_score": 0.0,
-            "index": i
-        }
-
-    bm25_map = {}
-    for i, result in enumerate(bm25_results):
-        doc_id = result.get("document", "").strip()[:50]
-        bm25_map[doc_id] = {
-            "result": result,
-            "bm25_score": result.get("bm25_score", result.get("score", 0)),
-            "vector_score": 0.0,
-            "index": i
-        }
-
-    # 合并两个映射
-    all_doc_ids = set(vector_map.keys()) | set(bm25_map.keys())
-
-    merged_results = []
-
-    for doc_id in all_doc_ids:
-        if doc_id in vector_map and doc_id in bm25_map:
-            # 文档在两个检索结果中都存在
-            vector_data = vector_map[doc_id]
-            bm25_data = bm25_map[doc_id]
-
-            merged_results.append({
-                "document": vector_data["result"].get("document", ""),
-                "metadata": vector_data["result"].get("metadata", {}),
-                "vector_score": float(vector_data["vector_score"]),
-                "bm25_score": float(bm25_data["bm25_score"]),
-                "vector_rank": vector_data["index"],
-                "bm25_rank": bm25_data["index"]
-            })
-
-        elif doc_id in vector_map:
-            # 文档只在向量检索结果中
-            vector_data = vector_map[doc_id]
-            merged_results.append({
-                "document": vector_data["result"].get("document", ""),
-                "metadata": vector_data["result"].get("metadata", {}),
-                "vector_score": float(vector_data["vector_score"]),
-                "bm25_score": 0.0,
-                "vector_rank": vector_data["index"],
-                "bm25_rank": -1
-            })
-
-        else:
-            # 文档只在BM25检索结果中
-            bm25_data = bm25_map[doc_id]
-            merged_results.append({
-                "document": bm25_data["result"].get("document", ""),
-                "metadata": bm25_data["result"].get("metadata", {}),
-                "vector_score": 0.0,
-                "bm25_score": float(bm25_data["bm25_score"]),
-                "vector_rank": -1,
-                "bm25_rank": bm25_data["index"]
-            })
-
-    return merged_results
+    return align_candidates(
+        [vector_results, bm25_results],
+        [("vector_score", "score"), ("bm25_score", "score")]
+    )
 
 
 def _calculate_hybrid_score(
-    merged_results: List[Dict[str, Any]],
+    aligned: AlignedCandidates,
     vector_weight: float,
     bm25_weight: float,
     score_method: str = "weighted"
-) -> List[Tuple[int, float]]:
+) -> np.ndarray:
     """
     计算混合检索分数
 
     Args:
-        merged_results: 融合后的结果列表
+        aligned: 对齐后的候选
         vector_weight: 向量检索权重
         bm25_weight: BM25检索权重
-        score_method: 分数计算方法
+        score_method: 融合方法名称（见 tools.score_fusion.available_fusers）
 
     Returns:
-        (索引, 分数)的排序列表
+        float64[N] 混合分数
     """
-    vector_scores = [r.get("vector_score", 0) for r in merged_results]
-    bm25_scores = [r.get("bm25_score", 0) for r in merged_results]
-
-    # 归一化分数
-    vector_normalized = _normalize_scores(vector_scores)
-    bm25_normalized = _normalize_scores(bm25_scores)
-
-    hybrid_scores = []
-
-    for i, result in enumerate(merged_results):
-        vec_score = vector_normalized[i]
-        bm25_score = bm25_normalized[i]
-
-        if score_method == "weighted":
-            # 加权平均
-            hybrid_score = vec_score * vector_weight + bm25_score * bm25_weight
-
-        elif score_method == "rrf":
-            # Reciprocal Rank Fusion（倒数排名融合）
-            k = 60  # RRF常数
-            vec_rank = result.get("vector_rank", -1)
-            bm25_rank = result.get("bm25_rank", -1)
+    return fuse_scores(aligned, [vector_weight, bm25_weight], score_method)
+
+
+def _fused_result(aligned: AlignedCandidates, slot: int, hybrid_score: float) -> Dict[str, Any]:
+    """组装一个融合后的结果"""
+    source = aligned.results[slot]
+    return {
+        "chunk_id": aligned.chunk_ids[slot],
+        "document": source.get("document", ""),
+        "metadata": source.get("metadata", {}),
+        "vector_score": float(aligned.scores[0, slot]),
+        "bm25_score": float(aligned.scores[1, slot]),
+        "vector_rank": int(aligned.ranks[0, slot]),
+        "bm25_rank": int(aligned.ranks[1, slot]),
+        "hybrid_score": float(hybrid_score)
+    }
 
-            vec_rrf = 1 / (k + vec_rank + 1) if vec_rank >= 0 else 0
-            bm25_rrf = 1 / (k + bm25_rank + 1) if bm25_rank >= 0 else 0
 
-            hybrid_score = vec_rrf * vector_weight + bm25_rrf * bm25_weight
+def _fuse_top_k(
+    aligned: AlignedCandidates,
+    top_k: int,
+    vector_weight: float,
+    bm25_weight: float,
+    score_method: str = "weighted"
+) -> List[Dict[str, Any]]:
+    """融合分数并取前 top_k 个结果（只为最终结果组装字典）"""
+    if not len(aligned):
+        return []
+    hybrid_scores = _calculate_hybrid_score(aligned, vector_weight, bm25_weight, score_method)
+    final_results = []
+    for slot in rank_fused(hybrid_scores, top_k):
+        result = _fused_result(aligned, int(slot), hybrid_scores[slot])
+        result["hybrid_rank"] = len(final_results) + 1
+        final_results.append(result)
+    return final_results
 
-        else:
-            # 默认使用加权平均
-            hybrid_score = vec_score * vector_weight + bm25_score * bm25_weight
 
-        result["hybrid_score"] = float(hybrid_score)
-        hybrid_scores.append((i, hybrid_score))
+def _rerank_fused(query: str, final_results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    用 Rerank 对融合结果重排
 
-    # 按分数降序排序
-    hybrid_scores.sort(key=lambda x: x[1], reverse=True)
+    Args:
+        query: 查询文本
+        final_results: 融合后的结果（原地写入 rerank_score / rerank_reason）
+        top_k: 返回的文档数量
 
-    return hybrid_scores
+    Returns:
+        按 Rerank 分数（没有时按混合分数）降序排列的结果
+    """
+    # 准备rerank输入
+    rerank_docs = []
+    for i, r in enumerate(final_results):
+        rerank_docs.append({
+            "content": r.get("document", ""),
+            "id": str(i),
+            "chunk_id": r.get("chunk_id"),
+            "metadata": r.get("metadata", {}),
+            "hybrid_score": r.get("hybrid_score", 0)
+        })
+
+    # 调用rerank
+    rerank_json = rerank_documents.invoke({
+        "query": query,
+        "documents": json.dumps(rerank_docs),
+        "top_n": top_k
+    })
+    rerank_results = json.loads(rerank_json)
+
+    # 更新最终结果
+    for ranked_doc in rerank_results:
+        doc_id = int(ranked_doc.get("id", "0"))
+        if doc_id < len(final_results):
+            final_results[doc_id]["rerank_score"] = ranked_doc.get("relevance_score", 0.5)
+            final_results[doc_id]["rerank_reason"] = ranked_doc.get("reason", "")
+
+    # 按rerank分数重新排序
+    return sorted(
+        final_results,
+        key=lambda x: x.get("rerank_score", x.get("hybrid_score", 0)),
+        reverse=True
+    )
 
 
 def _parse_vector_retrieval_result(result_str: str) -> List[Dict[str, Any]]:
@@ -226,34 +270,181 @@ def _get_vector_retrieval_documents(
 
     Returns:
         文档列表
+
+    Raises:
+        向量存储或查询失败时直接抛出，由 _run_legs 记为缺失的检索路（结果标记降级）
     """
-    try:
-        # 获取向量存储
-        from tools.vector_store import get_vector_store
-        vector_store = get_vector_store(collection_name=collection_name)
+    # 获取向量存储
+    from tools.vector_store import get_vector_store, statement_timeout
+    vector_store = get_vector_store(collection_name=collection_name)
 
-        # 执行相似度搜索
+    # 执行相似度搜索（查询向量有 embedding.query_timeout，SQL 有 statement_timeout，保证检索路线程按时释放）
+    with statement_timeout(_hybrid_config()["statement_timeout_ms"]):
         results = vector_store.similarity_search_with_score(
             query=query,
             k=initial_k
         )
 
-        # 转换为字典格式
-        documents = []
-        for doc, score in results:
-            documents.append({
-                "text": doc.page_content,
-                "document": doc.page_content,
-                "metadata": doc.metadata,
-                "vector_score": float(score),
-                "score": float(score)
-            })
+    # 转换为字典格式；PGVector 返回的是余弦距离（越小越相关），
+    # 融合要求分数越大越相关，因此 vector_score 取 1 - 距离，原始距离保留在 distance
+    documents = []
+    for doc, score in results:
+        documents.append({
+            "id": doc.id,
+            "text": doc.page_content,
+            "document": doc.page_content,
+            "metadata": doc.metadata,
+            "vector_score": 1.0 - float(score),
+            "distance": float(score),
+            "score": 1.0 - float(score)
+        })
+
+    return documents
+
+
+# 各检索方法依赖的检索路与展示用的分数字段（依次尝试）
+METHOD_LEGS: Dict[str, Tuple[str, ...]] = {
+    "vector": ("vector",),
+    "bm25": ("bm25",),
+    "hybrid": ("vector", "bm25"),
+    "hybrid_rerank": ("vector", "bm25")
+}
+METHOD_SCORE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "vector": ("vector_score",),
+    "bm25": ("bm25_score",),
+    "hybrid": ("hybrid_score",),
+    "hybrid_rerank": ("rerank_score", "hybrid_score")
+}
+
+
+class CandidatePool:
+    """
+    单次请求内的候选池
 
-        return documents
+    向量检索与BM25检索各执行一次（并发、共享截止时间），向量 / BM25 / 混合 / 混合+Rerank
+    都作为池上的视图计算，对比多种检索方法时不再重复嵌入查询和访问 pgvector。
+    """
 
-    except Exception as e:
-        print(f"向量检索失败: {e}")
-        return []
+    def __init__(
+        self,
+        query: str,
+        collection_name: Optional[str] = "knowledge_base",
+        documents: str = "[]",
+        depth: int = 15,
+        bm25_k1: Optional[float] = None,
+        bm25_b: Optional[float] = None
+    ):
+        """
+        Args:
+            query: 查询文本
+            collection_name: 向量集合名称
+            documents: 文档列表（JSON字符串），用于BM25检索
+            depth: 每路检索的候选数（需不小于各视图的 top_k）
+            bm25_k1: BM25参数k1（None 表示使用索引默认值）
+            bm25_b: BM25参数b（None 表示使用索引默认值）
+        """
+        self.query = query
+        self.collection_name = collection_name
+        self.documents = documents
+        self.depth = depth
+        self.bm25_k1 = bm25_k1
+        self.bm25_b = bm25_b
+        self.vector_docs: List[Dict[str, Any]] = []
+        self.bm25_docs: List[Dict[str, Any]] = []
+        self.aligned = _merge_results([], [])
+        self.timings: Dict[str, float] = {}
+        self.missing: List[str] = []
+
+    def fetch(self, deadline_ms: Optional[float] = None) -> "CandidatePool":
+        """并发执行两路检索并对齐（deadline_ms 为 None 时使用 rag.hybrid.deadline_ms）"""
+        if deadline_ms is None:
+            deadline_ms = _hybrid_config()["deadline_ms"]
+
+        def bm25_leg() -> List[Dict[str, Any]]:
+            bm25_result_str = bm25_retrieve_func(
+                query=self.query,
+                documents=self.documents,
+                collection_name=self.collection_name,
+                top_k=self.depth,
+                k1=self.bm25_k1,
+                b=self.bm25_b
+            )
+            return json.loads(bm25_result_str).get("results", [])
+
+        legs, self.timings, self.missing = _run_legs(
+            {
+                "vector": lambda: _get_vector_retrieval_documents(self.query, self.collection_name, self.depth),
+                "bm25": bm25_leg
+            },
+            deadline_ms
+        )
+        self.vector_docs = legs.get("vector", [])
+        self.bm25_docs = legs.get("bm25", [])
+        self.aligned = _merge_results(self.vector_docs, self.bm25_docs)
+        return self
+
+    def vector(self, top_k: int) -> List[Dict[str, Any]]:
+        return self.vector_docs[:top_k]
+
+    def bm25(self, top_k: int) -> List[Dict[str, Any]]:
+        return self.bm25_docs[:top_k]
+
+    def hybrid(
+        self,
+        top_k: int,
+        vector_weight: float = 0.5,
+        bm25_weight: float = 0.5,
+        score_method: str = "weighted"
+    ) -> List[Dict[str, Any]]:
+        return _fuse_top_k(self.aligned, top_k, vector_weight, bm25_weight, score_method)
+
+    def hybrid_rerank(
+        self,
+        top_k: int,
+        vector_weight: float = 0.5,
+        bm25_weight: float = 0.5,
+        score_method: str = "weighted"
+    ) -> List[Dict[str, Any]]:
+        final_results = self.hybrid(top_k, vector_weight, bm25_weight, score_method)
+        return _rerank_fused(self.query, final_results, top_k) if final_results else final_results
+
+    def compare(
+        self,
+        methods: List[str],
+        top_k: int,
+        deadline_ms: Optional[float] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        并发计算各检索方法的视图
+
+        Args:
+            methods: 检索方法（见 METHOD_LEGS）
+            top_k: 每种方法返回的文档数量
+            deadline_ms: 视图计算的截止时间（None 表示使用 rag.hybrid.compare_deadline_ms）
+
+        Returns:
+            方法名称 → {"results": 结果列表, "time": 耗时（毫秒）, "degraded": 是否缺少依赖的检索路}。
+            耗时为该方法依赖的检索路耗时（两路并发，取较慢的一路）加视图计算耗时，
+            即单独执行该方法所需的时间；视图计算失败或超时的方法带 error。
+        """
+        if deadline_ms is None:
+            from utils.config_loader import get_config
+            deadline_ms = float(get_config().get("rag.hybrid.compare_deadline_ms", 30000))
+        views = {name: (lambda name=name: getattr(self, name)(top_k)) for name in methods if name in METHOD_LEGS}
+        outputs, view_timings, failed = _run_legs(views, deadline_ms, _get_compare_executor())
+
+        comparison = {}
+        for name in views:
+            legs = METHOD_LEGS[name]
+            leg_ms = max((self.timings.get(leg, 0.0) for leg in legs), default=0.0)
+            comparison[name] = {
+                "results": outputs.get(name, []),
+                "time": leg_ms + view_timings.get(name, 0.0),
+                "degraded": any(leg in self.missing for leg in legs)
+            }
+            if name in failed:
+                comparison[name]["error"] = "视图计算失败或超时"
+        return comparison
 
 
 @tool
@@ -265,11 +456,19 @@ def hybrid_retrieve(
     vector_weight: Optional[float] = 0.5,
     bm25_weight: Optional[float] = 0.5,
     score_method: Optional[str] = "weighted",
-    use_rerank: Optional[bool] = False
+    use_rerank: Optional[bool] = False,
+    bm25_k1: Optional[float] = None,
+    bm25_b: Optional[float] = None,
+    deadline_ms: Optional[float] = None,
+    initial_k: Optional[int] = None,
+    candidate_k: Optional[int] = None
 ) -> str:
     """
     混合检索（向量检索 + BM25全文检索 + 可选Rerank）
 
+    向量检索与BM25检索并发执行，延迟取决于较慢的一路而不是两路之和。
+    某一路超过截止时间或失败时，只用已返回的结果融合，并在结果中标记 degraded。
+
     Args:
         query: 查询文本
         documents: 文档列表（JSON字符串），用于BM25检索
@@ -277,8 +476,16 @@ def hybrid_retrieve(
         top_k: 返回的文档数量
         vector_weight: 向量检索权重（0-1，默认0.5）
         bm25_weight: BM25检索权重（0-1，默认0.5）
-        score_method: 融合方法（weighted=加权平均，rrf=倒数排名融合）
+        score_method: 融合方法（weighted=加权平均，rrf=倒数排名融合，zscore=z-score 归一化，
+            combsum / combmnz=CombSUM / CombMNZ，dbsf=基于分布的分数融合，sigmoid=Sigmoid归一化）
         use_rerank: 是否使用Rerank重排序
+        bm25_k1: BM25参数k1（None 表示使用索引默认值）
+        bm25_b: BM25参数b（None 表示使用索引默认值）
+        deadline_ms: 两路检索的截止时间（毫秒，None 表示使用 rag.hybrid.deadline_ms）
+        initial_k: 每路检索的起始候选数（自适应深度的初始深度下限，见 tools.adaptive_depth，排序不确定时
+            仍会加深；自适应深度未启用时为固定候选数，None 表示 min(top_k * 3, 50)）
+        candidate_k: 融合后保留的候选数（None 表示 top_k；后续还要 Rerank 时大于 top_k 以留出余量），
+            每路至少取这么多候选，自适应深度仍按 top_k 评估排序是否确定
 
     Returns:
         JSON 格式的混合检索结果
@@ -286,6 +493,10 @@ def hybrid_retrieve(
     if not query or not query.strip():
         raise ValueError("查询不能为空")
 
+    if score_method not in available_fusers():
+        print(f"未知的融合方法 {score_method}，使用 weighted")
+        score_method = "weighted"
+
     # 归一化权重
     total_weight = (vector_weight if vector_weight is not None else 0.0) + (bm25_weight if bm25_weight is not None else 0.0)
     if total_weight > 0:
@@ -301,83 +512,91 @@ def hybrid_retrieve(
             "bm25_weight": bm25_weight,
             "top_k": top_k,
             "score_method": score_method,
-            "use_rerank": use_rerank
+            "use_rerank": use_rerank,
+            "bm25_k1": bm25_k1,
+            "bm25_b": bm25_b,
+            "candidate_k": candidate_k
         },
         "vector_count": 0,
         "bm25_count": 0,
         "final_count": 0,
+        "degraded": False,
+        "missing_legs": [],
         "results": []
     }
+    if deadline_ms is None:
+        deadline_ms = _hybrid_config()["deadline_ms"]
+    results["parameters"]["deadline_ms"] = deadline_ms
+    final_results: List[Dict[str, Any]] = []
 
     try:
-        # 1. 向量检索（获取更多文档以便融合）
-        initial_k = min(top_k * 3, 50)  # 获取3倍的文档用于融合
-        vector_docs = _get_vector_retrieval_documents(query, collection_name, initial_k)
+        # 按自适应深度取候选：先浅取（至少 initial_k / candidate_k 个），排序不确定时再加深
+        keep = max(int(candidate_k or top_k), top_k)
+        controller = DepthController.from_config(top_k, min_depth=max(initial_k or 0, keep))
+        if controller is not None:
+            depth = controller.initial_depth
+        else:
+            depth = max(int(initial_k if initial_k is not None else min(top_k * 3, 50)), keep)
+        start = time.perf_counter()
+
+        def bm25_leg(k: int) -> List[Dict[str, Any]]:
+            bm25_result_str = bm25_retrieve_func(
+                query=query,
+                documents=documents,
+                collection_name=collection_name,
+                top_k=k,
+                k1=bm25_k1,
+                b=bm25_b
+            )
+            return json.loads(bm25_result_str).get("results", [])
+
+        previous = None
+        while True:
+            # 1-2. 向量检索与BM25检索并发执行（所有轮次共享同一个截止时间）
+            remaining_ms = deadline_ms - (time.perf_counter() - start) * 1000
+            leg_funcs = {
+                "vector": lambda k=depth: _get_vector_retrieval_documents(query, collection_name, k),
+                "bm25": lambda k=depth: bm25_leg(k)
+            }
+            if previous is not None:
+                # 加深时只重新查询上一轮被截断的检索路：返回数少于深度的一路已经取到了全部候选
+                leg_funcs = {name: func for name, func in leg_funcs.items() if len(previous[1].get(name, [])) >= previous[0]}
+            legs, timings, missing = _run_legs(leg_funcs, remaining_ms)
+            fell_back = bool(missing) and previous is not None
+            if fell_back:
+                # 加深的一轮没能按时完成：沿用上一轮完整的候选
+                print(f"加深到 {depth} 的检索未完成（{', '.join(missing)}），沿用深度 {previous[0]} 的候选")
+                depth, legs, timings, missing = previous
+            elif previous is not None:
+                legs = {**previous[1], **legs}
+                timings = {**previous[2], **timings}
+            vector_docs = legs.get("vector", [])
+            bm25_docs = legs.get("bm25", [])
+
+            # 3. 按文本块标识对齐两路结果
+            aligned = _merge_results(vector_docs, bm25_docs)
+            if controller is None or missing or fell_back or not controller.assess_aligned(aligned, depth):
+                break
+            previous = (depth, legs, timings, missing)
+            depth = controller.next_depth(depth)
+
+        timings["total"] = (time.perf_counter() - start) * 1000
+        results["parameters"]["initial_k"] = depth
         results["vector_count"] = len(vector_docs)
-
-        # 2. BM25检索
-        from tools.bm25_retriever import _bm25_retrieve_internal as bm25_retrieve_func
-        bm25_result_str = bm25_retrieve_func(
-            query=query,
-            documents=documents,
-            collection_name=collection_name,
-            top_k=initial_k
-        )
-        bm25_result = json.loads(bm25_result_str)
-        bm25_docs = bm25_result.get("results", [])
         results["bm25_count"] = len(bm25_docs)
+        results["timings_ms"] = timings
+        results["degraded"] = bool(missing)
+        results["missing_legs"] = missing
+        if controller is not None:
+            results["depth"] = controller.metrics()
 
-        # 3. 融合结果
-        merged_results = _merge_results(vector_docs, bm25_docs, vector_weight, bm25_weight)
-
-        # 4. 计算混合分数
-        if merged_results:
-            hybrid_scores = _calculate_hybrid_score(
-                merged_results,
-                vector_weight,
-                bm25_weight,
-                score_method
-            )
-
-            # 取top_k结果
-            final_results = []
-            for idx, score in hybrid_scores[:top_k]:
-                result = merged_results[idx].copy()
-                result["hybrid_rank"] = len(final_results) + 1
-                final_results.append(result)
+        # 4. 计算混合分数并取前 candidate_k 个（Rerank 后为 top_k 个）
+        if len(aligned):
+            final_results = _fuse_top_k(aligned, keep, vector_weight, bm25_weight, score_method)
 
             # 5. 可选的Rerank重排
             if use_rerank and final_results:
-                # 准备rerank输入
-                rerank_docs = []
-                for i, r in enumerate(final_results):
-                    rerank_docs.append({
-                        "content": r.get("document", ""),
-                        "id": str(i),
-                        "hybrid_score": r.get("hybrid_score", 0)
-                    })
-
-                # 调用rerank
-                from tools.reranker_tool import rerank_documents as rerank_func
-                rerank_json = rerank_func(
-                    query=query,
-                    documents=json.dumps(rerank_docs),
-                    top_n=top_k
-                )
-                rerank_results = json.loads(rerank_json)
-
-                # 更新最终结果
-                for ranked_doc in rerank_results:
-                    doc_id = int(ranked_doc.get("id", "0"))
-                    if doc_id < len(final_results):
-                        final_results[doc_id]["rerank_score"] = ranked_doc.get("relevance_score", 0.5)
-                        final_results[doc_id]["rerank_reason"] = ranked_doc.get("reason", "")
-
-                # 按rerank分数重新排序
-                final_results.sort(
-                    key=lambda x: x.get("rerank_score", x.get("hybrid_score", 0)),
-                    reverse=True
-                )
+                final_results = _rerank_fused(query, final_results, top_k)
 
             results["final_results"] = final_results
             results["final_count"] = len(final_results)
@@ -391,6 +610,8 @@ def hybrid_retrieve(
         output_text += f"使用Rerank: {'是' if use_rerank else '否'}\n"
         output_text += f"向量检索: {results['vector_count']} 文档\n"
         output_text += f"BM25检索: {results['bm25_count']} 文档\n"
+        if missing:
+            output_text += f"⚠️ 降级: {', '.join(missing)} 检索失败或未在 {deadline_ms:.0f}ms 内返回\n"
         output_text += f"最终返回: {results['final_count']} 文档\n"
         output_text += "=" * 60 + "\n\n"
 
@@ -428,6 +649,7 @@ def compare_retrieval_methods(
     """
     对比不同检索方法的结果
 
+    向量检索与BM25检索各执行一次，各方法在同一个候选池上计算（见 CandidatePool）。
     对比以下方法：
     1. 向量检索
     2. BM25检索
@@ -449,61 +671,25 @@ def compare_retrieval_methods(
     }
 
     try:
-        # 1. 向量检索
-        vector_result = _get_vector_retrieval_documents(query, collection_name, top_k)
-        comparison["methods"]["vector"] = {
-            "count": len(vector_result),
-            "top_scores": [r.get("vector_score", 0) for r in vector_result[:3]]
-        }
-
-        # 2. BM25检索
-        from tools.bm25_retriever import _bm25_retrieve_internal as bm25_retrieve_func
-        bm25_result_str = bm25_retrieve_func(
-            query=query,
-            documents=documents,
+        # 两路各检索一次，四种方法作为候选池上的视图并发计算
+        pool = CandidatePool(
+            query,
             collection_name=collection_name,
-            top_k=top_k
-        )
-        bm25_result = json.loads(bm25_result_str)
-        bm25_docs = bm25_result.get("results", [])
-        comparison["methods"]["bm25"] = {
-            "count": len(bm25_docs),
-            "top_scores": [r.get("bm25_score", 0) for r in bm25_docs[:3]]
-        }
-
-        # 3. 混合检索（不使用Rerank）
-        hybrid_result_str = hybrid_retrieve.invoke(
-            query=query,
-            documents=documents,
-            collection_name=collection_name,
-            top_k=top_k,
-            vector_weight=0.5,
-            bm25_weight=0.5,
-            use_rerank=False
-        )
-        hybrid_result = json.loads(hybrid_result_str)
-        hybrid_docs = hybrid_result.get("final_results", [])
-        comparison["methods"]["hybrid"] = {
-            "count": len(hybrid_docs),
-            "top_scores": [r.get("hybrid_score", 0) for r in hybrid_docs[:3]]
-        }
-
-        # 4. 混合检索+Rerank
-        hybrid_rerank_str = hybrid_retrieve.invoke(
-            query=query,
             documents=documents,
-            collection_name=collection_name,
-            top_k=top_k,
-            vector_weight=0.5,
-            bm25_weight=0.5,
-            use_rerank=True
-        )
-        hybrid_rerank_result = json.loads(hybrid_rerank_str)
-        hybrid_rerank_docs = hybrid_rerank_result.get("final_results", [])
-        comparison["methods"]["hybrid_rerank"] = {
-            "count": len(hybrid_rerank_docs),
-            "top_scores": [r.get("rerank_score", r.get("hybrid_score", 0)) for r in hybrid_rerank_docs[:3]]
-        }
+            depth=max(min(top_k * 3, 50), top_k)
+        ).fetch()
+        views = pool.compare(["vector", "bm25", "hybrid", "hybrid_rerank"], top_k)
+        for method_name, view in views.items():
+            fields = METHOD_SCORE_FIELDS[method_name]
+            comparison["methods"][method_name] = {
+                "count": len(view["results"]),
+                "top_scores": [
+                    next((r[f] for f in fields if r.get(f) is not None), 0) for r in view["results"][:3]
+                ],
+                "time": view["time"],
+                "degraded": view["degraded"]
+            }
+        comparison["timings_ms"] = pool.timings
 
         # 生成对比摘要
         summary = f"📊 检索方法对比\n"
@@ -514,6 +700,7 @@ def compare_retrieval_methods(
         for method_name, method_data in comparison["methods"].items():
             summary += f"【{method_name.upper()}】\n"
             summary += f"  文档数: {method_data['count']}\n"
+            summary += f"  耗时: {method_data['time']:.1f}ms\n"
             summary += f"  Top-3 分数: {', '.join([f'{s:.4f}' for s in method_data['top_scores']])}\n"
             summary += "\n"
 
@@ -13,6 +13,7 @@ from langchain_core.documents import Document
 from tools.document_loader import load_document, get_document_info
 from tools.text_splitter import split_text_recursive, split_text_by_markdown_structure
 from tools.vector_store import get_vector_store, get_embeddings
+from tools.embedding_cache import track_embedding_cache
 
 
 def __get_file_type(file_path: str) -> str:
@@ -149,12 +150,27 @@ def add_document_to_knowledge_base(
                 embeddings=embeddings
             )
 
-            # 添加文档到向量存储
-            ids = vector_store.add_documents(documents)
+            # 添加文档到向量存储（内容未变的文本块直接使用缓存向量）
+            with track_embedding_cache() as cache_stats:
+                ids = vector_store.add_documents(documents)
 
         except Exception as e:
             raise RuntimeError(f"向量存储失败: {str(e)}")
 
+        # 同一来源重新入库后，其文本块的 Rerank 缓存分数失效
+        from tools.rerank_cache import invalidate_rerank_cache
+        invalidate_rerank_cache(source=base_metadata["source"])
+
+        # BM25 索引增量更新（只处理本次新增的块，失败不影响入库）
+        try:
+            from tools.bm25_retriever import update_bm25_index
+            update_bm25_index(collection_name, added=[
+                {"id": doc_id, "text": doc.page_content, "metadata": doc.metadata}
+                for doc_id, doc in zip(ids, documents)
+            ])
+        except Exception as e:
+            print(f"BM25 索引增量更新失败: {e}")
+
         # 返回结果
         result = f"✅ 文档已成功添加到知识库\n\n"
         result += file_info + "\n"
@@ -162,6 +178,7 @@ def add_document_to_knowledge_base(
         result += f"向量集合: {collection_name}\n"
         result += f"文档 IDs: {ids[:10]}...\n"
         result += f"文档 ID 总数: {len(ids)}\n"
+        result += f"Embedding 缓存命中: {cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']} ({cache_stats['hit_rate']:.0%})\n"
 
         return result
 
@@ -212,6 +229,14 @@ def delete_documents_from_knowledge_base(
         # 注意：PGVector 的删除方法可能需要调整
         # 这里使用 delete 方法
         delete_count = vector_store.delete(where=filters)
+        if source:
+            try:
+                from tools.bm25_retriever import update_bm25_index
+                update_bm25_index(collection_name or "knowledge_base", deleted_source=source)
+            except Exception as e:
+                print(f"BM25 索引增量删除失败: {e}")
+            from tools.rerank_cache import invalidate_rerank_cache
+            invalidate_rerank_cache(source=source)
 
         result = f"🗑️ 文档删除结果\n"
         result += f"删除条件: {filters}\n"
@@ -0,0 +1,136 @@
+"""
+本地模拟 Embedding（embedding.use_mock）
+不调用外部 API，用字符 n-gram 哈希投影生成确定性向量，供离线压测与基准：
+入库、pgvector 检索与混合融合都可以在全量数据上运行，且同一文本在任何进程中得到相同的向量。
+
+    向量: 文本去空白并小写后取 ngram_range 内的字符 n-gram，每个 n-gram 用 NumPy 向量化的 64 位哈希
+          映射到 [0, dimension) 的一个维度并带 ±1 符号累加，最后 L2 归一化（内容相近的文本余弦相似度更高）
+    延迟: 每个批次（一次"请求"）sleep latency_ms + latency_per_text_ms × 批大小 + [0, jitter_ms) 随机抖动，
+          并按 failure_rate 随机失败，用于模拟真实接口的耗时与重试；超过请求的 timeout 时按超时失败
+
+分批、并发与失败批次重试沿用 BatchedEmbeddings，与真实接口走同一条路径。
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tools.vector_store import BatchedEmbeddings
+
+
+_PRIME = np.uint64(1099511628211)
+
+
+def _mix64(h: np.ndarray) -> np.ndarray:
+    """64 位整数混合（MurmurHash3 fmix64），使相邻哈希值均匀分布"""
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xFF51AFD7ED558CCD)
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xC4CEB9FE1A85EC53)
+    return h ^ (h >> np.uint64(33))
+
+
+class MockEmbeddings(BatchedEmbeddings):
+    """字符 n-gram 哈希投影 Embedding（确定性、无外部依赖）"""
+
+    def __init__(
+        self,
+        dimension: int = 1024,
+        ngram_range: Sequence[int] = (1, 3),
+        latency_ms: float = 0.0,
+        latency_per_text_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+        batch_size: int = 100,
+        max_workers: int = 4,
+        max_retries: int = 2,
+        query_timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            dimension: 向量维度
+            ngram_range: 字符 n-gram 长度范围（含两端）
+            latency_ms: 每个批次的固定模拟延迟（毫秒）
+            latency_per_text_ms: 每个文本的额外模拟延迟（毫秒）
+            jitter_ms: 随机抖动上限（毫秒）
+            failure_rate: 每个批次模拟失败的概率
+            seed: 抖动与失败的随机种子（不影响向量）
+            batch_size / max_workers / max_retries / query_timeout: 同 BatchedEmbeddings
+        """
+        super().__init__(
+            f"mock-ngram-{dimension}",
+            batch_size=batch_size,
+            max_workers=max_workers,
+            max_retries=max_retries,
+            query_timeout=query_timeout
+        )
+        self.dimension = int(dimension)
+        self.ngram_range = (int(ngram_range[0]), int(ngram_range[1]))
+        self.latency_ms = float(latency_ms)
+        self.latency_per_text_ms = float(latency_per_text_ms)
+        self.jitter_ms = float(jitter_ms)
+        self.failure_rate = float(failure_rate)
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _ngram_features(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        codes = np.frombuffer("".join(text.lower().split()).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        hashes = []
+        low, high = self.ngram_range
+        with np.errstate(over="ignore"):
+            for n in range(low, high + 1):
+                count = len(codes) - n + 1
+                if count <= 0:
+                    continue
+                # 多项式滚动哈希（uint64 溢出回绕），按 n 加盐后做 64 位混合
+                h = np.full(count, np.uint64(n))
+                for k in range(n):
+                    h = h * _PRIME + codes[k:k + count]
+                hashes.append(_mix64(h))
+        if not hashes:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        digests = np.concatenate(hashes)
+        indices = (digests % np.uint64(self.dimension)).astype(np.int64)
+        signs = np.where(digests >> np.uint64(63), -1.0, 1.0)
+        return indices, signs
+
+    def vectorize(self, texts: List[str]) -> List[List[float]]:
+        """计算向量（不含模拟延迟）"""
+        matrix = np.zeros((len(texts), self.dimension))
+        for row, text in enumerate(texts):
+            indices, signs = self._ngram_features(text)
+            if len(indices):
+                matrix[row] = np.bincount(indices, weights=signs, minlength=self.dimension)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+        return matrix.tolist()
+
+    def _simulated_call(self, size: int, timeout: Optional[float]) -> Tuple[float, Optional[Exception]]:
+        """本批次的模拟延迟（秒，不超过 timeout）与模拟的错误（超时或失败）"""
+        with self._rng_lock:
+            jitter = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms > 0 else 0.0
+            failed = self.failure_rate > 0 and self._rng.random() < self.failure_rate
+        delay = (self.latency_ms + self.latency_per_text_ms * size + jitter) / 1000
+        if timeout is not None and delay > timeout:
+            return timeout, TimeoutError("模拟 Embedding 接口超时")
+        return delay, ConnectionError("模拟 Embedding 接口失败") if failed else None
+
+    def _embed_batch(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        delay, error = self._simulated_call(len(texts), timeout)
+        if delay > 0:
+            time.sleep(delay)
+        if error is not None:
+            raise error
+        return self.vectorize(texts)
+
+    async def _aembed_batch(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        delay, error = self._simulated_call(len(texts), timeout)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return self.vectorize(texts)
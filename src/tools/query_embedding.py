@@ -0,0 +1,202 @@
+"""
+查询向量缓存与请求合并
+每次检索都会调用 embed_query，热门问题（如"什么是建账"）每轮对话都要付出一次完整的 API 往返。
+QueryEmbeddingCache 包装底层 Embeddings，对 embed_query 做三层处理：
+
+    LRU:       有界缓存已计算的查询向量，命中直接返回
+    单飞合并:  相同文本的并发调用共享同一个进行中的请求
+    微批处理:  batch_window_ms 内到达的不同查询合并成一次批量请求（一次 embeddings.create）
+
+第一个进入空批次的调用者负责等待窗口并发出请求，窗口内到达的其他查询只等待结果；
+批次达到 max_batch 时立即发出。底层提供 embed_query_batch（见 BatchedEmbeddings：一次请求、查询超时、不重试）
+时用它发出批次，否则用 embed_documents；embed_documents 直接透传给底层 Embeddings。
+aembed_query 与 embed_query 共享缓存、进行中的请求和批次，同步与异步调用可以互相合并。
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from utils.cache import LRUCache
+
+
+class QueryEmbeddingCache(Embeddings):
+    """带 LRU、单飞合并与微批处理的查询向量包装"""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_entries: int = 1024,
+        batch_window_ms: float = 5.0,
+        max_batch: int = 32
+    ):
+        """
+        Args:
+            embeddings: 底层 Embeddings
+            max_entries: 最多缓存的查询向量数
+            batch_window_ms: 微批等待窗口（毫秒，0 表示不等待）
+            max_batch: 单个批次最多包含的查询数
+        """
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.batch_window_ms = max(float(batch_window_ms), 0.0)
+        self.max_batch = max(int(max_batch), 1)
+        self._cache = LRUCache(max_entries=max_entries)
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._pending: List[Tuple[str, Future]] = []
+        self._batch_open = False
+        self._batch_full = threading.Event()
+        self._coalesced = 0
+        self._batches = 0
+        self._batched_queries = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        embed = getattr(self.embeddings, "embed_query_batch", self.embeddings.embed_documents)
+        return embed(texts)
+
+    async def _arequest(self, texts: List[str]) -> List[List[float]]:
+        embed = getattr(self.embeddings, "aembed_query_batch", self.embeddings.aembed_documents)
+        return await embed(texts)
+
+    def _join(self, text: str) -> Tuple[Future, bool]:
+        """加入进行中的请求或当前批次，返回 (结果 Future, 是否负责发出本批次)"""
+        with self._lock:
+            future = self._inflight.get(text)
+            if future is not None:
+                self._coalesced += 1
+                return future, False
+            future = Future()
+            self._inflight[text] = future
+            self._pending.append((text, future))
+            leader = not self._batch_open
+            self._batch_open = True
+            if len(self._pending) >= self.max_batch:
+                self._batch_full.set()
+            return future, leader
+
+    def _take_batch(self) -> List[List[Tuple[str, Future]]]:
+        """取出当前批次，超过 max_batch 的部分（窗口内持续到达）分成多次请求"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._batch_open = False
+            self._batch_full.clear()
+            self._batches += 1
+            self._batched_queries += len(batch)
+        return [batch[start:start + self.max_batch] for start in range(0, len(batch), self.max_batch)]
+
+    def _resolve(self, part: List[Tuple[str, Future]], vectors: List[List[float]], error: Optional[BaseException]) -> None:
+        with self._lock:
+            for i, (text, future) in enumerate(part):
+                if self._inflight.get(text) is future:
+                    del self._inflight[text]
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    self._cache.set(text, tuple(vectors[i]))
+                    future.set_result(vectors[i])
+
+    def _abandon(self, parts: Optional[List[List[Tuple[str, Future]]]]) -> None:
+        """
+        发起方结束时兜底（正常完成时所有 Future 都已完成，无操作）：
+        在窗口内被取消则先取出批次（重置 _batch_open），再让尚未完成的 Future 失败并移出 _inflight，
+        等待中的调用者立即返回错误，之后的调用重新发起请求
+        """
+        if parts is None:
+            parts = self._take_batch()
+        error = RuntimeError("查询向量批次的发起方已取消，请重试")
+        for part in parts:
+            self._resolve(part, [], error)
+
+    def embed_query(self, text: str) -> List[float]:
+        cached = self._cache.get(text)
+        if cached is not None:
+            return list(cached)
+        future, leader = self._join(text)
+        if leader:
+            parts = None
+            try:
+                # 等待微批窗口（批次满时提前结束）后发出合并请求
+                if self.batch_window_ms > 0:
+                    self._batch_full.wait(self.batch_window_ms / 1000)
+                parts = self._take_batch()
+                for part in parts:
+                    try:
+                        vectors = self._request([t for t, _ in part])
+                    except Exception as e:
+                        self._resolve(part, [], e)
+                    else:
+                        self._resolve(part, vectors, None)
+            finally:
+                self._abandon(parts)
+        return list(future.result())
+
+    async def aembed_query(self, text: str) -> List[float]:
+        cached = self._cache.get(text)
+        if cached is not None:
+            return list(cached)
+        future, leader = self._join(text)
+        if leader:
+            parts = None
+            try:
+                # 不阻塞事件循环：固定等待一个窗口
+                if self.batch_window_ms > 0:
+                    await asyncio.sleep(self.batch_window_ms / 1000)
+                parts = self._take_batch()
+                for part in parts:
+                    try:
+                        vectors = await self._arequest([t for t, _ in part])
+                    except Exception as e:
+                        self._resolve(part, [], e)
+                    else:
+                        self._resolve(part, vectors, None)
+            finally:
+                # 被取消（wait_for 超时、客户端断开）时 CancelledError 不是 Exception，在这里兜底
+                self._abandon(parts)
+        # shield：本调用被取消时不取消其他调用者共享的 Future
+        return list(await asyncio.shield(asyncio.wrap_future(future)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """统计（LRU 命中率、被合并的并发调用数、平均批大小）"""
+        stats = self._cache.get_stats()
+        with self._lock:
+            stats.update({
+                "coalesced": self._coalesced,
+                "batches": self._batches,
+                "avg_batch_size": round(self._batched_queries / self._batches, 2) if self._batches else 0.0
+            })
+        return stats
+
+
+_query_cache: Optional[QueryEmbeddingCache] = None
+
+
+def wrap_query_cache(embeddings: Embeddings) -> Embeddings:
+    """按 embedding.query_cache 配置包装查询向量缓存（关闭时原样返回）"""
+    global _query_cache
+    from utils.config_loader import get_config
+    config = get_config()
+    if str(config.get("embedding.query_cache.enabled", True)).lower() not in ("true", "1"):
+        return embeddings
+    _query_cache = QueryEmbeddingCache(
+        embeddings,
+        max_entries=int(config.get("embedding.query_cache.max_entries", 1024)),
+        batch_window_ms=float(config.get("embedding.query_cache.batch_window_ms", 5)),
+        max_batch=int(config.get("embedding.query_cache.max_batch", 32))
+    )
+    return _query_cache
+
+
+def get_query_embedding_stats() -> Dict[str, Any]:
+    """查询向量缓存统计（未创建时为空）"""
+    return _query_cache.get_stats() if _query_cache is not None else {}
@@ -4,12 +4,12 @@
 """
 import json
 from langchain.tools import tool
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_model
 import os
 
 
 def _get_llm():
-    """获取 LLM 实例"""
+    """获取 LLM 实例（共享注册表中的同一个实例）"""
     from utils.config_loader import get_config
     app_cfg = get_config()
     llm_cfg = app_cfg.get_llm_config()
@@ -17,20 +17,15 @@ def _get_llm():
     api_key = os.getenv(llm_cfg.get("api_key_env", "SILICONFLOW_API_KEY"))
     base_url = os.getenv(llm_cfg.get("base_url_env", "SILICONFLOW_BASE_URL"))
 
-    llm = ChatOpenAI(
+    return get_chat_model(
         model=llm_cfg.get("model", "deepseek-ai/DeepSeek-V3.2"),
         api_key=api_key,
         base_url=base_url,
         temperature=0.1,  # 低温度确保分类稳定
+        thinking="disabled",  # 关闭思考模式
         timeout=60,
-        streaming=True,  # 必须为True
-        extra_body={
-            "thinking": {
-                "type": "disabled"  # 关闭思考模式
-            }
-        }
+        streaming=True  # 必须为True
     )
-    return llm
 
 
 @tool
@@ -59,8 +54,6 @@ def classify_question_type(query: str) -> str:
     if not query or not query.strip():
         raise ValueError("查询不能为空")
 
-    llm = _get_llm()
-
     # 分类提示词
     system_prompt = """你是一个问题分类专家。分析用户查询，将其分类为以下类型之一：
 
@@ -180,6 +173,18 @@ def get_retrieval_strategy(question_type: str) -> str:
     6. troubleshooting - 混合检索 + Rerank（需要全面匹配）
     7. general - 向量检索（通用语义匹配）
 
+    使用 BM25 的策略同时给出 bm25_k1 / bm25_b：查询时生效，切换参数不需要重建索引。
+    k1 越小词频越快饱和（适合精确匹配），b 越小对长文档的惩罚越轻。
+
+    混合检索策略同时给出 fuser（融合方法，见 tools.score_fusion）和 initial_k（每路起始候选数，
+    排序不确定时自适应深度仍会在此基础上加深）：
+    对比型用 CombMNZ 奖励两路同时召回的文本块；故障排查用对分数尺度和离群值不敏感的 DBSF，
+    在较小的候选数下保持融合质量，减少候选量和 Rerank 开销。
+
+    使用 Rerank 的规则型 / 故障排查策略给出 prerank_factor：Rerank 前先用本地信号预排序，
+    只把前 prerank_factor × top_k 个候选送给模型（见 tools.rerank_cascade）；
+    检索阶段为 Rerank 准备 top_k × 3 个候选，预排序因此总能淘汰一部分。
+
     Args:
         question_type: 问题类型（来自 classify_question_type）
 
@@ -199,6 +204,9 @@ def get_retrieval_strategy(question_type: str) -> str:
             "top_k": 7,
             "bm25_weight": 0.4,
             "vector_weight": 0.6,
+            "bm25_k1": 1.5,
+            "bm25_b": 0.75,
+            "fuser": "weighted",
             "reason": "流程型问题需要语义和关键词混合匹配"
         },
         "compare": {
@@ -207,18 +215,24 @@ def get_retrieval_strategy(question_type: str) -> str:
             "top_k": 5,
             "bm25_weight": 0.5,
             "vector_weight": 0.5,
+            "bm25_k1": 1.2,
+            "bm25_b": 0.75,
+            "fuser": "combmnz",
             "reason": "对比型问题需要精确匹配，建议使用Rerank"
         },
         "factual": {
             "method": "bm25",
             "use_rerank": False,
             "top_k": 3,
+            "bm25_k1": 1.2,
+            "bm25_b": 0.5,
             "reason": "事实型问题需要精确匹配关键词"
         },
         "rule": {
             "method": "vector",
             "use_rerank": True,
             "top_k": 5,
+            "prerank_factor": 2,
             "reason": "规则型问题需要深度理解，建议使用Rerank"
         },
         "troubleshooting": {
@@ -227,6 +241,11 @@ def get_retrieval_strategy(question_type: str) -> str:
             "top_k": 8,
             "bm25_weight": 0.5,
             "vector_weight": 0.5,
+            "bm25_k1": 1.8,
+            "bm25_b": 0.75,
+            "fuser": "dbsf",
+            "initial_k": 20,
+            "prerank_factor": 2,
             "reason": "故障排查需要全面匹配，建议使用Rerank"
         },
         "general": {
@@ -76,16 +76,17 @@ def rag_retrieve_with_rerank(
                 rerank_docs.append({
                     "content": doc.page_content,
                     "id": str(i),
+                    "chunk_id": doc.id,
+                    "metadata": doc.metadata,
                     "vector_score": float(score)
                 })
 
-            # 调用 rerank 工具
-            from tools.reranker_tool import rerank_documents as rerank_func
-            rerank_json = rerank_func(
-                query=query,
-                documents=json.dumps(rerank_docs),
-                top_n=top_n
-            )
+            # 调用 rerank 工具（分数按查询-文本块缓存，见 tools.rerank_cache）
+            rerank_json = rerank_documents.invoke({
+                "query": query,
+                "documents": json.dumps(rerank_docs, ensure_ascii=False),
+                "top_n": top_n
+            })
 
             # 解析 rerank 结果
             rerank_results = json.loads(rerank_json)
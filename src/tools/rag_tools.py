@@ -88,6 +88,12 @@ def delete_documents_from_knowledge_base(source: str) -> str:
         db = get_session()
         success = doc_mgr.delete_document(db, source)
         db.close()
+        if success:
+            from biz.rag_service import get_rag_service
+            from tools.bm25_retriever import update_bm25_index
+            update_bm25_index(get_rag_service().collection_name, deleted_source=source)
+            from tools.rerank_cache import invalidate_rerank_cache
+            invalidate_rerank_cache(source=source)
         return f"✅ 文档 {source} 删除{'成功' if success else '失败'}"
     except Exception as e:
         return f"❌ 删除失败: {str(e)}"
@@ -0,0 +1,141 @@
+"""
+Rerank 分数缓存
+按 (查询指纹, 文本块标识) 缓存 Rerank 分数，smart_retrieve / hybrid_retrieve / rag_retrieve_with_rerank
+共用（都经过 rerank_documents），多轮对话中重复出现的查询-文本块对不再送给模型。
+
+    查询指纹:   md5(打分器 | 去空白并小写的查询)，打分器为 "后端:模型"，换模型后自然不命中
+    文本块标识: 调用方提供的 chunk_id（pgvector 行ID），没有时用去空白后的内容哈希
+
+文本块重新入库或删除时按行ID或来源失效：失效只递增对应的代数（O(1)），
+缓存条目记录写入时的代数，读取时代数不一致即视为未命中。
+"""
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from tools.score_fusion import content_hash
+from utils.cache import LRUCache
+
+
+def chunk_key(doc: Dict[str, Any]) -> str:
+    """Rerank 输入文档的文本块标识"""
+    chunk_id = doc.get("chunk_id")
+    if chunk_id not in (None, ""):
+        return str(chunk_id)
+    return content_hash(doc.get("content", doc.get("text", "")) or "")
+
+
+def _doc_source(doc: Dict[str, Any]) -> Optional[str]:
+    metadata = doc.get("metadata") or {}
+    return metadata.get("source") if isinstance(metadata, dict) else None
+
+
+class RerankScoreCache:
+    """有界 Rerank 分数缓存（LRU，按代数失效）"""
+
+    def __init__(self, max_entries: int = 20000):
+        """
+        Args:
+            max_entries: 最大缓存的查询-文本块对数
+        """
+        self._cache = LRUCache(max_entries=max_entries)
+        self._lock = threading.Lock()
+        self._chunk_generation: Dict[str, int] = {}
+        self._source_generation: Dict[str, int] = {}
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+
+    @staticmethod
+    def fingerprint(query: str, scorer: str) -> str:
+        normalized = "".join(query.lower().split())
+        return hashlib.md5(f"{scorer}|{normalized}".encode("utf-8", errors="surrogatepass")).hexdigest()
+
+    def _generations(self, key: str, source: Optional[str]) -> Tuple[int, int]:
+        with self._lock:
+            return self._chunk_generation.get(key, 0), self._source_generation.get(source, 0) if source else 0
+
+    def lookup(self, query_fp: str, docs: Sequence[Dict[str, Any]]) -> Dict[int, Tuple[float, str]]:
+        """
+        查找已缓存的分数
+
+        Returns:
+            文档下标 → (分数, 原因)，只包含命中的文档
+        """
+        hits = {}
+        stale = 0
+        for i, doc in enumerate(docs):
+            key = chunk_key(doc)
+            entry = self._cache.get((query_fp, key))
+            if entry is None:
+                continue
+            score, reason, source, generations = entry
+            if generations != self._generations(key, source):
+                self._cache.delete((query_fp, key))
+                stale += 1
+                continue
+            hits[i] = (score, reason)
+        with self._lock:
+            self._hits += len(hits)
+            self._misses += len(docs) - len(hits)
+            self._stale += stale
+        return hits
+
+    def store(self, query_fp: str, doc: Dict[str, Any], score: float, reason: str = "") -> None:
+        """缓存一个查询-文本块对的分数"""
+        key = chunk_key(doc)
+        source = _doc_source(doc)
+        self._cache.set((query_fp, key), (float(score), reason, source, self._generations(key, source)))
+
+    def invalidate(self, chunk_ids: Optional[Sequence[str]] = None, source: Optional[str] = None) -> None:
+        """使指定文本块（行ID）或来源的所有缓存分数失效"""
+        with self._lock:
+            for chunk_id in chunk_ids or []:
+                self._chunk_generation[str(chunk_id)] = self._chunk_generation.get(str(chunk_id), 0) + 1
+            if source:
+                self._source_generation[source] = self._source_generation.get(source, 0) + 1
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计（命中 / 未命中按查询-文本块对计，stale 为因失效而丢弃的条目数）"""
+        stats = self._cache.get_stats()
+        with self._lock:
+            lookups = self._hits + self._misses
+            stats.update({
+                "hits": self._hits,
+                "misses": self._misses,
+                "stale": self._stale,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0
+            })
+        return stats
+
+
+_cache: Optional[RerankScoreCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_rerank_cache() -> Optional[RerankScoreCache]:
+    """获取全局 Rerank 分数缓存（rerank.cache.enabled 关闭时返回 None）"""
+    global _cache
+    from utils.config_loader import get_config
+    config = get_config()
+    if str(config.get("rerank.cache.enabled", True)).lower() not in ("true", "1"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RerankScoreCache(max_entries=int(config.get("rerank.cache.max_entries", 20000)))
+    return _cache
+
+
+def invalidate_rerank_cache(chunk_ids: Optional[Sequence[str]] = None, source: Optional[str] = None) -> None:
+    """文本块重新入库或删除时调用，使相关的缓存分数失效"""
+    if _cache is not None:
+        _cache.invalidate(chunk_ids, source)
+
+
+def get_rerank_cache_stats() -> Dict[str, Any]:
+    """Rerank 分数缓存统计（未创建时为空）"""
+    return _cache.get_stats() if _cache is not None else {}
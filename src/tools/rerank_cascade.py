@@ -0,0 +1,107 @@
+"""
+Rerank 前的本地预排序（级联）
+在调用模型 Rerank 之前，用本地可算的信号给候选打分，只把前 top_m 个送给模型：
+
+    bm25:    以候选集合为语料、按配置分词器计算的查询 BM25 分数（最小-最大归一化）
+    overlap: 查询词项（去重）在文档中出现的比例
+    vector:  检索阶段已经得到的查询-文档嵌入余弦相似度（vector_similarity 字段，不重新嵌入）
+
+没有任何候选带 vector_similarity 时，vector 的权重按比例分给其余信号；
+个别候选缺少相似度时取已有相似度的最小值，视为与最弱的向量命中一样弱。
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tools.bm25_index import BM25Index
+from tools.bm25_tokenizer import get_tokenizer
+
+DEFAULT_WEIGHTS = {"bm25": 0.4, "overlap": 0.2, "vector": 0.4}
+
+
+def _minmax(values: np.ndarray) -> np.ndarray:
+    span = values.max() - values.min() if len(values) else 0.0
+    if span <= 0:
+        return np.full(len(values), 0.5)
+    return (values - values.min()) / span
+
+
+def cascade_scores(
+    query: str,
+    doc_list: List[Dict[str, Any]],
+    weights: Optional[Dict[str, float]] = None
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    计算候选的本地预排序分数
+
+    Args:
+        query: 查询文本
+        doc_list: Rerank 输入文档（content / text，可选 vector_similarity）
+        weights: 各信号权重（默认 DEFAULT_WEIGHTS）
+
+    Returns:
+        (float64[N] 综合分数, 各信号归一化后的分数)
+    """
+    weights = dict(weights or DEFAULT_WEIGHTS)
+    tokenizer = get_tokenizer()
+    query_tokens = tokenizer.tokenize(query)
+    doc_tokens = [tokenizer.tokenize(doc.get("content", doc.get("text", "")) or "") for doc in doc_list]
+    n = len(doc_list)
+
+    bm25 = np.zeros(n)
+    if query_tokens and n:
+        index = BM25Index.from_tokenized(doc_tokens)
+        for doc_id, score in index.search(query_tokens, top_k=n):
+            bm25[doc_id] = score
+
+    unique_query = set(query_tokens)
+    overlap = np.array([
+        len(unique_query & set(tokens)) / len(unique_query) if unique_query else 0.0
+        for tokens in doc_tokens
+    ])
+
+    signals = {"bm25": _minmax(bm25), "overlap": overlap}
+    similarities = [doc.get("vector_similarity") for doc in doc_list]
+    known = [s for s in similarities if s is not None]
+    if known:
+        floor = min(known)
+        signals["vector"] = _minmax(np.array([floor if s is None else float(s) for s in similarities]))
+    else:
+        weights.pop("vector", None)
+
+    total = sum(weights.get(name, 0.0) for name in signals)
+    combined = np.zeros(n)
+    if total > 0:
+        for name, values in signals.items():
+            combined += weights.get(name, 0.0) / total * values
+    return combined, signals
+
+
+def cascade_prune(
+    query: str,
+    doc_list: List[Dict[str, Any]],
+    top_m: int,
+    weights: Optional[Dict[str, float]] = None
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    按本地预排序分数保留前 top_m 个候选
+
+    Args:
+        query: 查询文本
+        doc_list: Rerank 输入文档
+        top_m: 保留的候选数
+        weights: 各信号权重
+
+    Returns:
+        (保留的候选（按原顺序）, 淘汰的候选（按预排序分数降序）)，每个候选写入 prerank_score
+    """
+    if top_m <= 0 or len(doc_list) <= top_m:
+        return doc_list, []
+    combined, _ = cascade_scores(query, doc_list, weights)
+    for doc, score in zip(doc_list, combined):
+        doc["prerank_score"] = float(score)
+    order = np.argsort(-combined, kind="stable")
+    keep = set(order[:top_m].tolist())
+    kept = [doc for i, doc in enumerate(doc_list) if i in keep]
+    pruned = [doc_list[i] for i in order[top_m:]]
+    return kept, pruned
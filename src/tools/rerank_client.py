@@ -0,0 +1,157 @@
+"""
+Rerank 接口客户端
+调用 OpenAI 兼容的 /rerank 接口（硅基流动 / Jina / Cohere 等同一格式），
+一次批量请求返回每个文档的数值相关性分数，不经过提示词和文本解析。
+
+请求:  POST {base_url}/rerank
+       {"model": ..., "query": ..., "documents": [...], "return_documents": false}
+响应:  {"results": [{"index": 0, "relevance_score": 0.93}, ...]}
+
+同时记录各 Rerank 后端（endpoint / chat）的调用次数、失败数、解析失败数与延迟，
+用于对比两种后端（见 get_rerank_stats 与 scripts/bench_rerank.py）。
+"""
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+
+class RerankError(RuntimeError):
+    """Rerank 接口调用失败（网络错误、非 2xx 状态码或响应格式不符）"""
+
+
+class RerankEndpointClient:
+    """OpenAI 兼容 /rerank 接口客户端（复用连接）"""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str],
+        model: str,
+        timeout: float = 10.0,
+        max_chars: int = 4096
+    ):
+        """
+        Args:
+            base_url: 接口地址（不含 /rerank）
+            api_key: API Key（本地替身服务可为空）
+            model: Rerank 模型名称
+            timeout: 请求超时（秒）
+            max_chars: 每个文档发送的最大字符数
+        """
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.max_chars = max_chars
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._client = httpx.Client(headers=headers, timeout=timeout)
+
+    def rerank(self, query: str, documents: List[str]) -> List[float]:
+        """
+        对文档打分
+
+        Args:
+            query: 查询文本
+            documents: 文档内容列表
+
+        Returns:
+            与 documents 一一对应的相关性分数
+
+        Raises:
+            RerankError: 调用失败或响应缺少某个文档的分数
+        """
+        if not documents:
+            return []
+        payload = {
+            "model": self.model,
+            "query": query,
+            "documents": [doc[:self.max_chars] for doc in documents],
+            "return_documents": False
+        }
+        try:
+            response = self._client.post(f"{self.base_url}/rerank", json=payload)
+            response.raise_for_status()
+            results = response.json()["results"]
+            scores: List[Optional[float]] = [None] * len(documents)
+            for item in results:
+                scores[int(item["index"])] = float(item["relevance_score"])
+        except (httpx.HTTPError, ValueError, KeyError, TypeError, IndexError) as e:
+            raise RerankError(f"Rerank 接口调用失败: {e}") from e
+        if any(score is None for score in scores):
+            raise RerankError("Rerank 接口响应缺少部分文档的分数")
+        return scores
+
+    def close(self) -> None:
+        self._client.close()
+
+
+_client: Optional[RerankEndpointClient] = None
+_client_key: Optional[tuple] = None
+_client_lock = threading.Lock()
+
+
+def get_rerank_client() -> RerankEndpointClient:
+    """
+    按配置获取 /rerank 接口客户端（配置不变时复用同一个客户端）
+
+    配置项：rerank.endpoint.base_url_env / api_key_env / model / timeout / max_chars，
+    未配置时沿用 rerank.base_url_env / rerank.api_key_env / rerank.llm_model。
+    """
+    global _client, _client_key
+    from utils.config_loader import get_config
+    config = get_config()
+    api_key = os.getenv(config.get("rerank.endpoint.api_key_env", config.get("rerank.api_key_env", "SILICONFLOW_API_KEY")))
+    base_url = os.getenv(config.get("rerank.endpoint.base_url_env", config.get("rerank.base_url_env", "SILICONFLOW_BASE_URL")))
+    if not base_url:
+        base_url = "https://api.siliconflow.cn/v1"
+    model = config.get("rerank.endpoint.model", config.get("rerank.llm_model", "Qwen/Qwen3-Reranker-0.6B"))
+    timeout = float(config.get("rerank.endpoint.timeout", 10))
+    max_chars = int(config.get("rerank.endpoint.max_chars", 4096))
+
+    key = (base_url, api_key, model, timeout, max_chars)
+    with _client_lock:
+        if _client is None or _client_key != key:
+            if _client is not None:
+                _client.close()
+            _client = RerankEndpointClient(base_url, api_key, model, timeout=timeout, max_chars=max_chars)
+            _client_key = key
+        return _client
+
+
+# ==================== 后端统计 ====================
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def record_rerank_call(backend: str, elapsed_ms: float, documents: int, error: bool = False, parse_failed: bool = False) -> None:
+    """记录一次 Rerank 调用"""
+    with _stats_lock:
+        stats = _stats.setdefault(backend, {"calls": 0, "errors": 0, "parse_failures": 0, "documents": 0, "total_ms": 0.0})
+        stats["calls"] += 1
+        stats["errors"] += int(error)
+        stats["parse_failures"] += int(parse_failed)
+        stats["documents"] += documents
+        stats["total_ms"] += elapsed_ms
+
+
+def get_rerank_stats() -> Dict[str, Dict[str, Any]]:
+    """各 Rerank 后端的调用统计（调用数、失败率、解析失败率、平均延迟）"""
+    with _stats_lock:
+        report = {}
+        for backend, stats in _stats.items():
+            calls = stats["calls"]
+            report[backend] = {
+                "calls": calls,
+                "documents": stats["documents"],
+                "error_rate": stats["errors"] / calls if calls else 0.0,
+                "parse_failure_rate": stats["parse_failures"] / calls if calls else 0.0,
+                "avg_ms": stats["total_ms"] / calls if calls else 0.0
+            }
+        return report
+
+
+def reset_rerank_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
@@ -1,15 +1,26 @@
 """
 Rerank 工具
-使用大语言模型对检索结果进行重排序
+对检索结果进行重排序，支持两种后端（rerank.backend）：
+    endpoint: 调用 /rerank 接口批量返回数值分数（默认，见 tools.rerank_client）
+    chat:     通过对话补全接口让模型输出 JSON 评分（endpoint 失败时的回退）
+候选较多时拆成分片并发打分再合并（rerank.sharding.*）；
+指定 prune_to 时先用本地信号预排序，只把前 prune_to 个候选送给模型（rerank.cascade.*）。
 """
 import os
 import json
-from typing import List, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 from langchain.tools import tool
 from langchain_core.documents import Document
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_model
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from tools.rerank_cache import get_rerank_cache
+from tools.rerank_cascade import cascade_prune
+from tools.rerank_client import RerankError, get_rerank_client, record_rerank_call
+
 
 def __parse_documents_input(documents_input: str) -> List[dict]:
     """
@@ -37,14 +48,238 @@ def __parse_documents_input(documents_input: str) -> List[dict]:
     raise ValueError(f"文档输入应该是 JSON 字符串，当前类型: {type(documents_input)}")
 
 
+def _chat_scores(query: str, doc_list: List[dict], config) -> Tuple[List[dict], bool]:
+    """
+    chat 后端：通过对话补全接口让模型输出 JSON 评分
+
+    Returns:
+        (评分列表 [{"id", "score", "reason"}], 是否 JSON 解析失败)
+    """
+    # 从配置中获取需要的环境变量
+    api_key_env = config.get("rerank.api_key_env", "SILICONFLOW_API_KEY")
+    base_url_env = config.get("rerank.base_url_env", "SILICONFLOW_BASE_URL")
+    
+    api_key = os.getenv(api_key_env)
+    base_url = os.getenv(base_url_env)
+
+    if not api_key:
+        raise RuntimeError(f"未找到必要的环境变量: {api_key_env}")
+    
+    if not base_url:
+        base_url = "https://api.siliconflow.cn/v1"
+
+    # 从配置中动态获取模型名称
+    model_name = config.get("rerank.llm_model", "Qwen/Qwen3-Reranker-0.6B")
+
+    llm = get_chat_model(
+        model=model_name,
+        api_key=api_key,
+        base_url=base_url,
+        temperature=0.1,  # 低温度以获得稳定排序
+        max_tokens=1000
+    )
+
+    # 构建提示词
+    system_prompt = """你是一个专业的文档相关性评估专家。你的任务是根据查询对文档进行相关性评分和排序。
+
+评分标准：
+- 1.0: 完全相关，直接回答了查询问题
+- 0.8-0.9: 高度相关，提供了查询所需的大部分信息
+- 0.6-0.7: 中度相关，部分回答了查询问题
+- 0.4-0.5: 低度相关，仅提供少量相关信息
+- 0.0-0.3: 不相关或几乎不相关
+
+请严格按照以下JSON格式输出，不要输出其他任何内容：
+```json
+{
+  "ranked_docs": [
+{
+  "id": "文档ID",
+  "score": 0.95,
+  "reason": "简短说明相关性原因"
+}
+  ]
+}
+```"""
+
+    # 准备文档列表
+    docs_text = ""
+    for i, doc in enumerate(doc_list):
+        content = doc.get("content", doc.get("text", ""))[:300]
+        doc_id = doc.get("id", str(i))
+        docs_text += f"\n文档 {doc_id}:\n{content}\n"
+
+    user_message = f"""查询：{query}
+
+待排序文档：
+{docs_text}
+
+请对以上文档进行相关性评分和排序，返回 JSON 格式的结果。"""
+
+    # 调用 LLM
+    messages = [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=user_message)
+    ]
+
+    response = llm.invoke(messages)
+
+    # 解析响应
+    response_content = response.content
+
+    # 如果是列表，合并成字符串
+    if isinstance(response_content, list):
+        response_text = "".join(str(item) for item in response_content)
+    else:
+        response_text = str(response_content)
+
+    # 提取 JSON
+    if "```json" in response_text:
+        json_start = response_text.find("```json") + 7
+        json_end = response_text.find("```", json_start)
+        json_text = response_text[json_start:json_end].strip()
+    elif "```" in response_text:
+        json_start = response_text.find("```") + 3
+        json_end = response_text.find("```", json_start)
+        json_text = response_text[json_start:json_end].strip()
+    else:
+        json_text = response_text.strip()
+
+    # 解析 JSON
+    try:
+        result_data = json.loads(json_text)
+        ranked_docs = result_data.get("ranked_docs", [])
+        return ranked_docs, False
+    except json.JSONDecodeError:
+        # 如果解析失败，返回原始顺序
+        ranked_docs = []
+        for i, doc in enumerate(doc_list):
+            ranked_docs.append({
+                "id": doc.get("id", str(i)),
+                "score": 0.5,
+                "reason": "JSON 解析失败，保持原始顺序"
+            })
+        return ranked_docs, True
+
+
+def _endpoint_scores(query: str, doc_list: List[dict]) -> List[dict]:
+    """
+    endpoint 后端：调用 /rerank 接口批量打分
+
+    Raises:
+        RerankError: 接口调用失败
+    """
+    contents = [doc.get("content", doc.get("text", "")) for doc in doc_list]
+    scores = get_rerank_client().rerank(query, contents)
+    return [
+        {"id": doc.get("id", str(i)), "score": score, "reason": ""}
+        for i, (doc, score) in enumerate(zip(doc_list, scores))
+    ]
+
+
+def _score_documents(query: str, doc_list: List[dict], config, backend: str) -> Tuple[List[dict], bool]:
+    """
+    按配置的后端打分（endpoint 失败时按 rerank.fallback_to_chat 回退到 chat）
+
+    Returns:
+        (评分列表 [{"id", "score", "reason"}], 分数是否可以缓存（chat 解析失败时的占位分数不缓存）)
+
+    Raises:
+        RuntimeError: 打分失败
+    """
+    fallback_to_chat = str(config.get("rerank.fallback_to_chat", True)).lower() in ("true", "1")
+    if backend == "endpoint":
+        start = time.perf_counter()
+        try:
+            ranked_docs = _endpoint_scores(query, doc_list)
+            record_rerank_call("endpoint", (time.perf_counter() - start) * 1000, len(doc_list))
+            return ranked_docs, True
+        except RerankError as e:
+            record_rerank_call("endpoint", (time.perf_counter() - start) * 1000, len(doc_list), error=True)
+            if not fallback_to_chat:
+                raise RuntimeError(f"Rerank 失败: {str(e)}")
+            print(f"{e}，回退到 chat 后端")
+
+    start = time.perf_counter()
+    try:
+        ranked_docs, parse_failed = _chat_scores(query, doc_list, config)
+        record_rerank_call("chat", (time.perf_counter() - start) * 1000, len(doc_list), parse_failed=parse_failed)
+        # endpoint 失败后回退得到的分数与 endpoint 的分数不可比，不写入缓存
+        return ranked_docs, not parse_failed and backend == "chat"
+    except Exception as e:
+        record_rerank_call("chat", (time.perf_counter() - start) * 1000, len(doc_list), error=True)
+        raise RuntimeError(f"LLM Rerank 失败: {str(e)}")
+
+
+# 分片打分共用的线程池，首次使用时按配置创建
+_shard_executor: Optional[ThreadPoolExecutor] = None
+_shard_executor_lock = threading.Lock()
+
+# 分片打分失败时该分片文档的占位分数（与“未在评分结果中找到”一致）
+DEGRADED_SCORE = 0.3
+
+
+def _get_shard_executor(max_workers: int) -> ThreadPoolExecutor:
+    """获取分片打分线程池（容量由 rerank.sharding.max_workers 配置）"""
+    global _shard_executor
+    if _shard_executor is None:
+        with _shard_executor_lock:
+            if _shard_executor is None:
+                _shard_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rerank-shard")
+    return _shard_executor
+
+
+def _score_sharded(query: str, doc_list: List[dict], config, backend: str) -> Tuple[List[dict], set]:
+    """
+    把候选拆成分片并发打分后合并
+
+    分片大小按后端配置（rerank.sharding.chat_shard_size / endpoint_shard_size），
+    某个分片失败时只有该分片的文档取占位分数，其余分片的排序不受影响；全部分片失败时报错。
+
+    Returns:
+        (评分列表 [{"id", "score", "reason"}], 分数可以缓存的文档 id)
+
+    Raises:
+        RuntimeError: 所有分片都打分失败
+    """
+    shard_size = max(int(config.get(f"rerank.sharding.{backend}_shard_size", 32 if backend == "endpoint" else 8)), 1)
+    shards = [doc_list[i:i + shard_size] for i in range(0, len(doc_list), shard_size)]
+    if len(shards) == 1:
+        ranked_docs, cacheable = _score_documents(query, doc_list, config, backend)
+        return ranked_docs, {doc["id"] for doc in doc_list} if cacheable else set()
+
+    executor = _get_shard_executor(int(config.get("rerank.sharding.max_workers", 4)))
+    futures = [executor.submit(_score_documents, query, shard, config, backend) for shard in shards]
+    ranked_docs: List[dict] = []
+    cacheable_ids: set = set()
+    errors = []
+    for shard, future in zip(shards, futures):
+        try:
+            scored, cacheable = future.result()
+        except RuntimeError as e:
+            errors.append(str(e))
+            print(f"Rerank 分片（{len(shard)} 个文档）打分失败，该分片降级: {e}")
+            ranked_docs.extend(
+                {"id": doc["id"], "score": DEGRADED_SCORE, "reason": "分片打分失败"} for doc in shard
+            )
+            continue
+        ranked_docs.extend(scored)
+        if cacheable:
+            cacheable_ids.update(doc["id"] for doc in shard)
+    if len(errors) == len(shards):
+        raise RuntimeError(f"Rerank 所有分片均失败: {errors[0]}")
+    return ranked_docs, cacheable_ids
+
+
 @tool
 def rerank_documents(
     query: str,
     documents: str,
-    top_n: Optional[int] = 5
+    top_n: Optional[int] = 5,
+    prune_to: Optional[int] = None
 ) -> str:
     """
-    使用大语言模型对检索结果进行重排序
+    对检索结果进行重排序（默认调用 /rerank 接口批量打分，失败时回退到大语言模型评分）
 
     Args:
         query: 用户查询
@@ -55,13 +290,15 @@ def rerank_documents(
                 {"content": "文档2内容", "id": "2"}
             ]
         top_n: 返回的 top-k 结果数（默认 5）
+        prune_to: 送给模型前先用本地预排序（BM25 / 词项重合 / 已有的向量相似度）保留的候选数，
+            None 表示不预排序（见 tools.rerank_cascade）
 
     Returns:
         重排序后的文档列表（带相关性分数）
 
     Raises:
         ValueError: 如果参数无效
-        RuntimeError: 如果LLM调用失败
+        RuntimeError: 如果 Rerank 调用失败
     """
     if not query or not query.strip():
         raise ValueError("查询不能为空")
@@ -75,145 +312,76 @@ def rerank_documents(
     # 限制 top_n 不超过文档总数
     top_n = min(top_n, len(doc_list))
 
-    try:
-        from utils.config_loader import get_config
-        config = get_config()
-        
-        # 从配置中获取需要的环境变量
-        api_key_env = config.get("rerank.api_key_env", "SILICONFLOW_API_KEY")
-        base_url_env = config.get("rerank.base_url_env", "SILICONFLOW_BASE_URL")
-        
-        api_key = os.getenv(api_key_env)
-        base_url = os.getenv(base_url_env)
-
-        if not api_key:
-            raise RuntimeError(f"未找到必要的环境变量: {api_key_env}")
-        
-        if not base_url:
-            base_url = "https://api.siliconflow.cn/v1"
-
-        # 从配置中动态获取模型名称
-        model_name = config.get("rerank.llm_model", "Qwen/Qwen3-Reranker-0.6B")
-
-        llm = ChatOpenAI(
-            model=model_name,
-            api_key=api_key,
-            base_url=base_url,
-            temperature=0.1,  # 低温度以获得稳定排序
-            max_tokens=1000,
-        )
-
-        # 构建提示词
-        system_prompt = """你是一个专业的文档相关性评估专家。你的任务是根据查询对文档进行相关性评分和排序。
-
-评分标准：
-- 1.0: 完全相关，直接回答了查询问题
-- 0.8-0.9: 高度相关，提供了查询所需的大部分信息
-- 0.6-0.7: 中度相关，部分回答了查询问题
-- 0.4-0.5: 低度相关，仅提供少量相关信息
-- 0.0-0.3: 不相关或几乎不相关
-
-请严格按照以下JSON格式输出，不要输出其他任何内容：
-```json
-{
-  "ranked_docs": [
-    {
-      "id": "文档ID",
-      "score": 0.95,
-      "reason": "简短说明相关性原因"
-    }
-  ]
-}
-```"""
-
-        # 准备文档列表
-        docs_text = ""
-        for i, doc in enumerate(doc_list):
-            content = doc.get("content", doc.get("text", ""))[:300]
-            doc_id = doc.get("id", str(i))
-            docs_text += f"\n文档 {doc_id}:\n{content}\n"
-
-        user_message = f"""查询：{query}
-
-待排序文档：
-{docs_text}
-
-请对以上文档进行相关性评分和排序，返回 JSON 格式的结果。"""
-
-        # 调用 LLM
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_message)
-        ]
-
-        response = llm.invoke(messages)
-
-        # 解析响应
-        response_content = response.content
-
-        # 如果是列表，合并成字符串
-        if isinstance(response_content, list):
-            response_text = "".join(str(item) for item in response_content)
-        else:
-            response_text = str(response_content)
-
-        # 提取 JSON
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            json_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            json_text = response_text[json_start:json_end].strip()
-        else:
-            json_text = response_text.strip()
-
-        # 解析 JSON
-        try:
-            result_data = json.loads(json_text)
-            ranked_docs = result_data.get("ranked_docs", [])
-        except json.JSONDecodeError:
-            # 如果解析失败，返回原始顺序
-            ranked_docs = []
-            for i, doc in enumerate(doc_list):
-                ranked_docs.append({
-                    "id": doc.get("id", str(i)),
-                    "score": 0.5,
-                    "reason": "JSON 解析失败，保持原始顺序"
-                })
-
-        # 将分数映射到原始文档
-        doc_dict = {doc.get("id", str(i)): doc for i, doc in enumerate(doc_list)}
-
-        # 按 id 匹配并重新排序
-        ranked_results = []
-        for ranked_item in ranked_docs:
-            doc_id = ranked_item.get("id")
-            if doc_id in doc_dict:
-                original_doc = doc_dict[doc_id]
-                original_doc["relevance_score"] = ranked_item.get("score", 0.5)
-                original_doc["reason"] = ranked_item.get("reason", "")
-                ranked_results.append(original_doc)
-
-        # 如果某些文档没有在结果中，追加到末尾
-        returned_ids = {item.get("id") for item in ranked_docs}
-        for doc_id, doc in doc_dict.items():
-            if doc_id not in returned_ids:
-                doc["relevance_score"] = 0.3
-                doc["reason"] = "未在LLM评分结果中找到"
-                ranked_results.append(doc)
-
-        # 按 relevance_score 降序排序
-        ranked_results.sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
-
-        # 只返回 top_n
-        top_results = ranked_results[:top_n]
-
-        # 格式化输出
-        output = json.dumps(top_results, ensure_ascii=False, indent=2)
-
-        return output
-
-    except Exception as e:
-        raise RuntimeError(f"LLM Rerank 失败: {str(e)}")
+    # 没有 id 的文档按位置编号（缓存命中与送去打分的文档需要共用同一套 id）
+    for i, doc in enumerate(doc_list):
+        doc.setdefault("id", str(i))
+
+    from utils.config_loader import get_config
+    config = get_config()
+    backend = config.get("rerank.backend", "endpoint")
+
+    # 本地预排序：明显不相关的候选不送给模型
+    pruned = []
+    if prune_to and str(config.get("rerank.cascade.enabled", True)).lower() in ("true", "1"):
+        doc_list, pruned = cascade_prune(query, doc_list, int(prune_to), config.get("rerank.cascade.weights"))
+
+    # 已缓存的查询-文本块对直接取分数，只把未缓存的送去打分
+    cache = get_rerank_cache()
+    ranked_docs = []
+    pending = doc_list
+    if cache is not None:
+        model = config.get("rerank.endpoint.model", config.get("rerank.llm_model", "")) if backend == "endpoint" \
+            else config.get("rerank.llm_model", "")
+        query_fp = cache.fingerprint(query, f"{backend}:{model}")
+        hits = cache.lookup(query_fp, doc_list)
+        for i, (score, reason) in hits.items():
+            ranked_docs.append({"id": doc_list[i]["id"], "score": score, "reason": reason})
+        pending = [doc for i, doc in enumerate(doc_list) if i not in hits]
+
+    if pending:
+        scored, cacheable_ids = _score_sharded(query, pending, config, backend)
+        ranked_docs.extend(scored)
+        if cache is not None and cacheable_ids:
+            by_id = {doc["id"]: doc for doc in pending if doc["id"] in cacheable_ids}
+            for item in scored:
+                doc = by_id.get(item.get("id"))
+                if doc is not None and item.get("score") is not None:
+                    cache.store(query_fp, doc, item["score"], item.get("reason", ""))
+
+    # 将分数映射到原始文档
+    doc_dict = {doc.get("id", str(i)): doc for i, doc in enumerate(doc_list)}
+
+    # 按 id 匹配并重新排序
+    ranked_results = []
+    for ranked_item in ranked_docs:
+        doc_id = ranked_item.get("id")
+        if doc_id in doc_dict:
+            original_doc = doc_dict[doc_id]
+            original_doc["relevance_score"] = ranked_item.get("score", 0.5)
+            original_doc["reason"] = ranked_item.get("reason", "")
+            ranked_results.append(original_doc)
+
+    # 如果某些文档没有在结果中，追加到末尾
+    returned_ids = {item.get("id") for item in ranked_docs}
+    for doc_id, doc in doc_dict.items():
+        if doc_id not in returned_ids:
+            doc["relevance_score"] = 0.3
+            doc["reason"] = "未在LLM评分结果中找到"
+            ranked_results.append(doc)
+
+    # 按 relevance_score 降序排序
+    ranked_results.sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
+
+    # 预排序淘汰的候选排在模型打分的候选之后
+    for doc in pruned:
+        doc["relevance_score"] = 0.0
+        doc["reason"] = "本地预排序淘汰"
+        ranked_results.append(doc)
+
+    # 只返回 top_n
+    top_results = ranked_results[:top_n]
+
+    # 格式化输出
+    output = json.dumps(top_results, ensure_ascii=False, indent=2)
+
+    return output
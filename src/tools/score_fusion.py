@@ -0,0 +1,367 @@
+"""
+混合检索分数融合
+按文本块标识（pgvector 行ID，没有时用去空白后的内容哈希）对齐各路检索结果，
+再在对齐后的分数矩阵上做归一化与融合，整个计算是数组运算，不逐文档建字典打分。
+
+融合方法通过 register_fuser 注册，按名称选择（weighted / sigmoid / rrf / zscore /
+combsum / combmnz / dbsf）。各路分数需统一为“越大越相关”。
+"""
+import hashlib
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# RRF 常数
+RRF_K = 60
+
+
+def content_hash(text: str) -> str:
+    """文本块内容哈希（忽略所有空白字符，只差空白的同一文本块哈希相同）"""
+    return hashlib.md5("".join(text.split()).encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+def _result_text(result: Dict[str, Any]) -> str:
+    return result.get("document", result.get("text", result.get("page_content", ""))) or ""
+
+
+def _row_id(result: Dict[str, Any]) -> Optional[str]:
+    row_id = result.get("id")
+    return str(row_id) if row_id not in (None, "") else None
+
+
+class AlignedCandidates:
+    """
+    按文本块对齐后的多路候选
+
+    属性：
+        results:   list[N]，每个文本块首次出现时的检索结果
+        chunk_ids: list[N]，文本块标识（行ID 或内容哈希）
+        scores:    float64[L, N]，各路原始分数（未命中该路为 0）
+        ranks:     int64[L, N]，各路排名（从 0 开始，未命中该路为 -1）
+    """
+
+    def __init__(
+        self,
+        results: List[Dict[str, Any]],
+        chunk_ids: List[str],
+        scores: np.ndarray,
+        ranks: np.ndarray
+    ):
+        self.results = results
+        self.chunk_ids = chunk_ids
+        self.scores = scores
+        self.ranks = ranks
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    @property
+    def present(self) -> np.ndarray:
+        """bool[L, N]，文本块是否被该路命中"""
+        return self.ranks >= 0
+
+
+def _align_by_row_id(
+    legs: Sequence[Sequence[Dict[str, Any]]],
+    score_fields: Sequence[Sequence[str]]
+) -> Optional[AlignedCandidates]:
+    """
+    所有结果都有行ID时的对齐快速路径（检索结果来自 pgvector 时总是如此）
+
+    不计算内容哈希，分数矩阵由各路的 Python 列表一次构建；遇到没有行ID的结果时返回 None，
+    由 align_candidates 走通用路径。
+    """
+    by_id: Dict[str, int] = {}
+    results: List[Dict[str, Any]] = []
+    chunk_ids: List[str] = []
+    leg_columns: List[Tuple[List[int], List[float], List[int]]] = []
+    for leg, fields in zip(legs, score_fields):
+        slots: List[int] = []
+        scores: List[float] = []
+        ranks: List[int] = []
+        seen = set()
+        for rank, result in enumerate(leg):
+            row_id = result.get("id")
+            if row_id is None or row_id == "":
+                return None
+            if type(row_id) is not str:
+                row_id = str(row_id)
+            slot = by_id.get(row_id)
+            if slot is None:
+                slot = by_id[row_id] = len(results)
+                results.append(result)
+                chunk_ids.append(row_id)
+            elif slot in seen:
+                continue
+            seen.add(slot)
+            for field in fields:
+                score = result.get(field)
+                if score is not None:
+                    break
+            else:
+                score = 0.0
+            slots.append(slot)
+            scores.append(float(score))
+            ranks.append(rank)
+        leg_columns.append((slots, scores, ranks))
+
+    n = len(results)
+    score_rows = []
+    rank_rows = []
+    for slots, scores, ranks in leg_columns:
+        score_row = [0.0] * n
+        rank_row = [-1] * n
+        for slot, score, rank in zip(slots, scores, ranks):
+            score_row[slot] = score
+            rank_row[slot] = rank
+        score_rows.append(score_row)
+        rank_rows.append(rank_row)
+    return AlignedCandidates(
+        results,
+        chunk_ids,
+        np.array(score_rows, dtype=np.float64).reshape(len(legs), n),
+        np.array(rank_rows, dtype=np.int64).reshape(len(legs), n)
+    )
+
+
+def align_candidates(
+    legs: Sequence[Sequence[Dict[str, Any]]],
+    score_fields: Sequence[Sequence[str]]
+) -> AlignedCandidates:
+    """
+    按文本块标识对齐多路检索结果
+
+    两个结果都有行ID时只按行ID匹配（内容相同的不同行仍是不同文本块）；
+    任一方没有行ID时按内容哈希匹配。同一路内重复出现的文本块只保留排名最靠前的一次。
+
+    Args:
+        legs: 各路检索结果（按该路排名排列）
+        score_fields: 各路读取分数的字段（依次尝试）
+
+    Returns:
+        AlignedCandidates
+    """
+    aligned = _align_by_row_id(legs, score_fields)
+    if aligned is not None:
+        return aligned
+
+    by_id: Dict[str, int] = {}
+    by_hash: Dict[str, int] = {}
+    slot_row_ids: List[Optional[str]] = []
+    results: List[Dict[str, Any]] = []
+    chunk_ids: List[str] = []
+    leg_slots: List[List[int]] = []
+    leg_scores: List[List[float]] = []
+    leg_ranks: List[List[int]] = []
+    # 内容哈希只在出现没有行ID的结果后才需要：此时为已有文本块补算一次，之后新文本块随到随算
+    hashing = False
+
+    def add_hash(slot: int) -> None:
+        by_hash.setdefault(content_hash(_result_text(results[slot])), slot)
+
+    for leg, fields in zip(legs, score_fields):
+        slots, scores, ranks = [], [], []
+        seen = set()
+        for rank, result in enumerate(leg):
+            row_id = _row_id(result)
+            slot = by_id.get(row_id) if row_id is not None else None
+            if slot is None and row_id is None and not hashing:
+                hashing = True
+                for existing in range(len(results)):
+                    add_hash(existing)
+            if slot is None and hashing:
+                digest = content_hash(_result_text(result))
+                slot = by_hash.get(digest)
+                if slot is not None and row_id is not None and slot_row_ids[slot] not in (None, row_id):
+                    slot = None
+            if slot is None:
+                slot = len(results)
+                results.append(result)
+                chunk_ids.append(row_id if row_id is not None else digest)
+                slot_row_ids.append(row_id)
+                if hashing:
+                    by_hash.setdefault(digest, slot)
+            elif row_id is not None and slot_row_ids[slot] is None:
+                slot_row_ids[slot] = row_id
+            if row_id is not None:
+                by_id.setdefault(row_id, slot)
+            if slot in seen:
+                continue
+            seen.add(slot)
+            slots.append(slot)
+            score = next((result[f] for f in fields if result.get(f) is not None), 0.0)
+            scores.append(float(score))
+            ranks.append(rank)
+        leg_slots.append(slots)
+        leg_scores.append(scores)
+        leg_ranks.append(ranks)
+
+    n = len(results)
+    score_matrix = np.zeros((len(legs), n), dtype=np.float64)
+    rank_matrix = np.full((len(legs), n), -1, dtype=np.int64)
+    for i, (slots, scores, ranks) in enumerate(zip(leg_slots, leg_scores, leg_ranks)):
+        score_matrix[i, slots] = scores
+        rank_matrix[i, slots] = ranks
+    return AlignedCandidates(results, chunk_ids, score_matrix, rank_matrix)
+
+
+def normalize_rows(scores: np.ndarray, method: str = "minmax") -> np.ndarray:
+    """
+    按行把分数归一化到 [0, 1]
+
+    Args:
+        scores: float64[L, N]
+        method: minmax=最小-最大归一化（整行相同时取 0.5），sigmoid=Sigmoid归一化
+
+    Returns:
+        归一化后的分数矩阵
+    """
+    if method == "sigmoid":
+        return 1 / (1 + np.exp(-scores))
+    if scores.shape[1] == 0:
+        return scores.copy()
+    low = scores.min(axis=1, keepdims=True)
+    span = scores.max(axis=1, keepdims=True) - low
+    flat = span <= 0
+    normalized = (scores - low) / np.where(flat, 1.0, span)
+    return np.where(flat, 0.5, normalized)
+
+
+# ==================== 融合方法注册表 ====================
+
+# 融合方法：(对齐后的候选, 各路权重 float64[L]) → 融合分数 float64[N]
+Fuser = Callable[[AlignedCandidates, np.ndarray], np.ndarray]
+
+_FUSERS: Dict[str, Fuser] = {}
+
+
+def register_fuser(name: str) -> Callable[[Fuser], Fuser]:
+    """注册融合方法（装饰器）"""
+    def decorator(func: Fuser) -> Fuser:
+        _FUSERS[name] = func
+        return func
+    return decorator
+
+
+def get_fuser(name: str) -> Fuser:
+    """
+    按名称获取融合方法
+
+    Raises:
+        ValueError: 未注册的融合方法
+    """
+    fuser = _FUSERS.get(name)
+    if fuser is None:
+        raise ValueError(f"未知的融合方法: {name}（可选: {', '.join(available_fusers())}）")
+    return fuser
+
+
+def available_fusers() -> List[str]:
+    """已注册的融合方法名称"""
+    return sorted(_FUSERS)
+
+
+def fuse_scores(aligned: AlignedCandidates, weights: Sequence[float], method: str = "weighted") -> np.ndarray:
+    """
+    计算融合分数
+
+    Args:
+        aligned: 对齐后的候选
+        weights: 各路权重
+        method: 融合方法名称（见 available_fusers）
+
+    Returns:
+        float64[N] 融合分数
+
+    Raises:
+        ValueError: 未注册的融合方法
+    """
+    fuser = get_fuser(method)
+    if len(aligned) == 0:
+        return np.zeros(0, dtype=np.float64)
+    return fuser(aligned, np.asarray(weights, dtype=np.float64))
+
+
+def _present_moments(aligned: AlignedCandidates) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """每一路只统计命中文本块的 (命中数, 均值, 标准差)，形状均为 [L, 1]"""
+    present = aligned.present
+    counts = present.sum(axis=1, keepdims=True)
+    safe = np.maximum(counts, 1)
+    mean = np.where(present, aligned.scores, 0.0).sum(axis=1, keepdims=True) / safe
+    var = np.where(present, (aligned.scores - mean) ** 2, 0.0).sum(axis=1, keepdims=True) / safe
+    return counts, mean, np.sqrt(var)
+
+
+def _minmax_present(aligned: AlignedCandidates) -> np.ndarray:
+    """每一路只在命中的文本块上做最小-最大归一化，未命中为 0"""
+    present = aligned.present
+    low = np.where(present, aligned.scores, np.inf).min(axis=1, keepdims=True)
+    high = np.where(present, aligned.scores, -np.inf).max(axis=1, keepdims=True)
+    span = high - low
+    flat = ~(span > 0)
+    normalized = np.where(flat, 1.0, (aligned.scores - np.where(flat, 0.0, low)) / np.where(flat, 1.0, span))
+    return np.where(present, normalized, 0.0)
+
+
+@register_fuser("weighted")
+def _fuse_weighted(aligned: AlignedCandidates, weights: np.ndarray) -> np.ndarray:
+    """最小-最大归一化后加权（未命中的一路按 0 分参与归一化）"""
+    return weights @ normalize_rows(aligned.scores, "minmax")
+
+
+@register_fuser("sigmoid")
+def _fuse_sigmoid(aligned: AlignedCandidates, weights: np.ndarray) -> np.ndarray:
+    """Sigmoid 归一化后加权"""
+    return weights @ normalize_rows(aligned.scores, "sigmoid")
+
+
+@register_fuser("rrf")
+def _fuse_rrf(aligned: AlignedCandidates, weights: np.ndarray) -> np.ndarray:
+    """倒数排名融合（未命中的一路贡献 0）"""
+    return weights @ np.where(aligned.present, 1.0 / (RRF_K + aligned.ranks + 1), 0.0)
+
+
+@register_fuser("zscore")
+def _fuse_zscore(aligned: AlignedCandidates, weights: np.ndarray) -> np.ndarray:
+    """
+    z-score 归一化后加权：每一路按命中文本块的均值 / 标准差标准化，
+    未命中的一路取该路最低的 z 值（视为与该路最弱的命中一样弱，而不是平均水平）
+    """
+    present = aligned.present
+    _, mean, std = _present_moments(aligned)
+    z = (aligned.scores - mean) / np.where(std > 0, std, 1.0)
+    floor = np.where(present, z, np.inf).min(axis=1, keepdims=True)
+    floor = np.where(np.isfinite(floor), floor, 0.0)
+    return weights @ np.where(present, z, floor)
+
+
+@register_fuser("combsum")
+def _fuse_combsum(aligned: AlignedCandidates, weights: np.ndarray) -> np.ndarray:
+    """CombSUM：每一路只在命中文本块上最小-最大归一化，加权求和（未命中贡献 0）"""
+    return weights @ _minmax_present(aligned)
+
+
+@register_fuser("combmnz")
+def _fuse_combmnz(aligned: AlignedCandidates, weights: np.ndarray) -> np.ndarray:
+    """CombMNZ：CombSUM × 命中的路数，奖励多路同时召回的文本块"""
+    return _fuse_combsum(aligned, weights) * aligned.present.sum(axis=0)
+
+
+@register_fuser("dbsf")
+def _fuse_dbsf(aligned: AlignedCandidates, weights: np.ndarray) -> np.ndarray:
+    """
+    基于分布的分数融合（DBSF）：每一路以命中分数的 均值 ± 3σ 为上下界归一化并截断到 [0, 1]，
+    对各路分数分布的尺度和离群值都不敏感；未命中贡献 0
+    """
+    present = aligned.present
+    _, mean, std = _present_moments(aligned)
+    low = mean - 3 * std
+    span = 6 * std
+    normalized = np.where(span > 0, (aligned.scores - low) / np.where(span > 0, span, 1.0), 0.5)
+    return weights @ np.where(present, np.clip(normalized, 0.0, 1.0), 0.0)
+
+
+def rank_fused(fused: np.ndarray, top_k: Optional[int] = None) -> np.ndarray:
+    """融合分数降序的候选下标（同分按首次出现顺序），可只取前 top_k 个"""
+    order = np.argsort(-fused, kind="stable")
+    return order if top_k is None else order[:top_k]
@@ -2,8 +2,16 @@
 向量存储配置
 支持 PGVector 向量数据库 + 硅基流动 (SiliconFlow) Embedding API
 """
+import asyncio
+import logging
 import os
-from typing import Optional, Union, List
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple, Union
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 
@@ -11,6 +19,21 @@ from langchain_core.embeddings import Embeddings
 _vector_store = None
 _embeddings_client = None
 
+# 向量存储注册表：(集合, 连接串, Embeddings) → PGVector 实例
+_store_registry: Dict[Tuple[str, str, Embeddings], Any] = {}
+# 正在创建的实例：同一个键的并发调用等待同一个 Future，不同键互不阻塞
+_store_pending: Dict[Tuple[str, str, Embeddings], Future] = {}
+_store_lock = threading.Lock()
+_store_hits = 0
+_hits_lock = threading.Lock()
+_engines: Dict[str, Any] = {}
+_engine_lock = threading.Lock()
+
+# 当前上下文中 PGVector 查询的 statement_timeout（毫秒），见 statement_timeout()
+_statement_timeout: ContextVar[Optional[int]] = ContextVar("pgvector_statement_timeout", default=None)
+
+logger = logging.getLogger(__name__)
+
 
 def __get_connection_string() -> str:
     """获取 PostgreSQL 连接字符串"""
@@ -38,14 +61,169 @@ def __get_connection_string() -> str:
     return connection_string
 
 
-class SiliconFlowEmbeddings(Embeddings):
-    """硅基流动 Embedding API 封装（兼容 LangChain Embeddings 接口）"""
+class BatchedEmbeddings(Embeddings, ABC):
+    """
+    分批并发的 Embeddings 基类（兼容 LangChain Embeddings 接口）
+
+    embed_documents 按 batch_size 拆分输入，用有界线程池并发请求各批次，
+    失败的批次单独重试（成功的批次不重发），结果按输入顺序返回；
+    aembed_documents 在事件循环内以相同策略并发。子类实现 _embed_batch / _aembed_batch（一个批次一次请求）。
+    查询（embed_query / embed_query_batch）走检索的关键路径，只请求一次、使用较短的 query_timeout，
+    失败由检索调用方降级处理。
+    """
+
+    def __init__(
+        self,
+        model: str,
+        batch_size: int = 100,
+        max_workers: int = 4,
+        max_retries: int = 2,
+        query_timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            model: 模型名称
+            batch_size: 每个请求包含的最大文本数
+            max_workers: 并发请求的最大批次数
+            max_retries: 失败批次的最大重试次数
+            query_timeout: 查询请求的超时（秒，None 表示与文档请求相同）
+        """
+        self.model = model
+        self.batch_size = max(int(batch_size), 1)
+        self.max_workers = max(int(max_workers), 1)
+        self.max_retries = max(int(max_retries), 0)
+        self.query_timeout = float(query_timeout) if query_timeout is not None else None
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embedding")
+        return self._executor
+
+    @abstractmethod
+    def _embed_batch(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """嵌入一个批次（一次请求；timeout 为 None 时使用客户端默认超时）"""
+
+    @abstractmethod
+    async def _aembed_batch(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """异步嵌入一个批次（一次请求；timeout 为 None 时使用客户端默认超时）"""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        嵌入多个文本（分批并发，按输入顺序返回）
+        """
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results: List[Optional[List[List[float]]]] = [None] * len(batches)
+        pending = list(range(len(batches)))
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(min(0.5 * 2 ** (attempt - 1), 4.0))
+            # 只有一个批次时直接在当前线程请求
+            if len(pending) == 1:
+                futures = {pending[0]: None}
+            else:
+                executor = self._get_executor()
+                futures = {i: executor.submit(self._embed_batch, batches[i]) for i in pending}
+            failed = []
+            for i, future in futures.items():
+                try:
+                    results[i] = future.result() if future is not None else self._embed_batch(batches[i])
+                except Exception as e:
+                    last_error = e
+                    failed.append(i)
+            pending = failed
+            if not pending:
+                break
+
+        if pending:
+            raise RuntimeError(
+                f"调用 Embedding API 失败（{self.model}，{len(pending)}/{len(batches)} 个批次）: {str(last_error)}"
+            )
+        return [embedding for batch in results for embedding in batch]
+
+    def embed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        嵌入一批查询（一次请求，使用 query_timeout，不重试）
+        """
+        return self._embed_batch(texts, timeout=self.query_timeout)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        嵌入单个查询
+        """
+        return self.embed_query_batch([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        异步嵌入多个文本（与 embed_documents 相同的分批与重试策略，
+        在事件循环内并发请求，最多 max_workers 个批次同时进行）
+        """
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results: List[Optional[List[List[float]]]] = [None] * len(batches)
+        pending = list(range(len(batches)))
+        last_error: Optional[Exception] = None
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def run(i: int) -> List[List[float]]:
+            async with semaphore:
+                return await self._aembed_batch(batches[i])
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(min(0.5 * 2 ** (attempt - 1), 4.0))
+            outcomes = await asyncio.gather(*(run(i) for i in pending), return_exceptions=True)
+            failed = []
+            for i, outcome in zip(pending, outcomes):
+                if isinstance(outcome, Exception):
+                    last_error = outcome
+                    failed.append(i)
+                else:
+                    results[i] = outcome
+            pending = failed
+            if not pending:
+                break
+
+        if pending:
+            raise RuntimeError(
+                f"调用 Embedding API 失败（{self.model}，{len(pending)}/{len(batches)} 个批次）: {str(last_error)}"
+            )
+        return [embedding for batch in results for embedding in batch]
+
+    async def aembed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        异步嵌入一批查询（一次请求，使用 query_timeout，不重试）
+        """
+        return await self._aembed_batch(texts, timeout=self.query_timeout)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        异步嵌入单个查询
+        """
+        return (await self.aembed_query_batch([text]))[0]
+
+
+class SiliconFlowEmbeddings(BatchedEmbeddings):
+    """硅基流动 Embedding API 封装（分批与重试策略见 BatchedEmbeddings）"""
 
     def __init__(
         self,
         model: str = "BAAI/bge-m3",
         api_key: Optional[str] = None,
-        base_url: Optional[str] = "https://api.siliconflow.cn/v1"
+        base_url: Optional[str] = "https://api.siliconflow.cn/v1",
+        batch_size: int = 100,
+        timeout: float = 60.0,
+        max_workers: int = 4,
+        max_retries: int = 2,
+        query_timeout: Optional[float] = None
     ):
         """
         初始化硅基流动 Embedding
@@ -54,45 +232,66 @@ class SiliconFlowEmbeddings(Embeddings):
             model: 模型名称
             api_key: API Key（默认从环境变量读取）
             base_url: Base URL（默认从环境变量读取）
+            batch_size: 每个请求包含的最大文本数
+            timeout: 单个请求超时（秒）
+            max_workers: 并发请求的最大批次数
+            max_retries: 失败批次的最大重试次数
+            query_timeout: 查询请求的超时（秒，None 表示使用 timeout）
         """
-        self.model = model
+        super().__init__(
+            model,
+            batch_size=batch_size,
+            max_workers=max_workers,
+            max_retries=max_retries,
+            query_timeout=query_timeout
+        )
         self.api_key = api_key or os.getenv("SILICONFLOW_API_KEY")
         self.base_url = base_url or os.getenv("SILICONFLOW_BASE_URL") or "https://api.siliconflow.cn/v1"
+        self.timeout = float(timeout)
 
         if not self.api_key:
             raise ValueError("未找到 API Key 环境变量 (SILICONFLOW_API_KEY)")
 
-        # 动态导入 OpenAI 客户端
+        # 动态导入 OpenAI 客户端（复用共享连接池；重试由 embed_documents 按批次处理）
         try:
-            from openai import OpenAI
+            from openai import AsyncOpenAI, OpenAI
+            from utils.llm_client import get_async_http_client, get_http_client
             self.client = OpenAI(
                 api_key=self.api_key,
-                base_url=self.base_url
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=get_http_client(self.base_url)
+            )
+            self.async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=get_async_http_client(self.base_url)
             )
         except ImportError:
             raise RuntimeError(
                 "未安装 openai 库，请运行: pip install openai"
             )
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """
-        嵌入多个文本
-        """
-        try:
-            response = self.client.embeddings.create(
-                model=self.model,
-                input=texts
-            )
-            embeddings = [item.embedding for item in response.data]
-            return embeddings
-        except Exception as e:
-            raise RuntimeError(f"调用硅基流动 Embedding API 失败: {str(e)}")
-
-    def embed_query(self, text: str) -> List[float]:
-        """
-        嵌入单个查询
-        """
-        return self.embed_documents([text])[0]
+    def _embed_batch(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """嵌入一个批次（一次 API 请求）"""
+        response = self.client.embeddings.create(
+            model=self.model,
+            input=texts,
+            **({"timeout": timeout} if timeout is not None else {})
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def _aembed_batch(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """异步嵌入一个批次（一次 API 请求）"""
+        response = await self.async_client.embeddings.create(
+            model=self.model,
+            input=texts,
+            **({"timeout": timeout} if timeout is not None else {})
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
 
 def __dynamic_import():
@@ -116,9 +315,13 @@ def get_embeddings(
     model: str = "BAAI/bge-m3",
     api_key: Optional[str] = None,
     base_url: Optional[str] = None
-) -> SiliconFlowEmbeddings:
+) -> Embeddings:
     """
-    获取硅基流动 Embeddings 实例
+    获取 Embeddings 实例（硅基流动；embedding.use_mock 开启时为本地模拟 Embedding，见 tools.mock_embeddings）
+
+    embedding.cache.enabled 开启时包装一层持久化缓存（见 tools.embedding_cache），
+    内容未变的文本块重新入库时不再调用 API；embedding.query_cache.enabled 开启时
+    查询向量经过 LRU、单飞合并与微批处理（见 tools.query_embedding）。
     """
     global _embeddings_client
 
@@ -126,17 +329,95 @@ def get_embeddings(
     if _embeddings_client is not None:
         return _embeddings_client
 
+    from utils.config_loader import get_config
+    config = get_config()
+
+    batching = {
+        "batch_size": int(config.get("embedding.batch_size", 100)),
+        "max_workers": int(config.get("embedding.max_workers", 4)),
+        "max_retries": int(config.get("embedding.max_retries", 2)),
+        "query_timeout": float(config.get("embedding.query_timeout", 5))
+    }
+
     try:
-        _embeddings_client = SiliconFlowEmbeddings(
-            model=model,
-            api_key=api_key,
-            base_url=base_url
-        )
+        if str(config.get("embedding.use_mock", False)).lower() in ("true", "1"):
+            from tools.mock_embeddings import MockEmbeddings
+            _embeddings_client = MockEmbeddings(
+                dimension=int(config.get("embedding.mock_dimension", 1024)),
+                ngram_range=config.get("embedding.mock.ngram_range", [1, 3]),
+                latency_ms=float(config.get("embedding.mock.latency_ms", 0)),
+                latency_per_text_ms=float(config.get("embedding.mock.latency_per_text_ms", 0)),
+                jitter_ms=float(config.get("embedding.mock.jitter_ms", 0)),
+                failure_rate=float(config.get("embedding.mock.failure_rate", 0)),
+                seed=int(config.get("embedding.mock.seed", 0)),
+                **batching
+            )
+        else:
+            _embeddings_client = SiliconFlowEmbeddings(
+                model=model,
+                api_key=api_key,
+                base_url=base_url,
+                timeout=float(config.get("embedding.timeout", 60)),
+                **batching
+            )
+        from tools.query_embedding import wrap_query_cache
+        _embeddings_client = wrap_query_cache(_embeddings_client)
+        from tools.embedding_cache import CachedEmbeddings, get_embedding_cache
+        cache = get_embedding_cache()
+        if cache is not None:
+            _embeddings_client = CachedEmbeddings(_embeddings_client, cache)
         return _embeddings_client
     except Exception as e:
         raise RuntimeError(f"创建 Embeddings 失败: {str(e)}")
 
 
+@contextmanager
+def statement_timeout(timeout_ms: Optional[float]):
+    """
+    在当前上下文中为 PGVector 查询设置 statement_timeout（毫秒，None 或 0 表示不限制）
+
+    通过事务开始时的 SET LOCAL 生效，只作用于该事务，不影响连接池中连接的其他使用者。
+    """
+    token = _statement_timeout.set(int(timeout_ms) if timeout_ms else None)
+    try:
+        yield
+    finally:
+        _statement_timeout.reset(token)
+
+
+def _apply_statement_timeout(session, transaction, connection) -> None:
+    timeout_ms = _statement_timeout.get()
+    if timeout_ms:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+
+def _shared_engine(connection_string: str):
+    """
+    获取连接串对应的 SQLAlchemy Engine
+
+    与 storage.database.db 使用同一个数据库（PGDATABASE_URL）时直接复用其 Engine 和连接池，
+    其他连接串各自创建一个 Engine 并缓存。db.get_engine 首次调用会连接重试，
+    用 _engine_lock 保证只创建一次（只阻塞同样在等 Engine 的调用，不影响已缓存的向量存储）。
+    """
+    with _engine_lock:
+        if os.getenv("PGDATABASE_URL"):
+            from storage.database.db import get_db_url, get_engine
+            if connection_string == get_db_url():
+                return get_engine()
+        engine = _engines.get(connection_string)
+        if engine is None:
+            from sqlalchemy import create_engine
+            engine = create_engine(connection_string, pool_pre_ping=True, pool_recycle=1800)
+            _engines[connection_string] = engine
+        return engine
+
+
+def _count_hit() -> None:
+    global _store_hits
+    with _hits_lock:
+        _store_hits += 1
+
+
 def get_vector_store(
     collection_name: str = "knowledge_base",
     embeddings: Optional[Embeddings] = None,
@@ -145,9 +426,13 @@ def get_vector_store(
     """
     获取 PGVector 向量存储实例
 
+    实例按 (集合, 连接串, Embeddings) 缓存在进程级注册表中，集合查找与建表只在首次获取时执行；
+    所有实例共享 storage.database.db 的 Engine 与连接池（见 _shared_engine）。
+    命中不加注册表锁；未命中时按键创建，一个集合的创建（含首次连接数据库的重试）不阻塞其他集合。
+
     Args:
         collection_name: 集合名称
-        embeddings: Embeddings 实例（如果为 None，使用豆包 Embedding）
+        embeddings: Embeddings 实例（如果为 None，使用 get_embeddings()）
         connection_string: 数据库连接字符串（如果为 None，使用默认）
 
     Returns:
@@ -167,21 +452,107 @@ def get_vector_store(
     if connection_string is None:
         connection_string = __get_connection_string()
 
-    # 使用豆包 Embedding 或用户提供的 embeddings
+    # 使用默认 Embeddings 或用户提供的 embeddings
     embeddings = embeddings or get_embeddings()
 
+    key = (collection_name, connection_string, embeddings)
+    vector_store = _store_registry.get(key)
+    if vector_store is not None:
+        _count_hit()
+        return vector_store
+
+    # 同一个键只由第一个调用者创建，其他调用者等待它的结果；创建过程不持有 _store_lock
+    with _store_lock:
+        vector_store = _store_registry.get(key)
+        future = _store_pending.get(key) if vector_store is None else None
+        builder = vector_store is None and future is None
+        if builder:
+            future = Future()
+            _store_pending[key] = future
+    if vector_store is not None:
+        _count_hit()
+        return vector_store
+    if not builder:
+        vector_store = future.result()
+        _count_hit()
+        return vector_store
+
     try:
         vector_store = _vector_store(
             collection_name=collection_name,
-            connection=connection_string,
+            connection=_shared_engine(connection_string),
             embeddings=embeddings,
             use_jsonb=True,  # 使用 JSONB 提高性能
         )
+        if getattr(vector_store, "session_maker", None) is not None:
+            from sqlalchemy import event
+            event.listen(vector_store.session_maker, "after_begin", _apply_statement_timeout)
+    except Exception as e:
+        error = RuntimeError(f"创建向量存储失败: {str(e)}")
+        with _store_lock:
+            if _store_pending.get(key) is future:
+                del _store_pending[key]
+        future.set_exception(error)
+        raise error
+    with _store_lock:
+        # 创建期间被 forget_vector_store 移除的键不再注册
+        if _store_pending.get(key) is future:
+            del _store_pending[key]
+            _store_registry[key] = vector_store
+    future.set_result(vector_store)
+    return vector_store
+
+
+def forget_vector_store(collection_name: Optional[str] = None) -> None:
+    """从注册表移除集合的缓存实例（删除集合后调用；None 表示全部，正在创建的实例创建后不再注册）"""
+    with _store_lock:
+        for registry in (_store_registry, _store_pending):
+            for key in list(registry):
+                if collection_name is None or key[0] == collection_name:
+                    del registry[key]
+
+
+def warm_vector_stores(collection_names: Optional[List[str]] = None) -> List[str]:
+    """
+    启动时预先创建向量存储实例（建立连接池、确认集合存在），失败只记录日志
 
-        return vector_store
+    Args:
+        collection_names: 要预热的集合（默认 vector_store.warm_collections，
+            未配置时为 vector_store.collection_name）
 
-    except Exception as e:
-        raise RuntimeError(f"创建向量存储失败: {str(e)}")
+    Returns:
+        预热成功的集合名称
+    """
+    from utils.config_loader import get_config
+    config = get_config()
+    if collection_names is None:
+        collection_names = config.get("vector_store.warm_collections") or [
+            config.get("vector_store.collection_name", "knowledge_base")
+        ]
+        if isinstance(collection_names, str):
+            collection_names = [name.strip() for name in collection_names.split(",") if name.strip()]
+    warmed = []
+    for name in collection_names:
+        try:
+            get_vector_store(collection_name=name)
+            warmed.append(name)
+        except Exception as e:
+            logger.warning(f"向量存储预热失败（{name}）: {e}")
+    return warmed
+
+
+def get_vector_store_stats() -> dict:
+    """向量存储注册表统计"""
+    with _store_lock:
+        stats = {
+            "stores": len(_store_registry),
+            "collections": sorted({key[0] for key in _store_registry}),
+            "pending": len(_store_pending),
+            "private_engines": len(_engines)
+        }
+    with _hits_lock:
+        stats["hits"] = _store_hits
+    return stats
 
 
 def check_vector_store_setup() -> str:
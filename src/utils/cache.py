@@ -4,7 +4,8 @@
 """
 import time
 import threading
-from typing import Any, Optional, Callable
+from collections import OrderedDict
+from typing import Any, Optional, Callable, Tuple
 from functools import wraps
 import logging
 
@@ -106,6 +107,124 @@ class SimpleCache:
             }
 
 
+class LRUCache:
+    """
+    有界 LRU 缓存（按条目数和估算字节数双重限制）
+
+    超出任一上限时淘汰最久未使用的条目，并统计命中、未命中与淘汰次数。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None
+    ):
+        """
+        Args:
+            max_entries: 最大条目数
+            max_bytes: 最大字节数（None 表示不限制）
+            sizeof: 估算单个缓存值字节数的函数（默认按 0 计）
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._cache: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Any) -> Optional[Any]:
+        """
+        获取缓存值（命中时移到最近使用的位置）
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存值，不存在时返回None
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, key: Any, value: Any) -> None:
+        """
+        设置缓存值，必要时淘汰最久未使用的条目
+
+        单个值超过 max_bytes 时不缓存。
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+        """
+        size = int(self._sizeof(value))
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if self.max_bytes is not None and size > self.max_bytes:
+                logger.debug(f"缓存值过大，不缓存: {key} ({size} 字节)")
+                return
+            self._cache[key] = (value, size)
+            self._bytes += size
+            while self._cache and (
+                len(self._cache) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                _, (_, evicted_size) = self._cache.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def delete(self, key: Any) -> bool:
+        """
+        删除缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            是否删除成功
+        """
+        with self._lock:
+            entry = self._cache.pop(key, None)
+            if entry is None:
+                return False
+            self._bytes -= entry[1]
+            return True
+
+    def clear(self) -> None:
+        """清空所有缓存（保留统计计数）"""
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get_stats(self) -> dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._cache),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+
 # 全局缓存实例
 _cache_instance = SimpleCache()
 
@@ -0,0 +1,192 @@
+"""
+进程级共享 LLM 客户端注册表
+各工具不再每次调用都新建 ChatOpenAI（每个新实例都自带新的连接池，需要重新建立 TCP / TLS 连接），
+而是通过 get_chat_model 按 (模型, 温度, 思考模式, 请求头, 地址, 其他参数) 复用实例；
+所有实例共享同一组按 base_url 划分的 httpx 连接池（同步 / 异步各一个），
+因此即使请求头随请求变化（X-Request-ID），底层 keep-alive 连接仍然复用。
+
+连接复用统计通过 httpcore trace 扩展获得：每个请求计数一次，
+只有新建连接时才会触发 connection.connect_tcp 事件，二者之差即复用连接的请求数。
+"""
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from utils.cache import LRUCache
+
+
+class _ConnectionStats:
+    """连接复用计数（请求数 / 新建连接数）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def add(self, requests: int = 0, new_connections: int = 0) -> None:
+        with self._lock:
+            self.requests += requests
+            self.new_connections += new_connections
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_rate": round(reused / self.requests, 4) if self.requests else 0.0
+            }
+
+
+_connection_stats = _ConnectionStats()
+
+
+def _trace(event_name: str, info: Dict[str, Any]) -> None:
+    if event_name == "connection.connect_tcp.complete":
+        _connection_stats.add(new_connections=1)
+
+
+async def _atrace(event_name: str, info: Dict[str, Any]) -> None:
+    _trace(event_name, info)
+
+
+def _on_request(request: httpx.Request) -> None:
+    _connection_stats.add(requests=1)
+    request.extensions["trace"] = _trace
+
+
+async def _on_arequest(request: httpx.Request) -> None:
+    _connection_stats.add(requests=1)
+    request.extensions["trace"] = _atrace
+
+
+def _pool_limits() -> Tuple[httpx.Limits, float]:
+    from utils.config_loader import get_config
+    config = get_config()
+    limits = httpx.Limits(
+        max_connections=int(config.get("llm.pool.max_connections", 20)),
+        max_keepalive_connections=int(config.get("llm.pool.max_keepalive_connections", 10)),
+        keepalive_expiry=float(config.get("llm.pool.keepalive_expiry", 60))
+    )
+    return limits, float(config.get("llm.timeout", 600))
+
+
+_lock = threading.Lock()
+_http_clients: Dict[Tuple[str, Optional[str]], httpx.Client] = {}
+_async_http_clients: Dict[Tuple[str, Optional[str]], httpx.AsyncClient] = {}
+_models: Optional[LRUCache] = None
+_created = 0
+_reused = 0
+
+
+def get_http_client(base_url: Optional[str] = None) -> httpx.Client:
+    """获取 base_url 对应的共享同步 httpx 客户端（带连接复用统计）"""
+    key = ("sync", base_url)
+    with _lock:
+        client = _http_clients.get(key)
+        if client is None:
+            limits, timeout = _pool_limits()
+            client = httpx.Client(limits=limits, timeout=timeout, event_hooks={"request": [_on_request]})
+            _http_clients[key] = client
+        return client
+
+
+def get_async_http_client(base_url: Optional[str] = None) -> httpx.AsyncClient:
+    """
+    获取 base_url 对应的共享异步 httpx 客户端（带连接复用统计）
+
+    keep-alive 连接属于首次使用它们的事件循环；服务端（main.py）只运行一个事件循环，
+    脚本中不要在多个 asyncio.run 之间复用同一个客户端的连接。
+    """
+    key = ("async", base_url)
+    with _lock:
+        client = _async_http_clients.get(key)
+        if client is None:
+            limits, timeout = _pool_limits()
+            client = httpx.AsyncClient(limits=limits, timeout=timeout, event_hooks={"request": [_on_arequest]})
+            _async_http_clients[key] = client
+        return client
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def get_chat_model(
+    model: str,
+    api_key: Optional[str],
+    base_url: Optional[str],
+    temperature: Optional[float] = None,
+    thinking: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+    **kwargs: Any
+):
+    """
+    获取共享的 ChatOpenAI 实例
+
+    Args:
+        model: 模型名称
+        api_key: API Key
+        base_url: 接口地址
+        temperature: 温度（None 表示使用模型默认值）
+        thinking: 思考模式（enabled / disabled，None 表示不传 extra_body）
+        headers: 默认请求头（如 default_headers(ctx)）
+        **kwargs: 其他 ChatOpenAI 参数（streaming / max_tokens / timeout 等）
+
+    Returns:
+        ChatOpenAI 实例；参数完全相同的调用返回同一个实例
+    """
+    global _models, _created, _reused
+    from langchain_openai import ChatOpenAI
+
+    key = (model, api_key, base_url, temperature, thinking, _freeze(headers or {}), _freeze(kwargs))
+    with _lock:
+        if _models is None:
+            from utils.config_loader import get_config
+            _models = LRUCache(max_entries=int(get_config().get("llm.pool.max_instances", 64)))
+        llm = _models.get(key)
+        if llm is not None:
+            _reused += 1
+            return llm
+
+    params = dict(kwargs)
+    if temperature is not None:
+        params["temperature"] = temperature
+    if thinking is not None:
+        params["extra_body"] = {"thinking": {"type": thinking}}
+    llm = ChatOpenAI(
+        model=model,
+        api_key=api_key,
+        base_url=base_url,
+        default_headers=dict(headers or {}),
+        http_client=get_http_client(base_url),
+        http_async_client=get_async_http_client(base_url),
+        **params
+    )
+    with _lock:
+        existing = _models.get(key)
+        if existing is not None:
+            _reused += 1
+            return existing
+        _models.set(key, llm)
+        _created += 1
+    return llm
+
+
+def get_llm_client_stats() -> Dict[str, Any]:
+    """LLM 客户端注册表统计（实例创建 / 复用次数与连接复用率）"""
+    with _lock:
+        stats = {
+            "instances_created": _created,
+            "instances_reused": _reused,
+            "instances_cached": _models.get_stats().get("entries", 0) if _models is not None else 0,
+            "http_pools": len(_http_clients) + len(_async_http_clients)
+        }
+    stats["connections"] = _connection_stats.snapshot()
+    return stats
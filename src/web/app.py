@@ -242,11 +242,28 @@ def get_cache_stats():
     """获取缓存统计信息"""
     try:
         from utils.cache import get_cache
+        from tools.bm25_retriever import get_bm25_cache_stats, get_bm25_segment_stats
+        from tools.adaptive_depth import get_depth_stats
+        from tools.rerank_client import get_rerank_stats
+        from tools.rerank_cache import get_rerank_cache_stats
+        from utils.llm_client import get_llm_client_stats
+        from tools.embedding_cache import get_embedding_cache_stats
+        from tools.query_embedding import get_query_embedding_stats
+        from tools.vector_store import get_vector_store_stats
         cache = get_cache()
         stats = cache.get_stats()
         return jsonify({
             "status": "success",
-            "cache": stats
+            "cache": stats,
+            "bm25_adhoc_indexes": get_bm25_cache_stats(),
+            "bm25_segments": get_bm25_segment_stats(),
+            "retrieval_depth": get_depth_stats(),
+            "rerank_backends": get_rerank_stats(),
+            "rerank_scores": get_rerank_cache_stats(),
+            "llm_clients": get_llm_client_stats(),
+            "embedding_cache": get_embedding_cache_stats(),
+            "query_embeddings": get_query_embedding_stats(),
+            "vector_stores": get_vector_store_stats()
         })
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -389,7 +406,8 @@ def upload_document():
                 "message": f"成功上传并处理文档: {file_name}",
                 "object_key": ingest_result["object_key"],
                 "chunks_count": ingest_result["chunks"],
-                "hierarchical": use_hierarchical
+                "hierarchical": use_hierarchical,
+                "embedding_cache": ingest_result.get("embedding_cache", {})
             })
         finally:
             # 删除临时文件
@@ -435,6 +453,12 @@ def delete_document(doc_id):
                 cache = get_cache()
                 cache.delete("kb_stats:get_knowledge_stats:():{}")
 
+                # BM25 索引增量删除
+                from tools.bm25_retriever import update_bm25_index
+                update_bm25_index(get_rag_service().collection_name, deleted_source=doc_id)
+                from tools.rerank_cache import invalidate_rerank_cache
+                invalidate_rerank_cache(source=doc_id)
+
                 return jsonify({
                     "status": "success",
                     "message": f"文档 {doc_id} 删除成功"
@@ -525,6 +549,37 @@ def compare_retrieval_methods():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route('/api/knowledge/search', methods=['POST'])
+def scoped_search():
+    """按来源文件 / 父块 / 子块限定范围的 BM25 检索 (通过 RAGService)"""
+    try:
+        rag_service = get_rag_service()
+        data = request.json
+        query = data.get('query', '')
+
+        if not query:
+            return jsonify({"status": "error", "message": "查询不能为空"}), 400
+
+        result = rag_service.scoped_search(
+            query,
+            source=data.get('source') or None,
+            parent_id=data.get('parent_id') or None,
+            child_only=bool(data.get('child_only', False)),
+            top_k=int(data.get('top_k', 5))
+        )
+        if result.get("error"):
+            return jsonify({"status": "error", "message": result["error"]}), 500
+
+        return jsonify({
+            "status": "success",
+            "filters": result.get("filters", {}),
+            "results": result.get("results", [])
+        })
+    except Exception as e:
+        logger.error(f"Scoped search failed: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 @app.route('/api/knowledge/heatmap', methods=['GET'])
 def get_knowledge_heatmap():
     """获取知识热力图数据 (通过 RAGService)"""
@@ -750,4 +805,6 @@ def collaboration_chat():
 
 
 if __name__ == '__main__':
+    from tools.vector_store import warm_vector_stores
+    logger.info(f"向量存储预热完成: {warm_vector_stores()}")
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -505,7 +505,8 @@ async function performCompare() {
     const methods = {
         vector: document.getElementById('compare-vector').checked,
         bm25: document.getElementById('compare-bm25').checked,
-        hybrid: document.getElementById('compare-hybrid').checked
+        hybrid: document.getElementById('compare-hybrid').checked,
+        hybrid_rerank: document.getElementById('compare-hybrid-rerank').checked
     };
 
     const resultsContainer = document.getElementById('compare-results');
@@ -536,6 +537,7 @@ function renderCompareResults(results) {
             <h3 style="font-size: 14px; font-weight: 600; color: #111827; margin-bottom: 12px; display: flex; align-items: center; gap: 8px;">
                 <span style="background: #eff6ff; color: #2563eb; padding: 2px 8px; border-radius: 4px;">${method.toUpperCase()}</span>
                 <span>平均分数: ${data.avg_score.toFixed(4)}</span>
+                <span style="color: #6b7280; font-weight: 400;">耗时: ${data.time.toFixed(0)}ms</span>
             </h3>
             <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 12px;">
                 ${data.results.map((item, i) => `
@@ -552,6 +554,73 @@ function renderCompareResults(results) {
     `).join('');
 }
 
+/**
+ * 范围检索
+ * 在来源文件 / 父块 / 子块范围内做 BM25 检索，过滤在打分时生效
+ */
+async function performScopedSearch() {
+    const query = document.getElementById('compare-query').value;
+    if (!query.trim()) {
+        showToast('请输入查询内容', 'info');
+        return;
+    }
+
+    const resultsContainer = document.getElementById('compare-results');
+    resultsContainer.innerHTML = '<div class="loading-state">检索中...</div>';
+
+    try {
+        const result = await apiCall('/api/knowledge/search', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                query,
+                source: document.getElementById('scope-source').value.trim(),
+                parent_id: document.getElementById('scope-parent-id').value.trim(),
+                child_only: document.getElementById('scope-child-only').checked
+            })
+        });
+
+        if (result.status === 'success') {
+            renderScopedResults(result.results, result.filters);
+        } else {
+            resultsContainer.innerHTML = `<div class="error-state">检索失败: ${result.message}</div>`;
+        }
+    } catch (error) {
+        console.error('范围检索失败:', error);
+        resultsContainer.innerHTML = '<div class="error-state">检索失败</div>';
+    }
+}
+
+function renderScopedResults(results, filters) {
+    const container = document.getElementById('compare-results');
+    const scope = Object.entries(filters || {})
+        .filter(([, value]) => value !== null && value !== undefined)
+        .map(([key, value]) => `${key}=${value}`)
+        .join(', ') || '全库';
+    if (!results || results.length === 0) {
+        container.innerHTML = `<div class="empty-state"><div class="icon">🔍</div><p>范围内未找到相关文本块（${scope}）</p></div>`;
+        return;
+    }
+
+    container.innerHTML = `
+        <h3 style="font-size: 14px; font-weight: 600; color: #111827; margin-bottom: 12px; display: flex; align-items: center; gap: 8px;">
+            <span style="background: #eff6ff; color: #2563eb; padding: 2px 8px; border-radius: 4px;">BM25</span>
+            <span style="color: #6b7280; font-weight: 400;">范围: ${scope}</span>
+        </h3>
+        <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 12px;">
+            ${results.map((item, i) => `
+                <div style="background: #fff; border: 1px solid #e5e7eb; border-radius: 8px; padding: 12px; font-size: 13px;">
+                    <div style="display: flex; justify-content: space-between; margin-bottom: 8px;">
+                        <span style="color: #9ca3af;">Top ${i+1} · ${item.document_name || '未知来源'}${item.parent_id ? ' · ' + item.parent_id : ''}</span>
+                        <span style="color: #10b981;">${item.score.toFixed(2)}</span>
+                    </div>
+                    <div style="color: #374151; line-height: 1.5;">${item.content.substring(0, 120)}...</div>
+                </div>
+            `).join('')}
+        </div>
+    `;
+}
+
 // 辅助函数
 function getFileIcon(filename) {
     const ext = filename.split('.').pop().toLowerCase();
@@ -0,0 +1,150 @@
+"""
+自适应候选深度测试
+验证排序确定时不加深、截断且不确定时直接加深到上限、只重新查询被截断的一路，以及混合检索中的深度指标
+"""
+import sys
+import os
+import json
+import time
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools import hybrid_retriever
+from tools.adaptive_depth import DepthController, get_depth_stats
+
+
+def test_controller_deepens_only_when_truncated_and_uncertain():
+    controller = DepthController(top_k=5, start_factor=2, max_depth=40)
+    assert controller.initial_depth == 10
+
+    # 没有截断：更深处没有候选，不加深
+    assert not controller.assess([[1.0, 0.9, 0.5]], 10)
+    # 截断但分数在第 top_k 名之后明显下降：排序确定
+    confident = [1.0, 0.98, 0.96, 0.95, 0.94] + [0.1] * 5
+    assert not controller.assess([confident], 10, overlap=0.8)
+    # 截断且第 top_k 名之后的候选与其分数相当：加深，直接取到上限
+    flat = [1.0, 0.9, 0.8, 0.7] + [0.6 - i * 0.001 for i in range(6)]
+    assert controller.assess([flat], 10)
+    assert controller.rounds[-1]["uncertain"] == ["gap"]
+    assert controller.next_depth(10) == 40
+    # 两路重合度过低同样视为不确定
+    assert controller.assess([confident, confident], 10, overlap=0.0)
+    # 达到最大深度后不再加深
+    assert not controller.assess([flat * 4], 40)
+
+    # 调用方需要的最少候选数抬高初始深度，指标按实际查询的深度记录
+    controller = DepthController(top_k=5, start_factor=2, max_depth=40, min_depth=15)
+    assert controller.initial_depth == 15 and controller.metrics()["initial_depth"] == 15
+    assert DepthController(top_k=5, max_depth=40, min_depth=100).initial_depth == 40
+
+
+def _stub_legs(monkeypatch, scores, bm25_hits=None, bm25_calls=None):
+    calls = []
+
+    def vector_leg(query, collection_name, initial_k):
+        calls.append(initial_k)
+        return [{"id": f"v{i}", "document": f"v{i}", "vector_score": s} for i, s in enumerate(scores[:initial_k])]
+
+    def bm25_leg(query, documents, collection_name, top_k, k1, b):
+        if bm25_calls is not None:
+            bm25_calls.append(top_k)
+        hits = scores[:min(top_k, bm25_hits if bm25_hits is not None else top_k)]
+        results = [{"id": f"v{i}", "document": f"v{i}", "bm25_score": s * 10} for i, s in enumerate(hits)]
+        return json.dumps({"results": results})
+
+    monkeypatch.setattr(hybrid_retriever, "_get_vector_retrieval_documents", vector_leg)
+    monkeypatch.setattr(hybrid_retriever, "bm25_retrieve_func", bm25_leg)
+    return calls
+
+
+def test_hybrid_deepens_uncertain_queries(monkeypatch):
+    before = get_depth_stats()["queries"]
+
+    # 截断处之后分数平缓：10 → 50（上限），两轮往返
+    plateau = [1.0, 0.9, 0.8, 0.7] + [0.6 - i * 0.0001 for i in range(96)]
+    bm25_calls = []
+    calls = _stub_legs(monkeypatch, plateau, bm25_calls=bm25_calls)
+    result = json.loads(hybrid_retriever.hybrid_retrieve.invoke({"query": "建账", "top_k": 5}))
+    assert calls == [10, 50] and bm25_calls == [10, 50]
+    assert result["depth"]["final_depth"] == 50 and result["depth"]["deepened"] is True
+    assert result["parameters"]["initial_k"] == 50 and len(result["final_results"]) == 5
+
+    # 加深时只重新查询被截断的一路：BM25 只命中 8 个，沿用第一轮的结果
+    bm25_calls = []
+    calls = _stub_legs(monkeypatch, plateau, bm25_hits=8, bm25_calls=bm25_calls)
+    result = json.loads(hybrid_retriever.hybrid_retrieve.invoke({"query": "建账", "top_k": 5}))
+    assert calls == [10, 50] and bm25_calls == [10]
+    assert result["vector_count"] == 50 and result["bm25_count"] == 8
+    assert set(result["timings_ms"]) == {"vector", "bm25", "total"}
+
+    # 前 5 名明显领先：一轮即停
+    calls = _stub_legs(monkeypatch, [1.0] * 5 + [0.1] * 95)
+    result = json.loads(hybrid_retriever.hybrid_retrieve.invoke({"query": "建账", "top_k": 5}))
+    assert calls == [10] and result["depth"]["deepened"] is False
+
+    # 显式指定的 initial_k（如故障排查策略）是起始深度，排序不确定时仍然加深
+    calls = _stub_legs(monkeypatch, plateau)
+    result = json.loads(hybrid_retriever.hybrid_retrieve.invoke({"query": "建账", "top_k": 5, "initial_k": 20}))
+    assert calls == [20, 50] and result["depth"]["initial_depth"] == 20
+
+    # 自适应深度未启用时 initial_k 是固定深度
+    monkeypatch.setenv("RAG_ADAPTIVE_DEPTH_ENABLED", "false")
+    calls = _stub_legs(monkeypatch, plateau)
+    result = json.loads(hybrid_retriever.hybrid_retrieve.invoke({"query": "建账", "top_k": 5, "initial_k": 15}))
+    assert calls == [15] and "depth" not in result
+
+    assert get_depth_stats()["queries"] == before + 4
+
+
+def test_smart_retrieve_vector_deepening_respects_deadline(monkeypatch):
+    from langchain_core.documents import Document
+    from biz import rag_service
+
+    class Stub:
+        def __init__(self, func):
+            self.invoke = func
+
+    calls = []
+
+    class SlowVectorStore:
+        def similarity_search_with_score(self, query, k):
+            calls.append(k)
+            time.sleep(0.1)
+            distances = [0.0, 0.1, 0.2, 0.3] + [0.4 + i * 0.0001 for i in range(96)]
+            return [(Document(page_content=f"v{i}", id=f"v{i}"), d) for i, d in enumerate(distances[:k])]
+
+    monkeypatch.setattr(rag_service, "get_storage_provider", lambda: None)
+    monkeypatch.setattr(rag_service, "get_vector_store", lambda collection_name: SlowVectorStore())
+    monkeypatch.setattr(rag_service, "classify_question_type", Stub(lambda args: json.dumps({"type": "general"})))
+    service = rag_service.RAGService()
+
+    # 排序不确定，截止时间充足时加深一次
+    monkeypatch.setenv("RAG_HYBRID_DEADLINE_MS", "1000")
+    assert len(service.smart_retrieve("建账", top_k=5)) == 5
+    assert calls == [10, 50]
+
+    # 剩余时间不够再跑一轮：不加深
+    calls.clear()
+    monkeypatch.setenv("RAG_HYBRID_DEADLINE_MS", "150")
+    service.smart_retrieve("建账", top_k=5)
+    assert calls == [10]
+
+
+def test_troubleshooting_initial_k_starts_adaptive_depth(monkeypatch):
+    from biz import rag_service
+
+    class Stub:
+        def __init__(self, func):
+            self.invoke = func
+
+    # 故障排查策略的 initial_k=20 只抬高起始深度，排序不确定时混合检索仍加深到上限
+    plateau = [1.0, 0.9, 0.8, 0.7] + [0.6 - i * 0.0001 for i in range(96)]
+    calls = _stub_legs(monkeypatch, plateau)
+    monkeypatch.setattr(rag_service, "get_storage_provider", lambda: None)
+    monkeypatch.setattr(rag_service, "classify_question_type", Stub(lambda args: json.dumps({"type": "troubleshooting"})))
+    monkeypatch.setattr(rag_service, "rerank_documents", Stub(lambda args: args["documents"]))
+    service = rag_service.RAGService()
+
+    service.smart_retrieve("凭证无法过账", top_k=5)
+    assert calls == [20, 50]
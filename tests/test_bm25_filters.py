@@ -0,0 +1,125 @@
+"""
+BM25 元数据过滤测试
+验证过滤集合的求法，以及带过滤的检索与“全量打分后只保留过滤集合内文档”的结果一致
+"""
+import sys
+import os
+import random
+
+import numpy as np
+import pytest
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.bm25_filters import MetadataIndex
+from tools.bm25_index import BM25Index
+from tools.bm25_segments import SegmentedIndex
+from tools.bm25_tokenizer import NgramTokenizer
+
+ALPHABET = "建账规则会计科目凭证余额银行现金"
+
+
+def _docs(rng, start, n):
+    docs = []
+    for i in range(start, start + n):
+        metadata = {"source": f"{i % 5}.md", "parent_id": f"parent_{i % 7}", "is_parent": i % 3 == 0}
+        if i % 11 == 0:
+            del metadata["is_parent"]
+        docs.append({
+            "id": str(i),
+            "text": "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 25))),
+            "metadata": metadata
+        })
+    return docs
+
+
+def _matches(doc, filters):
+    metadata = doc["metadata"]
+    for field, value in filters.items():
+        options = value if isinstance(value, list) else [value]
+        if field not in metadata or not any(metadata[field] == o and type(metadata[field]) is type(o) for o in options):
+            return False
+    return True
+
+
+FILTERS = [
+    {"source": "2.md"},
+    {"parent_id": "parent_3"},
+    {"is_parent": False},
+    {"source": ["1.md", "4.md"], "is_parent": False},
+    {"source": "0.md", "parent_id": "parent_0"},
+    {"source": "missing.md"},
+]
+
+
+def test_resolve_intersects_fields_and_unions_values():
+    rng = random.Random(0)
+    docs = _docs(rng, 0, 60)
+    index = MetadataIndex.build(docs)
+    for filters in FILTERS:
+        expected = [i for i, doc in enumerate(docs) if _matches(doc, filters)]
+        assert index.resolve(filters).tolist() == expected
+    # 取值带类型：字符串 "False" 不等于布尔 False
+    assert len(index.resolve({"is_parent": "False"})) == 0
+    with pytest.raises(ValueError):
+        index.resolve({"title": "x"})
+
+
+def test_filtered_search_matches_full_scoring():
+    rng = random.Random(1)
+    tokenizer = NgramTokenizer()
+    docs = _docs(rng, 0, 120)
+    vocab = {}
+    doc_ids, term_ids, tfs, doc_lens = tokenizer.encode_batch([d["text"] for d in docs], vocab)
+    bm25 = BM25Index.from_arrays(vocab, term_ids, doc_ids, tfs, doc_lens)
+    metadata = MetadataIndex.build(docs)
+
+    for filters in FILTERS:
+        allowed = metadata.resolve(filters)
+        for _ in range(10):
+            query = tokenizer.tokenize("".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 5))))
+            got = bm25.search(query, 5, doc_filter=allowed)
+            full = [hit for hit in bm25.search(query, bm25.doc_count) if hit[0] in set(allowed.tolist())][:5]
+            assert np.allclose([s for _, s in got], [s for _, s in full])
+            assert all(doc_id in set(allowed.tolist()) for doc_id, _ in got)
+
+
+def test_segmented_filters_survive_updates_merges_and_reopen(tmp_path):
+    rng = random.Random(2)
+    tokenizer = NgramTokenizer()
+    path = str(tmp_path / "kb.bm25")
+    docs = _docs(rng, 0, 60)
+    vocab = {}
+    doc_ids, term_ids, tfs, doc_lens = tokenizer.encode_batch([d["text"] for d in docs], vocab)
+    bm25 = BM25Index.from_arrays(vocab, term_ids, doc_ids, tfs, doc_lens)
+    kwargs = {"background_merge": False, "max_segments": 100, "major_merge_ratio": 100}
+    index = SegmentedIndex.create(bm25, docs, tokenizer, path=path, **kwargs)
+
+    index.add(_docs(rng, 60, 15))
+    index.add(_docs(rng, 75, 10))
+    index.delete(ids=["7", "64", "80"])
+
+    def check(snapshot):
+        for filters in FILTERS:
+            for _ in range(5):
+                query = tokenizer.tokenize("".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 4))))
+                got = snapshot.search(query, 5, filters=filters)
+                full = [
+                    hit for hit in snapshot.search(query, snapshot.doc_count)
+                    if _matches(snapshot.documents[hit[0]], filters)
+                ][:5]
+                assert np.allclose([s for _, s in got], [s for _, s in full])
+                assert all(_matches(snapshot.documents[i], filters) for i, _ in got)
+
+    check(index.snapshot)
+    index.merge(major=False)
+    check(index.snapshot)
+    index.merge(major=True)
+    assert len(index.snapshot.segments) == 1
+    check(index.snapshot)
+
+    index.add(_docs(rng, 85, 5))
+    reopened = SegmentedIndex.open(path, **kwargs)
+    assert reopened.snapshot.segments[0].metadata is not None
+    check(reopened.snapshot)
@@ -0,0 +1,138 @@
+"""
+BM25 倒排索引引擎测试
+验证倒排索引 + MaxScore 剪枝的 top-k 结果与 rank_bm25.BM25Okapi 全量打分一致
+"""
+import sys
+import os
+import random
+
+import numpy as np
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.bm25_index import BM25Index
+
+CHARS = "建账规则会计科目凭证余额银行现金日记资产负债"
+
+
+def _random_corpus(rng: random.Random):
+    alphabet = CHARS[:rng.randint(2, len(CHARS))]
+    return [
+        [rng.choice(alphabet) for _ in range(rng.randint(0, 30))]
+        for _ in range(rng.randint(1, 200))
+    ]
+
+
+def test_topk_matches_bm25okapi():
+    from rank_bm25 import BM25Okapi
+
+    rng = random.Random(0)
+    for _ in range(100):
+        corpus = _random_corpus(rng)
+        if not any(corpus):
+            continue
+        okapi = BM25Okapi(corpus)
+        index = BM25Index.from_tokenized(corpus)
+
+        for _ in range(5):
+            query = [rng.choice(CHARS) for _ in range(rng.randint(1, 8))]
+            top_k = rng.randint(1, 20)
+            reference = okapi.get_scores(query)
+            hits = index.search(query, top_k)
+
+            matched = [i for i, doc in enumerate(corpus) if set(query) & set(doc)]
+            expected = sorted((reference[i] for i in matched), reverse=True)[:top_k]
+            assert np.allclose([s for _, s in hits], expected)
+            for doc_id, score in hits:
+                assert abs(reference[doc_id] - score) < 1e-9
+
+
+def test_search_edge_cases():
+    index = BM25Index.from_tokenized([["建", "账"], ["规", "则"], []])
+    assert index.search(["不存在"], 5) == []
+    assert index.search(["建"], 0) == []
+    assert [doc_id for doc_id, _ in index.search(["规", "则"], 5)] == [1]
+
+    empty = BM25Index.from_tokenized([])
+    assert empty.search(["建"], 5) == []
+
+
+def test_incremental_add_and_remove_match_full_rebuild():
+    rng = random.Random(1)
+    for _ in range(50):
+        corpus = _random_corpus(rng)
+        extra = _random_corpus(rng)
+        cut = rng.randint(0, len(corpus))
+        incremental = BM25Index.from_tokenized(corpus[:cut]).add_documents(corpus[cut:]).add_documents(extra)
+        rebuilt = BM25Index.from_tokenized(corpus + extra)
+
+        removed = set(rng.sample(range(len(corpus) + len(extra)), rng.randint(0, len(corpus) // 2)))
+        pruned = incremental.remove_documents(sorted(removed))
+        kept = [doc for i, doc in enumerate(corpus + extra) if i not in removed]
+        pruned_rebuilt = BM25Index.from_tokenized(kept)
+
+        for _ in range(5):
+            query = [rng.choice(CHARS) for _ in range(4)]
+            assert np.allclose(
+                [s for _, s in incremental.search(query, 10)],
+                [s for _, s in rebuilt.search(query, 10)]
+            )
+            assert np.allclose(
+                [s for _, s in pruned.search(query, 10)],
+                [s for _, s in pruned_rebuilt.search(query, 10)]
+            )
+
+
+def test_index_file_round_trip(tmp_path):
+    from tools.bm25_store import open_index_file, write_index_file
+
+    rng = random.Random(2)
+    corpus = _random_corpus(rng) + [["建账", "规则"], []]
+    documents = [{"id": str(i), "text": "".join(doc), "metadata": {"source": f"{i % 3}.md"}} for i, doc in enumerate(corpus)]
+    index = BM25Index.from_tokenized(corpus)
+
+    path = str(tmp_path / "kb.bm25")
+    write_index_file(path, index, documents)
+    loaded, loaded_docs, _, _, header = open_index_file(path)
+
+    assert header["doc_count"] == len(corpus)
+    assert list(loaded_docs) == documents
+    assert loaded.vocab.get("建账") is not None and loaded.vocab.get("不存在") is None
+    for _ in range(20):
+        query = [rng.choice(CHARS) for _ in range(4)] + ["规则"]
+        assert loaded.search(query, 10) == index.search(query, 10)
+
+    # mmap 打开的索引同样支持增量更新
+    extra = [["新", "词项", "建"], ["规"]]
+    updated = loaded.add_documents(extra).remove_documents([0])
+    expected = BM25Index.from_tokenized(corpus[1:] + extra)
+    assert np.allclose(
+        [s for _, s in updated.search(["新", "建", "规"], 10)],
+        [s for _, s in expected.search(["新", "建", "规"], 10)]
+    )
+    keep = np.ones(len(loaded_docs), dtype=bool)
+    keep[0] = False
+    table = (loaded_docs + [{"id": "x"}]).select(np.append(keep, True))
+    assert table[0] == documents[1] and table[-1] == {"id": "x"}
+
+
+def test_query_time_k1_b_match_index_built_with_same_params():
+    rng = random.Random(3)
+    corpus = _random_corpus(rng) + _random_corpus(rng)
+    index = BM25Index.from_tokenized(corpus)
+
+    for k1, b in [(1.2, 0.75), (2.0, 0.3), (0.9, 1.0), (1.5, 0.75)]:
+        reference = BM25Index.from_tokenized(corpus, k1=k1, b=b)
+        for _ in range(10):
+            query = [rng.choice(CHARS) for _ in range(rng.randint(1, 6))]
+            assert np.allclose(
+                [s for _, s in index.search(query, 10, k1=k1, b=b)],
+                [s for _, s in reference.search(query, 10)]
+            )
+
+    # 参数向量按 (k1, b) 缓存，数量有上限且保留默认参数
+    for i in range(BM25Index.MAX_SCORING_PARAMS * 2):
+        index.scoring_vectors(1.0 + i / 10, 0.5)
+    assert len(index._scoring_cache) == BM25Index.MAX_SCORING_PARAMS
+    assert (1.5, 0.75) in index._scoring_cache
@@ -0,0 +1,95 @@
+"""
+BM25 位置索引测试
+验证短语 / 邻近度加权、字节预算、增量更新与磁盘往返
+"""
+import sys
+import os
+import random
+
+import numpy as np
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.bm25_index import BM25Index
+from tools.bm25_positional import PositionalIndex
+from tools.bm25_tokenizer import NgramTokenizer
+
+TEXTS = [
+    "库存现金科目核算企业的库存现金",
+    "小企业会计准则规定库存现金",
+    "现金库存的管理规定和准则",
+    "银行存款 1001 库存现金 科目代码",
+]
+
+
+def _build(texts, max_bytes=10 ** 6):
+    tokenizer = NgramTokenizer()
+    vocab = {}
+    doc_ids, term_ids, tfs, doc_lens = tokenizer.encode_batch(texts, vocab)
+    index = BM25Index.from_arrays(vocab, term_ids, doc_ids, tfs, doc_lens)
+    return index, PositionalIndex.build(index, texts, tokenizer, max_bytes), tokenizer
+
+
+def test_phrase_and_proximity_boost():
+    index, positional, tokenizer = _build(TEXTS)
+
+    # 完整短语只出现在文档 0（文档 3 中被空格隔开）
+    query = "库存现金科目"
+    hits = index.search(tokenizer.tokenize(query), 4)
+    boosted, info = positional.rerank(hits, query, tokenizer, index.vocab)
+    base = dict(hits)
+    assert info["applied"] and info["phrases"] == 1
+    assert [doc for doc, score in boosted if score > base[doc]] == [0]
+
+    # 两个片段在文档 3 中相距 5 个字符，获得邻近度加权
+    query = "1001 库存现金"
+    hits = index.search(tokenizer.tokenize(query), 4)
+    boosted, _ = positional.rerank(hits, query, tokenizer, index.vocab, proximity_window=16)
+    assert dict(boosted)[3] > base.get(3, 0) and dict(boosted)[3] > dict(hits)[3]
+
+
+def test_budget_drops_high_df_terms_and_skips_unknown_segments():
+    index, full, tokenizer = _build(TEXTS)
+    _, empty, _ = _build(TEXTS, max_bytes=0)
+    assert empty.nbytes < full.nbytes and (empty.term_slots >= 0).sum() == 0
+
+    hits = index.search(tokenizer.tokenize("库存现金科目"), 4)
+    reranked, info = empty.rerank(hits, "库存现金科目", tokenizer, index.vocab)
+    assert reranked == hits and not info["applied"]
+
+
+def test_incremental_updates_match_rebuild():
+    rng = random.Random(0)
+    alphabet = "库存现金科目银行存款规定"
+    texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30))) for _ in range(60)]
+    extra = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30))) for _ in range(20)]
+
+    index, positional, tokenizer = _build(texts + extra)
+    removed = sorted(rng.sample(range(len(texts)), 15))
+    total = len(texts) + len(extra)
+    expected = positional.remove_documents(removed, total)
+
+    # 先删掉尾部文档再增量追加，结果应与一次性删除一致
+    partial = positional.remove_documents(list(range(len(texts), total)), total)
+    partial = partial.remove_documents(removed, len(texts))
+    partial = partial.add_documents(extra, tokenizer, index.vocab, len(texts) - len(removed))
+
+    assert np.array_equal(expected.slot_offsets, partial.slot_offsets)
+    assert np.array_equal(expected.pos_docs, partial.pos_docs)
+    assert np.array_equal(expected.positions, partial.positions)
+
+
+def test_index_file_round_trip_with_positions(tmp_path):
+    from tools.bm25_store import open_index_file, write_index_file
+
+    index, positional, tokenizer = _build(TEXTS)
+    path = str(tmp_path / "kb.bm25")
+    write_index_file(path, index, [{"text": t} for t in TEXTS], positional=positional)
+    loaded, _, loaded_positional, _, header = open_index_file(path)
+    assert header["positional"]
+
+    for query in ["库存现金科目", "1001 库存现金", "会计准则规定"]:
+        expected = positional.rerank(index.search(tokenizer.tokenize(query), 4), query, tokenizer, index.vocab)[0]
+        got = loaded_positional.rerank(loaded.search(tokenizer.tokenize(query), 4), query, tokenizer, loaded.vocab)[0]
+        assert got == expected
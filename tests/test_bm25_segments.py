@@ -0,0 +1,228 @@
+"""
+BM25 分段索引测试
+验证分段检索与对存活文档整体重建的索引打分一致，以及合并、日志重放与快照隔离
+"""
+import sys
+import os
+import random
+
+import numpy as np
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.bm25_index import BM25Index
+from tools.bm25_segments import SegmentedIndex
+from tools.bm25_tokenizer import NgramTokenizer
+
+ALPHABET = "建账规则会计科目凭证余额银行现金"
+
+
+def _docs(rng, start, n):
+    return [
+        {
+            "id": str(i),
+            "text": "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 25))),
+            "metadata": {"source": f"{i % 4}.md"}
+        }
+        for i in range(start, start + n)
+    ]
+
+
+def _create(documents, path=None, **kwargs):
+    tokenizer = NgramTokenizer()
+    vocab = {}
+    doc_ids, term_ids, tfs, doc_lens = tokenizer.encode_batch([d["text"] for d in documents], vocab)
+    bm25 = BM25Index.from_arrays(vocab, term_ids, doc_ids, tfs, doc_lens)
+    kwargs.setdefault("background_merge", False)
+    return SegmentedIndex.create(bm25, documents, tokenizer, path=path, **kwargs)
+
+
+def _assert_matches_rebuild(index, live_docs, rng):
+    """分段检索的 (文档ID, 分数) 与对存活文档整体重建的索引一致"""
+    tokenizer = NgramTokenizer()
+    vocab = {}
+    doc_ids, term_ids, tfs, doc_lens = tokenizer.encode_batch([d["text"] for d in live_docs], vocab)
+    rebuilt = BM25Index.from_arrays(vocab, term_ids, doc_ids, tfs, doc_lens)
+    snapshot = index.snapshot
+    assert snapshot.doc_count == len(live_docs)
+
+    for _ in range(10):
+        query = tokenizer.tokenize("".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 5))))
+        got = snapshot.search(query, 10)
+        expected = rebuilt.search(query, 10)
+        assert np.allclose([s for _, s in got], [s for _, s in expected])
+        got_scores = {snapshot.documents[i]["id"]: s for i, s in got}
+        expected_scores = {live_docs[i]["id"]: s for i, s in expected}
+        for doc_id in set(got_scores) & set(expected_scores):
+            assert abs(got_scores[doc_id] - expected_scores[doc_id]) < 1e-9
+
+
+def test_segmented_search_matches_rebuild():
+    rng = random.Random(0)
+    docs = _docs(rng, 0, 80)
+    index = _create(docs, max_segments=100, major_merge_ratio=100, max_deleted_ratio=1.0)
+    live = list(docs)
+
+    next_id = len(docs)
+    for _ in range(6):
+        added = _docs(rng, next_id, rng.randint(1, 15))
+        next_id += len(added)
+        assert index.add(added) == len(added)
+        live += added
+
+        removed = {d["id"] for d in rng.sample(live, 5)}
+        assert index.delete(ids=sorted(removed)) == 5
+        live = [d for d in live if d["id"] not in removed]
+        _assert_matches_rebuild(index, live, rng)
+
+    assert len(index.snapshot.segments) == 7
+    assert index.delete(source="1.md") == sum(d["metadata"]["source"] == "1.md" for d in live)
+    live = [d for d in live if d["metadata"]["source"] != "1.md"]
+    _assert_matches_rebuild(index, live, rng)
+
+
+def test_publish_reuses_segment_bounds(monkeypatch):
+    rng = random.Random(3)
+    docs = _docs(rng, 0, 60)
+    index = _create(docs, max_segments=100, major_merge_ratio=100, max_deleted_ratio=1.0)
+    index.add(_docs(rng, 60, 10))
+
+    # 之后的发布只为新段本身计算上界，已有段的视图不再遍历倒排表
+    sizes = []
+    compute = BM25Index._compute_upper_bounds
+
+    def counting(self, k1, norm):
+        sizes.append(len(self.post_docs))
+        return compute(self, k1, norm)
+
+    monkeypatch.setattr(BM25Index, "_compute_upper_bounds", counting)
+    added = _docs(rng, 70, 3)
+    index.add(added)
+    index.delete(ids=["5", "65"])
+    index.delete(source="2.md")
+    new_postings = len(index.snapshot.segments[-1].bm25.post_docs)
+    assert sizes == [new_postings]
+
+    # 保守上界不低于按全局统计量精确计算的上界
+    for view in index.snapshot.views:
+        exact = compute(view, view.k1, view.norm)
+        assert np.all(view.upper_bounds >= exact - 1e-12)
+
+
+def test_merges_drop_tombstones_and_keep_scores():
+    rng = random.Random(1)
+    docs = _docs(rng, 0, 60)
+    index = _create(docs, max_segments=3, major_merge_ratio=0.5, max_deleted_ratio=0.3)
+    live = list(docs)
+
+    next_id = len(docs)
+    for _ in range(4):
+        added = _docs(rng, next_id, 4)
+        next_id += len(added)
+        index.add(added)
+        live += added
+    # 4 个小段超过 max_segments，被合并成一个
+    assert len(index.snapshot.segments) == 2 and index.get_stats()["minor_merges"] == 1
+    _assert_matches_rebuild(index, live, rng)
+
+    added = _docs(rng, next_id, 20)
+    index.add(added)
+    live += added
+    # 小段文档数超过基础段的一半，触发全量合并
+    assert len(index.snapshot.segments) == 1 and index.get_stats()["major_merges"] == 1
+    assert sum(index.snapshot.deleted_counts) == 0
+    _assert_matches_rebuild(index, live, rng)
+
+
+def test_reopen_replays_log_and_snapshots_are_isolated(tmp_path):
+    rng = random.Random(2)
+    path = str(tmp_path / "kb.bm25")
+    docs = _docs(rng, 0, 50)
+    index = _create(docs, path=path, max_segments=100, major_merge_ratio=100)
+
+    before = index.snapshot
+    added = _docs(rng, 50, 10)
+    index.add(added)
+    index.delete(ids=["3", "55"])
+    live = [d for d in docs + added if d["id"] not in ("3", "55")]
+
+    # 旧快照不受后续写入影响
+    assert before.doc_count == 50 and len(before.segments) == 1
+    assert index.is_stale() is False
+
+    reopened = SegmentedIndex.open(path, background_merge=False, max_segments=100, major_merge_ratio=100)
+    _assert_matches_rebuild(reopened, live, rng)
+
+    # 全量合并写出新的基础段，日志只保留合并之后的变更
+    index.merge(major=True)
+    index.add(_docs(rng, 60, 3))
+    live += index.snapshot.segments[-1].documents
+    reopened = SegmentedIndex.open(path, background_merge=False, max_segments=100, major_merge_ratio=100)
+    assert reopened.snapshot.generation == index.snapshot.generation
+    assert len(reopened.snapshot.segments) == 2
+    _assert_matches_rebuild(reopened, live, rng)
+
+
+
+def test_two_writers_on_one_file_keep_each_others_updates(tmp_path):
+    """两个进程共用同一组文件：各自的新增/删除都不会被对方的全量合并覆盖"""
+    rng = random.Random(4)
+    path = str(tmp_path / "kb.bm25")
+    docs = _docs(rng, 0, 50)
+    _create(docs, path=path).close()
+    options = {"background_merge": False, "max_segments": 100, "major_merge_ratio": 100}
+    a = SegmentedIndex.open(path, **options)
+    b = SegmentedIndex.open(path, **options)
+
+    a1 = _docs(rng, 50, 3)
+    a.add(a1)
+    assert b.is_stale()
+    b_new = _docs(rng, 53, 4)
+    b.add(b_new)
+    b.delete(ids=["7"])
+    assert b.merge(major=True)
+    live = [d for d in docs + a1 + b_new if d["id"] != "7"]
+    _assert_matches_rebuild(SegmentedIndex.open(path, **options), live, rng)
+
+    # A 的下一次写入先应用 B 的全量合并，再追加到新日志
+    a2 = _docs(rng, 57, 2)
+    a.add(a2)
+    a.delete(ids=["1"])
+    live = [d for d in live + a2 if d["id"] != "1"]
+    assert a.snapshot.generation == b.snapshot.generation
+    assert a.is_stale() is False
+    _assert_matches_rebuild(a, live, rng)
+    _assert_matches_rebuild(SegmentedIndex.open(path, **options), live, rng)
+
+    # B 的全量合并同样包含 A 追加的操作
+    assert b.merge(major=True)
+    _assert_matches_rebuild(b, live, rng)
+    _assert_matches_rebuild(SegmentedIndex.open(path, **options), live, rng)
+
+
+def test_merged_positional_index_matches_rebuild():
+    from tools.bm25_positional import PositionalIndex
+
+    rng = random.Random(3)
+    tokenizer = NgramTokenizer()
+    docs = _docs(rng, 0, 40)
+    vocab = {}
+    doc_ids, term_ids, tfs, doc_lens = tokenizer.encode_batch([d["text"] for d in docs], vocab)
+    bm25 = BM25Index.from_arrays(vocab, term_ids, doc_ids, tfs, doc_lens)
+    positional = PositionalIndex.build(bm25, [d["text"] for d in docs], tokenizer, 10 ** 6)
+    index = SegmentedIndex.create(
+        bm25, docs, tokenizer, positional=positional,
+        positional_budget=lambda _: 10 ** 6, background_merge=False, major_merge_ratio=100
+    )
+    added = _docs(rng, 40, 15)
+    index.add(added)
+    index.delete(ids=["1", "45"])
+    index.merge(major=True)
+
+    merged = index.snapshot.segments[0]
+    live = [d for d in docs + added if d["id"] not in ("1", "45")]
+    assert [d["id"] for d in merged.documents] == [d["id"] for d in live]
+    rebuilt = PositionalIndex.build(merged.bm25, [d["text"] for d in live], tokenizer, 10 ** 6)
+    assert np.array_equal(merged.positional.pos_docs, rebuilt.pos_docs)
+    assert np.array_equal(merged.positional.positions, rebuilt.positions)
@@ -0,0 +1,77 @@
+"""
+BM25 分词器测试
+验证兼容模式与旧版 n-gram 分词结果一致，以及词典分词器的最长匹配
+"""
+import sys
+import os
+import random
+from collections import Counter
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.bm25_index import BM25Index
+from tools.bm25_tokenizer import BaseTokenizer, NgramTokenizer, DictionaryTokenizer
+
+
+def _legacy_tokenize(text):
+    """旧版 _tokenize 的 1~4 字 n-gram 实现"""
+    tokens = []
+    i = 0
+    while i < len(text):
+        if i + 3 < len(text):
+            tokens.append(text[i:i+4])
+        if i + 2 < len(text):
+            tokens.append(text[i:i+3])
+        if i + 1 < len(text):
+            tokens.append(text[i:i+2])
+        if text[i].strip():
+            tokens.append(text[i])
+        i += 1
+    return tokens
+
+
+def _random_texts(rng, n):
+    alphabet = "建账规则会计科目 \n\t　AbC1，。"
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20))) for _ in range(n)]
+
+
+def test_ngram_compat_with_legacy_tokenizer():
+    rng = random.Random(0)
+    tokenizer = NgramTokenizer()
+    texts = _random_texts(rng, 300)
+
+    for text in texts:
+        assert Counter(tokenizer.tokenize(text)) == Counter(_legacy_tokenize(text))
+
+    vocab = {}
+    doc_ids, term_ids, tfs, doc_lens = tokenizer.encode_batch(texts, vocab)
+    terms = {term_id: term for term, term_id in vocab.items()}
+    for i, text in enumerate(texts):
+        mask = doc_ids == i
+        counts = Counter({terms[t]: tf for t, tf in zip(term_ids[mask].tolist(), tfs[mask].tolist())})
+        assert counts == Counter(_legacy_tokenize(text))
+        assert doc_lens[i] == len(_legacy_tokenize(text))
+
+    # 批量编码构建的索引与按词项列表构建的索引打分一致
+    encoded = BM25Index.from_arrays(vocab, term_ids, doc_ids, tfs, doc_lens)
+    legacy = BM25Index.from_tokenized([_legacy_tokenize(t) for t in texts])
+    for text in texts[:20]:
+        query = _legacy_tokenize(text[:6])
+        assert encoded.search(query, 10) == legacy.search(query, 10)
+
+
+def test_dictionary_tokenizer_longest_match():
+    tokenizer = DictionaryTokenizer(["会计", "会计科目", "科目", "建账"])
+    assert tokenizer.tokenize("建账时的会计科目，ABC 123") == ["建账", "时", "的", "会计科目", "abc", "123"]
+    assert tokenizer.tokenize("会计科") == ["会计", "科"]
+    assert tokenizer.tokenize("") == []
+
+
+def test_base_tokenizer_requires_tokenize():
+    try:
+        BaseTokenizer()
+    except TypeError as e:
+        assert "tokenize" in str(e)
+    else:
+        raise AssertionError("BaseTokenizer 不应可以直接实例化")
@@ -0,0 +1,51 @@
+"""
+缓存工具测试
+验证 LRUCache 的淘汰、字节计量与统计，以及 BM25 临时索引按内容哈希复用
+"""
+import sys
+import os
+import json
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.cache import LRUCache
+
+
+def test_lru_cache_eviction_and_stats():
+    cache = LRUCache(max_entries=3, max_bytes=100, sizeof=len)
+    cache.set("a", "x" * 10)
+    cache.set("b", "x" * 10)
+    cache.set("c", "x" * 10)
+    assert cache.get("a") == "x" * 10      # a 变为最近使用
+    cache.set("d", "x" * 10)               # 条目数超限，淘汰 b
+    assert cache.get("b") is None
+
+    cache.set("e", "x" * 85)               # 字节超限，淘汰 c、a
+    assert cache.get("c") is None
+    assert cache.get("a") is None
+    assert cache.get("d") is not None and cache.get("e") is not None
+
+    cache.set("huge", "x" * 101)           # 单个值超过上限不缓存
+    assert cache.get("huge") is None
+
+    stats = cache.get_stats()
+    assert stats["entries"] == 2 and stats["bytes"] == 95
+    assert stats["hits"] == 3 and stats["misses"] == 4 and stats["evictions"] == 3
+
+
+def test_bm25_adhoc_index_reused_by_content_hash():
+    from tools import bm25_retriever
+
+    docs = [{"text": "建账规则说明", "metadata": {"source": "a.md"}}, {"text": "会计科目设置"}]
+    before = bm25_retriever.get_bm25_cache_stats()
+
+    first = bm25_retriever._bm25_retrieve_internal("建账", documents=json.dumps(docs, ensure_ascii=False))
+    docs[0]["metadata"] = {"source": "b.md"}
+    second = bm25_retriever._bm25_retrieve_internal("建账", documents=json.dumps(docs, ensure_ascii=False))
+
+    after = bm25_retriever.get_bm25_cache_stats()
+    assert after["hits"] - before["hits"] == 1
+    assert json.loads(first)["results"][0]["bm25_score"] == json.loads(second)["results"][0]["bm25_score"]
+    # 命中缓存时仍返回本次请求的 metadata
+    assert json.loads(second)["results"][0]["metadata"] == {"source": "b.md"}
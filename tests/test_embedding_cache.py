@@ -0,0 +1,51 @@
+"""
+持久化 Embedding 缓存测试
+验证只把未命中的文本块送给模型、缓存跨实例持久化、按模型区分，以及按入库统计命中率
+"""
+import sys
+import os
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_core.embeddings import Embeddings
+
+from tools.embedding_cache import CachedEmbeddings, EmbeddingCache, track_embedding_cache
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self, model="m"):
+        self.model = model
+        self.sent = []
+
+    def embed_documents(self, texts):
+        self.sent.append(list(texts))
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 0.5]
+
+
+def test_only_misses_are_embedded_and_cache_persists(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, EmbeddingCache(path))
+
+    with track_embedding_cache() as first:
+        vectors = embeddings.embed_documents(["建账", "银行对账", "建账"])
+    assert inner.sent == [["建账", "银行对账"]]
+    assert vectors == [[2.0, 0.5], [4.0, 0.5], [2.0, 0.5]]
+    assert first == {"hits": 0, "misses": 3, "hit_rate": 0.0}
+
+    # 重新打开缓存文件（模拟进程重启）后重新入库，只有新文本块调用模型
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, EmbeddingCache(path))
+    with track_embedding_cache() as second:
+        assert embeddings.embed_documents(["建账", "银行对账", "固定资产"]) == [[2.0, 0.5], [4.0, 0.5], [4.0, 0.5]]
+    assert inner.sent == [["固定资产"]]
+    assert second["hits"] == 2 and second["hit_rate"] == round(2 / 3, 4)
+
+    # 换模型不命中
+    other = CountingEmbeddings(model="other")
+    CachedEmbeddings(other, EmbeddingCache(path)).embed_documents(["建账"])
+    assert other.sent == [["建账"]]
@@ -0,0 +1,119 @@
+"""
+Embedding 分批并发测试
+验证按 batch_size 分批、批次并发请求、只重试失败的批次，以及结果保持输入顺序（同步与异步两条路径）
+"""
+import sys
+import os
+import asyncio
+import threading
+import time
+
+import pytest
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.vector_store import SiliconFlowEmbeddings
+
+
+class FakeEmbeddings(SiliconFlowEmbeddings):
+    """以文本编号作为向量，记录每个批次的请求次数与最大并发数"""
+
+    def __init__(self, fail_once=(), **kwargs):
+        super().__init__(api_key="test", base_url="http://127.0.0.1:1/v1", **kwargs)
+        self.fail_once = set(fail_once)
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def _embed_batch(self, texts, timeout=None):
+        with self.lock:
+            self.calls.append(texts[0])
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(0.05)
+            if texts[0] in self.fail_once:
+                self.fail_once.discard(texts[0])
+                raise ConnectionError("boom")
+            return [[float(text)] for text in texts]
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+TEXTS = [str(i) for i in range(10)]
+
+
+def test_batches_run_concurrently_and_keep_order():
+    embeddings = FakeEmbeddings(batch_size=3, max_workers=4)
+    vectors = embeddings.embed_documents(TEXTS)
+    assert vectors == [[float(i)] for i in range(10)]
+    assert sorted(embeddings.calls) == ["0", "3", "6", "9"]
+    assert embeddings.peak > 1
+    assert embeddings.embed_query("7") == [7.0]
+
+
+def test_only_failed_batches_are_retried():
+    embeddings = FakeEmbeddings(fail_once={"3"}, batch_size=3, max_workers=2)
+    assert embeddings.embed_documents(TEXTS) == [[float(i)] for i in range(10)]
+    assert sorted(embeddings.calls) == ["0", "3", "3", "6", "9"]
+
+    embeddings = FakeEmbeddings(fail_once={"0"}, batch_size=3, max_retries=0)
+    with pytest.raises(RuntimeError, match="1/4"):
+        embeddings.embed_documents(TEXTS)
+
+
+class AsyncFakeEmbeddings(FakeEmbeddings):
+    async def _aembed_batch(self, texts, timeout=None):
+        with self.lock:
+            self.calls.append(texts[0])
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(0.05)
+            if texts[0] in self.fail_once:
+                self.fail_once.discard(texts[0])
+                raise ConnectionError("boom")
+            return [[float(text)] for text in texts]
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_async_path_batches_on_event_loop():
+    embeddings = AsyncFakeEmbeddings(fail_once={"6"}, batch_size=3, max_workers=2)
+    vectors = asyncio.run(embeddings.aembed_documents(TEXTS))
+    assert vectors == [[float(i)] for i in range(10)]
+    assert sorted(embeddings.calls) == ["0", "3", "6", "6", "9"]
+    assert embeddings.peak == 2
+    assert asyncio.run(embeddings.aembed_query("4")) == [4.0]
+
+
+def test_queries_use_query_timeout_without_retries():
+    class TimedFakeEmbeddings(FakeEmbeddings):
+        def _embed_batch(self, texts, timeout=None):
+            self.timeouts.append(timeout)
+            return super()._embed_batch(texts, timeout)
+
+    embeddings = TimedFakeEmbeddings(fail_once={"1"}, query_timeout=2, max_retries=2)
+    embeddings.timeouts = []
+    assert embeddings.embed_query_batch(["2", "3"]) == [[2.0], [3.0]]
+    with pytest.raises(ConnectionError):
+        embeddings.embed_query("1")
+    assert embeddings.timeouts == [2.0, 2.0]
+    # 文档嵌入仍使用客户端默认超时并重试失败批次
+    assert embeddings.embed_documents(["1"]) == [[1.0]]
+    assert embeddings.timeouts[2:] == [None]
+
+
+def test_batched_embeddings_requires_batch_methods():
+    from tools.vector_store import BatchedEmbeddings
+
+    class SyncOnly(BatchedEmbeddings):
+        def _embed_batch(self, texts, timeout=None):
+            return [[0.0] for _ in texts]
+
+    with pytest.raises(TypeError, match="_aembed_batch"):
+        SyncOnly("m")
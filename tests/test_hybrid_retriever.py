@@ -0,0 +1,116 @@
+"""
+混合检索测试
+验证向量 / BM25 两路并发执行、超过截止时间时降级融合，以及对比检索共享候选池
+"""
+import sys
+import os
+import json
+import threading
+import time
+
+import pytest
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools import hybrid_retriever
+
+
+def _stub_legs(monkeypatch, vector_delay, bm25_delay):
+    def vector_leg(query, collection_name, initial_k):
+        time.sleep(vector_delay)
+        return [{"document": "建账规则说明", "metadata": {"source": "a.md"}, "vector_score": 0.9}]
+
+    def bm25_leg(query, documents, collection_name, top_k, k1, b):
+        time.sleep(bm25_delay)
+        return json.dumps({"results": [{"document": "会计科目设置", "metadata": {"source": "b.md"}, "bm25_score": 3.0}]})
+
+    monkeypatch.setattr(hybrid_retriever, "_get_vector_retrieval_documents", vector_leg)
+    monkeypatch.setattr(hybrid_retriever, "bm25_retrieve_func", bm25_leg)
+
+
+def test_legs_run_concurrently(monkeypatch):
+    _stub_legs(monkeypatch, 0.3, 0.3)
+    start = time.perf_counter()
+    result = json.loads(hybrid_retriever.hybrid_retrieve.invoke({"query": "建账", "deadline_ms": 2000}))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.55
+    assert result["degraded"] is False and result["missing_legs"] == []
+    assert result["vector_count"] == 1 and result["bm25_count"] == 1
+    assert set(result["timings_ms"]) == {"vector", "bm25", "total"}
+
+
+def test_slow_leg_misses_deadline_and_fusion_degrades(monkeypatch):
+    _stub_legs(monkeypatch, 1.0, 0.0)
+    start = time.perf_counter()
+    result = json.loads(hybrid_retriever.hybrid_retrieve.invoke({"query": "建账", "deadline_ms": 200}))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.6
+    assert result["degraded"] is True and result["missing_legs"] == ["vector"]
+    assert result["vector_count"] == 0 and result["bm25_count"] == 1
+    assert [r["document"] for r in result["final_results"]] == ["会计科目设置"]
+
+
+def test_candidate_pool_retrieves_each_leg_once(monkeypatch):
+    calls = []
+
+    def vector_leg(query, collection_name, initial_k):
+        calls.append(("vector", initial_k))
+        time.sleep(0.05)
+        return [{"id": str(i), "document": f"文本{i}", "vector_score": 1 - i * 0.1} for i in range(initial_k)]
+
+    def bm25_leg(query, documents, collection_name, top_k, k1, b):
+        calls.append(("bm25", top_k))
+        results = [{"id": str(i), "document": f"文本{i}", "bm25_score": 10.0 - i} for i in range(3, 3 + top_k)]
+        return json.dumps({"results": results})
+
+    class StubRerank:
+        @staticmethod
+        def invoke(args):
+            docs = json.loads(args["documents"])
+            return json.dumps([{"id": d["id"], "relevance_score": 0.1 * i} for i, d in enumerate(docs)])
+
+    monkeypatch.setattr(hybrid_retriever, "_get_vector_retrieval_documents", vector_leg)
+    monkeypatch.setattr(hybrid_retriever, "bm25_retrieve_func", bm25_leg)
+    monkeypatch.setattr(hybrid_retriever, "rerank_documents", StubRerank)
+
+    result = json.loads(hybrid_retriever.compare_retrieval_methods.invoke({"query": "建账", "top_k": 4}))
+    assert sorted(calls) == [("bm25", 12), ("vector", 12)]
+    methods = result["methods"]
+    assert set(methods) == {"vector", "bm25", "hybrid", "hybrid_rerank"}
+    assert all(m["count"] == 4 for m in methods.values())
+    # 依赖向量检索的方法耗时包含向量检索的 50ms
+    assert methods["vector"]["time"] >= 50 and methods["hybrid"]["time"] >= 50
+    assert methods["bm25"]["time"] < 50
+    # Rerank 视图按 Rerank 分数重排（桩按输入顺序递增打分）
+    assert methods["hybrid_rerank"]["top_scores"] == pytest.approx([0.3, 0.2, 0.1])
+
+
+def test_compare_views_do_not_occupy_leg_threads(monkeypatch):
+    _stub_legs(monkeypatch, 0.0, 0.0)
+    pool = hybrid_retriever.CandidatePool("建账", depth=4).fetch(deadline_ms=2000)
+    threads = []
+
+    def view(top_k):
+        threads.append(threading.current_thread().name)
+        return []
+
+    monkeypatch.setattr(pool, "vector", view)
+    pool.compare(["vector"], top_k=4)
+    assert threads and threads[0].startswith("hybrid-compare")
+
+
+def test_failed_vector_leg_is_reported_as_missing(monkeypatch):
+    vector_leg = hybrid_retriever._get_vector_retrieval_documents
+    _stub_legs(monkeypatch, 0.0, 0.0)
+
+    def get_vector_store(collection_name):
+        raise RuntimeError("创建向量存储失败: connection refused")
+
+    monkeypatch.setattr("tools.vector_store.get_vector_store", get_vector_store)
+    monkeypatch.setattr(hybrid_retriever, "_get_vector_retrieval_documents", vector_leg)
+    result = json.loads(hybrid_retriever.hybrid_retrieve.invoke({"query": "建账", "deadline_ms": 2000}))
+    assert result["degraded"] is True and result["missing_legs"] == ["vector"]
+    assert result["bm25_count"] == 1
@@ -0,0 +1,45 @@
+"""
+共享 LLM 客户端注册表测试
+验证相同参数复用同一个 ChatOpenAI 实例、所有实例共享连接池，以及连接复用统计
+"""
+import sys
+import os
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from rerank_stub_server import start_server
+from utils import llm_client
+from utils.llm_client import get_chat_model, get_http_client, get_llm_client_stats
+
+BASE_URL = "http://127.0.0.1:1/v1"
+
+
+def test_same_parameters_share_one_instance():
+    a = get_chat_model("m", "k", BASE_URL, temperature=0.1, thinking="disabled", headers={"X-Request-ID": "1"}, streaming=True)
+    b = get_chat_model("m", "k", BASE_URL, temperature=0.1, thinking="disabled", headers={"X-Request-ID": "1"}, streaming=True)
+    assert a is b
+    assert a.extra_body == {"thinking": {"type": "disabled"}}
+
+    # 请求头或温度不同得到不同实例，但底层连接池相同
+    c = get_chat_model("m", "k", BASE_URL, temperature=0.1, thinking="disabled", headers={"X-Request-ID": "2"}, streaming=True)
+    d = get_chat_model("m", "k", BASE_URL, temperature=0.7, thinking="disabled", headers={"X-Request-ID": "1"}, streaming=True)
+    assert c is not a and d is not a
+    assert a.root_client._client is c.root_client._client is get_http_client(BASE_URL)
+    assert get_llm_client_stats()["instances_reused"] >= 1
+
+
+def test_connection_reuse_is_counted():
+    server, base_url = start_server()
+    try:
+        before = llm_client._connection_stats.snapshot()
+        client = get_http_client(base_url)
+        for _ in range(3):
+            response = client.post(f"{base_url}/rerank", json={"query": "建账", "documents": ["建账流程"]})
+            assert response.status_code == 200
+        after = get_llm_client_stats()["connections"]
+        assert after["requests"] - before["requests"] == 3
+        assert after["new_connections"] - before["new_connections"] == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,49 @@
+"""
+本地模拟 Embedding 测试
+验证向量确定、维度与归一化、相近文本相似度更高、模拟延迟与失败，以及按配置选择提供方
+"""
+import sys
+import os
+import time
+
+import numpy as np
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools import vector_store
+from tools.mock_embeddings import MockEmbeddings
+
+
+def test_vectors_are_deterministic_and_similarity_aware():
+    embeddings = MockEmbeddings(dimension=256)
+    a, b, c = embeddings.embed_documents(["银行存款余额调节表", "银行存款余额调节表的编制", "办公室绿植养护"])
+    assert len(a) == 256 and abs(np.linalg.norm(a) - 1.0) < 1e-9
+    assert MockEmbeddings(dimension=256).embed_query("银行存款余额调节表") == a
+    assert np.dot(a, b) > np.dot(a, c)
+    assert embeddings.embed_query("   ") == [0.0] * 256
+
+
+def test_latency_profile_and_failures_go_through_batching():
+    embeddings = MockEmbeddings(dimension=8, latency_ms=40, batch_size=2, max_workers=4)
+    start = time.perf_counter()
+    embeddings.embed_documents([str(i) for i in range(8)])
+    # 4 个批次并发，总耗时接近单个批次
+    assert time.perf_counter() - start < 0.15
+
+    flaky = MockEmbeddings(dimension=8, failure_rate=1.0, max_retries=1)
+    try:
+        flaky.embed_documents(["建账"])
+        assert False, "应当抛出模拟失败"
+    except RuntimeError as e:
+        assert "模拟 Embedding 接口失败" in str(e)
+
+
+def test_use_mock_selects_local_provider(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_USE_MOCK", "true")
+    monkeypatch.setenv("EMBEDDING_MOCK_DIMENSION", "64")
+    monkeypatch.setenv("EMBEDDING_CACHE_ENABLED", "false")
+    monkeypatch.setattr(vector_store, "_embeddings_client", None)
+    embeddings = vector_store.get_embeddings()
+    assert embeddings.model == "mock-ngram-64"
+    assert len(embeddings.embed_query("什么是建账")) == 64
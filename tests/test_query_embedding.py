@@ -0,0 +1,116 @@
+"""
+查询向量缓存测试
+验证 LRU 命中、相同查询的并发调用合并为一次请求，以及窗口内的不同查询合并为一次批量请求（含异步路径）
+"""
+import sys
+import os
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_core.embeddings import Embeddings
+
+from tools.query_embedding import QueryEmbeddingCache
+
+
+class SlowEmbeddings(Embeddings):
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.requests.append(list(texts))
+        time.sleep(0.05)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _run_concurrently(embedder, texts):
+    with ThreadPoolExecutor(max_workers=len(texts)) as pool:
+        return list(pool.map(embedder.embed_query, texts))
+
+
+def test_identical_queries_share_one_call_and_hit_lru():
+    inner = SlowEmbeddings()
+    embedder = QueryEmbeddingCache(inner, batch_window_ms=20)
+    assert _run_concurrently(embedder, ["什么是建账"] * 8) == [[5.0]] * 8
+    assert inner.requests == [["什么是建账"]]
+    assert embedder.get_stats()["coalesced"] == 7
+
+    assert embedder.embed_query("什么是建账") == [5.0]
+    assert len(inner.requests) == 1
+
+
+def test_distinct_concurrent_queries_are_micro_batched():
+    inner = SlowEmbeddings()
+    embedder = QueryEmbeddingCache(inner, batch_window_ms=50, max_batch=3)
+    texts = ["建账", "银行对账", "固定资产折旧"]
+    assert _run_concurrently(embedder, texts) == [[2.0], [4.0], [6.0]]
+    assert len(inner.requests) == 1 and sorted(inner.requests[0]) == sorted(texts)
+
+
+class AsyncSlowEmbeddings(SlowEmbeddings):
+    async def aembed_documents(self, texts):
+        with self.lock:
+            self.requests.append(list(texts))
+        await asyncio.sleep(0.05)
+        return [[float(len(text))] for text in texts]
+
+
+def test_async_queries_coalesce_and_batch():
+    inner = AsyncSlowEmbeddings()
+    embedder = QueryEmbeddingCache(inner, batch_window_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(embedder.aembed_query(t) for t in ["建账", "建账", "银行对账"]))
+
+    assert asyncio.run(run()) == [[2.0], [2.0], [4.0]]
+    assert len(inner.requests) == 1 and sorted(inner.requests[0]) == ["建账", "银行对账"]
+    # 同步调用命中异步路径写入的缓存
+    assert embedder.embed_query("银行对账") == [4.0] and len(inner.requests) == 1
+
+
+def test_cancelled_async_leader_does_not_wedge_later_calls():
+    inner = AsyncSlowEmbeddings()
+
+    def later(embedder, text):
+        # 在线程中调用同步接口，设置超时避免卡死测试
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(embedder.embed_query, text).result(timeout=2)
+
+    # 在微批窗口内被取消：批次必须关闭，其他文本也不能被阻塞
+    embedder = QueryEmbeddingCache(inner, batch_window_ms=200)
+
+    async def cancel_in_window():
+        try:
+            await asyncio.wait_for(embedder.aembed_query("a"), 0.05)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(cancel_in_window())
+    assert later(embedder, "a") == [1.0]
+    assert later(embedder, "bb") == [2.0]
+
+    # 在模型请求进行中被取消：进行中的 Future 失败并移出，之后的调用重新发起请求
+    embedder = QueryEmbeddingCache(inner, batch_window_ms=0)
+
+    async def cancel_in_flight():
+        waiter = asyncio.ensure_future(embedder.aembed_query("ccc"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(embedder.aembed_query("ccc"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        try:
+            await follower
+        except RuntimeError as e:
+            return str(e)
+
+    assert "已取消" in asyncio.run(cancel_in_flight())
+    assert later(embedder, "ccc") == [3.0]
@@ -0,0 +1,70 @@
+"""
+Rerank 分数缓存测试
+验证只把未缓存的查询-文本块对送去打分、缓存分数合并回结果，以及按来源 / 行ID失效
+"""
+import sys
+import os
+import json
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools import rerank_cache, reranker_tool
+from tools.rerank_cache import RerankScoreCache, invalidate_rerank_cache
+
+DOCS = [
+    {"content": "新设企业建账需要准备会计科目", "chunk_id": "1", "metadata": {"source": "a.md"}},
+    {"content": "银行存款余额调节表", "chunk_id": "2", "metadata": {"source": "b.md"}},
+    {"content": "固定资产折旧计入管理费用", "metadata": {"source": "b.md"}},
+]
+SCORES = {"1": 0.9, "2": 0.4}
+
+
+def _stub(monkeypatch):
+    sent = []
+
+    def endpoint_scores(query, doc_list):
+        sent.append([d["content"] for d in doc_list])
+        return [{"id": d["id"], "score": SCORES.get(d.get("chunk_id"), 0.1), "reason": ""} for d in doc_list]
+
+    monkeypatch.setenv("RERANK_BACKEND", "endpoint")
+    monkeypatch.setattr(reranker_tool, "_endpoint_scores", endpoint_scores)
+    monkeypatch.setattr(rerank_cache, "_cache", RerankScoreCache(max_entries=100))
+    return sent
+
+
+def _rerank(query, docs):
+    result = reranker_tool.rerank_documents.invoke({"query": query, "documents": json.dumps(docs), "top_n": len(docs)})
+    return [(d["content"], d["relevance_score"]) for d in json.loads(result)]
+
+
+def test_only_uncached_pairs_are_scored(monkeypatch):
+    sent = _stub(monkeypatch)
+    first = _rerank("如何建账", DOCS[:2])
+    assert len(sent[0]) == 2
+
+    # 查询只差空白和大小写时复用分数；新文本块（按内容哈希标识）单独打分
+    second = _rerank(" 如何  建账", DOCS)
+    assert sent[1] == [DOCS[2]["content"]]
+    assert second[:2] == first and second[2] == (DOCS[2]["content"], 0.1)
+
+    # 全部命中时不调用模型
+    _rerank("如何建账", DOCS)
+    assert len(sent) == 2
+    # 不同查询不命中
+    _rerank("余额调节", DOCS[:1])
+    assert len(sent) == 3
+
+
+def test_invalidation_by_source_and_chunk_id(monkeypatch):
+    sent = _stub(monkeypatch)
+    _rerank("如何建账", DOCS)
+
+    invalidate_rerank_cache(source="b.md")
+    _rerank("如何建账", DOCS)
+    assert sent[1] == [DOCS[1]["content"], DOCS[2]["content"]]
+
+    invalidate_rerank_cache(chunk_ids=["1"])
+    _rerank("如何建账", DOCS)
+    assert sent[2] == [DOCS[0]["content"]]
+    assert rerank_cache.get_rerank_cache_stats()["hits"] == 3
@@ -0,0 +1,117 @@
+"""
+Rerank 前本地预排序测试
+验证按 BM25 / 词项重合 / 已有向量相似度预排序，prune_to 只把前 top_m 个候选送给模型，
+以及智能路由检索的 Rerank 策略确实触发预排序
+"""
+import sys
+import os
+import json
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools import reranker_tool
+from tools.rerank_cascade import cascade_prune, cascade_scores
+
+DOCS = [
+    {"id": "0", "content": "员工差旅费报销标准与审批流程"},
+    {"id": "1", "content": "银行存款余额调节表的编制方法：核对银行对账单与日记账"},
+    {"id": "2", "content": "固定资产折旧计入管理费用"},
+    {"id": "3", "content": "月末银行对账不平时，逐笔核对未达账项并编制余额调节表"},
+    {"id": "4", "content": "办公室绿植养护说明"},
+]
+
+
+def test_cascade_ranks_lexical_matches_and_uses_known_similarity():
+    scores, signals = cascade_scores("银行余额调节表编制", DOCS)
+    assert "vector" not in signals
+    assert set(map(int, scores.argsort()[::-1][:2])) == {1, 3}
+
+    # 已有的向量相似度参与预排序；缺失的按最弱命中处理
+    docs = [dict(d) for d in DOCS]
+    docs[2]["vector_similarity"] = 0.95
+    docs[1]["vector_similarity"] = 0.2
+    _, signals = cascade_scores("银行余额调节表编制", docs, {"bm25": 0.0, "overlap": 0.0, "vector": 1.0})
+    assert signals["vector"].tolist() == [0.0, 0.0, 1.0, 0.0, 0.0]
+
+    kept, pruned = cascade_prune("银行余额调节表编制", [dict(d) for d in DOCS], 2)
+    assert [d["id"] for d in kept] == ["1", "3"]
+    assert len(pruned) == 3 and all("prerank_score" in d for d in pruned)
+
+
+def test_prune_to_limits_documents_sent_to_model(monkeypatch):
+    sent = []
+
+    def endpoint_scores(query, doc_list):
+        sent.append([d["id"] for d in doc_list])
+        return [{"id": d["id"], "score": 0.9 - i * 0.1, "reason": ""} for i, d in enumerate(doc_list)]
+
+    monkeypatch.setenv("RERANK_BACKEND", "endpoint")
+    monkeypatch.setenv("RERANK_CACHE_ENABLED", "false")
+    monkeypatch.setattr(reranker_tool, "_endpoint_scores", endpoint_scores)
+
+    ranked = json.loads(reranker_tool.rerank_documents.invoke({
+        "query": "银行余额调节表编制",
+        "documents": json.dumps(DOCS),
+        "top_n": 5,
+        "prune_to": 2
+    }))
+    assert sent == [["1", "3"]]
+    assert [d["id"] for d in ranked[:2]] == ["1", "3"]
+    assert all(d["reason"] == "本地预排序淘汰" for d in ranked[2:])
+
+
+def test_smart_retrieve_prunes_before_rerank(monkeypatch):
+    from langchain_core.documents import Document
+    from biz import rag_service
+    from tools import hybrid_retriever
+
+    class Stub:
+        def __init__(self, func):
+            self.invoke = func
+
+    depths = []
+
+    class FakeVectorStore:
+        def similarity_search_with_score(self, query, k):
+            depths.append(k)
+            return [(Document(page_content=f"银行对账说明{i}", id=f"v{i}"), 0.1 + i * 0.01) for i in range(k)]
+
+    hybrid_args = []
+
+    def hybrid(args):
+        hybrid_args.append(args)
+        results = [
+            {"id": f"h{i}", "chunk_id": f"h{i}", "document": f"余额调节表{i}", "vector_rank": i, "vector_score": 0.9 - i * 0.01}
+            for i in range(args["candidate_k"])
+        ]
+        return json.dumps({"final_results": results})
+
+    sent = []
+
+    def endpoint_scores(query, doc_list):
+        sent.append(len(doc_list))
+        return [{"id": d["id"], "score": 0.9 - i * 0.01, "reason": ""} for i, d in enumerate(doc_list)]
+
+    monkeypatch.setenv("RERANK_BACKEND", "endpoint")
+    monkeypatch.setenv("RERANK_CACHE_ENABLED", "false")
+    monkeypatch.setattr(reranker_tool, "_endpoint_scores", endpoint_scores)
+    monkeypatch.setattr(rag_service, "get_storage_provider", lambda: None)
+    monkeypatch.setattr(rag_service, "get_vector_store", lambda collection_name: FakeVectorStore())
+    monkeypatch.setattr(hybrid_retriever, "hybrid_retrieve", Stub(hybrid))
+    service = rag_service.RAGService()
+
+    # 规则型走向量检索，故障排查走混合检索；两者都只把 2 × top_k 个候选送给模型
+    for q_type, top_k in [("rule", 5), ("troubleshooting", 5), ("rule", 3), ("troubleshooting", 3)]:
+        monkeypatch.setattr(rag_service, "classify_question_type", Stub(lambda args, t=q_type: json.dumps({"type": t})))
+        sent.clear()
+        depths.clear()
+        results = service.smart_retrieve("银行余额调节表编制", top_k=top_k)
+        assert sent == [2 * top_k], q_type
+        assert len(results) == top_k
+        if q_type == "rule":
+            # 预排序需要 top_k × 3 个候选：作为自适应深度的起始深度，而不是绕过控制器
+            assert depths == [top_k * 3]
+        else:
+            # 混合检索按真实 top_k 评估深度，Rerank 的候选余量单独给出
+            assert hybrid_args[-1]["top_k"] == top_k and hybrid_args[-1]["candidate_k"] == top_k * 3
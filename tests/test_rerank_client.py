@@ -0,0 +1,102 @@
+"""
+Rerank 接口客户端测试
+使用本地替身服务验证 /rerank 批量打分、接口失败时回退到 chat 后端，以及分片并发打分
+"""
+import sys
+import os
+import json
+import time
+
+import pytest
+
+# 添加 src 与 scripts 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from rerank_stub_server import score_documents, start_server
+from tools import reranker_tool
+from tools.rerank_client import RerankEndpointClient, RerankError, get_rerank_stats, reset_rerank_stats
+
+DOCS = [
+    {"id": "a", "content": "固定资产折旧计入管理费用"},
+    {"id": "b", "content": "新设企业建账需要准备会计科目"},
+    {"id": "c", "content": "银行存款余额调节表"},
+]
+
+
+@pytest.fixture
+def stub_server():
+    server, base_url = start_server()
+    yield base_url
+    server.shutdown()
+
+
+def test_endpoint_client_returns_scores_in_document_order(stub_server):
+    client = RerankEndpointClient(stub_server, None, "stub")
+    documents = [d["content"] for d in DOCS]
+    assert client.rerank("新设企业建账", documents) == score_documents("新设企业建账", documents)
+
+    with pytest.raises(RerankError):
+        RerankEndpointClient(stub_server + "/missing", None, "stub").rerank("建账", documents)
+
+
+def test_rerank_documents_uses_endpoint_and_falls_back_to_chat(stub_server, monkeypatch):
+    # 配置项优先从环境变量读取（rerank.backend → RERANK_BACKEND）
+    monkeypatch.setenv("RERANK_TEST_BASE_URL", stub_server)
+    monkeypatch.setenv("RERANK_ENDPOINT_BASE_URL_ENV", "RERANK_TEST_BASE_URL")
+    monkeypatch.setenv("RERANK_BACKEND", "endpoint")
+    monkeypatch.setenv("RERANK_FALLBACK_TO_CHAT", "true")
+    reset_rerank_stats()
+
+    ranked = json.loads(reranker_tool.rerank_documents.invoke({"query": "新设企业建账", "documents": json.dumps(DOCS), "top_n": 2}))
+    assert [d["id"] for d in ranked] == ["b", "a"]
+    assert ranked[0]["relevance_score"] == 1.0
+
+    # 接口不可用时回退到 chat 后端
+    monkeypatch.setenv("RERANK_TEST_BASE_URL", stub_server + "/missing")
+    monkeypatch.setattr(
+        reranker_tool, "_chat_scores",
+        lambda query, doc_list, config: ([{"id": "c", "score": 0.9, "reason": "stub"}], False)
+    )
+    ranked = json.loads(reranker_tool.rerank_documents.invoke({"query": "余额调节", "documents": json.dumps(DOCS), "top_n": 1}))
+    assert ranked[0]["id"] == "c" and ranked[0]["reason"] == "stub"
+
+    stats = get_rerank_stats()
+    assert stats["endpoint"]["calls"] == 2 and stats["endpoint"]["error_rate"] == 0.5
+    assert stats["chat"]["calls"] == 1 and stats["chat"]["parse_failure_rate"] == 0.0
+
+    # 关闭回退时直接报错
+    monkeypatch.setenv("RERANK_FALLBACK_TO_CHAT", "false")
+    with pytest.raises(Exception, match="Rerank"):
+        reranker_tool.rerank_documents.invoke({"query": "余额调节", "documents": json.dumps(DOCS)})
+
+
+def test_sharded_rerank_runs_concurrently_and_degrades_failed_shard(monkeypatch):
+    monkeypatch.setenv("RERANK_BACKEND", "endpoint")
+    monkeypatch.setenv("RERANK_CACHE_ENABLED", "false")
+    monkeypatch.setenv("RERANK_SHARDING_ENDPOINT_SHARD_SIZE", "3")
+    docs = [{"id": str(i), "content": f"文档{i}"} for i in range(12)]
+
+    def endpoint_scores(query, doc_list):
+        time.sleep(0.2)
+        if any(d["id"] == "4" for d in doc_list):
+            raise RerankError("shard down")
+        return [{"id": d["id"], "score": 1 - int(d["id"]) / 100, "reason": ""} for d in doc_list]
+
+    monkeypatch.setattr(reranker_tool, "_endpoint_scores", endpoint_scores)
+    monkeypatch.setenv("RERANK_FALLBACK_TO_CHAT", "false")
+    start = time.perf_counter()
+    ranked = json.loads(reranker_tool.rerank_documents.invoke({"query": "建账", "documents": json.dumps(docs), "top_n": 12}))
+    assert time.perf_counter() - start < 0.6
+
+    # 分片 [3, 4, 5] 失败：只有这三个文档取占位分数排在后面，其余按分数排序
+    assert [d["id"] for d in ranked] == ["0", "1", "2", "6", "7", "8", "9", "10", "11", "3", "4", "5"]
+    assert {d["reason"] for d in ranked[-3:]} == {"分片打分失败"}
+
+    # 全部分片失败时报错
+    def endpoint_down(query, doc_list):
+        raise RerankError("down")
+
+    monkeypatch.setattr(reranker_tool, "_endpoint_scores", endpoint_down)
+    with pytest.raises(Exception, match="所有分片"):
+        reranker_tool.rerank_documents.invoke({"query": "建账", "documents": json.dumps(docs)})
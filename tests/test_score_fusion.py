@@ -0,0 +1,133 @@
+"""
+混合检索分数融合测试
+验证按文本块标识对齐（行ID / 内容哈希）与数组融合分数
+"""
+import sys
+import os
+import random
+
+import numpy as np
+import pytest
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.score_fusion import align_candidates, available_fusers, fuse_scores, get_fuser, rank_fused
+
+FIELDS = [("vector_score", "score"), ("bm25_score", "score")]
+HEADER = "# 建账规则指南\n\n## 第一章 总则\n\n本章说明建账的基本要求与适用范围，"
+
+
+def test_alignment_by_row_id_and_content_hash():
+    vector = [
+        {"id": "1", "document": HEADER + "适用于新设企业。", "vector_score": 0.9},
+        {"id": "2", "document": HEADER + "适用于分支机构。", "vector_score": 0.8},
+        {"id": "3", "document": "会计科目设置", "vector_score": 0.7},
+    ]
+    bm25 = [
+        # 与行 2 共享前 50 个字符但是不同文本块
+        {"id": "4", "document": HEADER + "适用于个体工商户。", "bm25_score": 5.0},
+        {"id": "2", "document": HEADER + "适用于分支机构。", "bm25_score": 4.0},
+        # 没有行ID：按去空白后的内容与行 3 对齐
+        {"document": "会计科目  设置\n", "bm25_score": 3.0},
+    ]
+    aligned = align_candidates([vector, bm25], FIELDS)
+    assert aligned.chunk_ids[:4] == ["1", "2", "3", "4"] and len(aligned) == 4
+    assert aligned.ranks.tolist() == [[0, 1, 2, -1], [-1, 1, 2, 0]]
+    assert aligned.scores[1].tolist() == [0.0, 4.0, 3.0, 5.0]
+
+    # 内容相同但行ID不同的文本块不合并
+    aligned = align_candidates([[{"id": "a", "document": "x", "vector_score": 1}],
+                                [{"document": "x", "bm25_score": 1}, {"id": "b", "document": "x", "bm25_score": 1}]], FIELDS)
+    assert aligned.chunk_ids[0] == "a" and len(aligned) == 2
+
+
+def test_row_id_fast_path_matches_general_alignment():
+    rng = random.Random(1)
+    vector = [{"id": i, "document": f"块{i}", "vector_score": rng.random()} for i in rng.sample(range(30), 20)]
+    bm25 = [{"id": str(i), "document": f"块{i}", "bm25_score": rng.random() * 10} for i in rng.sample(range(30), 20)]
+    bm25.insert(3, dict(bm25[1]))       # 同一路内重复的文本块只保留排名靠前的一次
+    fast = align_candidates([vector, bm25], FIELDS)
+
+    # 末尾追加一个没有行ID的结果，整体走内容哈希的通用路径
+    general = align_candidates([vector, bm25 + [{"document": "无行ID", "bm25_score": 0.0}]], FIELDS)
+    n = len(fast)
+    assert general.chunk_ids[:n] == fast.chunk_ids and len(general) == n + 1
+    assert np.array_equal(general.scores[:, :n], fast.scores)
+    assert np.array_equal(general.ranks[:, :n], fast.ranks)
+    assert fast.scores.shape == fast.ranks.shape == (2, n)
+    assert align_candidates([[], []], FIELDS).scores.shape == (2, 0)
+
+
+def test_fusion_matches_per_document_formula():
+    rng = random.Random(0)
+    ids = [str(i) for i in range(40)]
+    vector = [{"id": i, "document": i, "vector_score": rng.random()} for i in rng.sample(ids, 25)]
+    bm25 = [{"id": i, "document": i, "bm25_score": rng.random() * 10} for i in rng.sample(ids, 25)]
+    aligned = align_candidates([vector, bm25], FIELDS)
+
+    v = {r["id"]: (rank, r["vector_score"]) for rank, r in enumerate(vector)}
+    b = {r["id"]: (rank, r["bm25_score"]) for rank, r in enumerate(bm25)}
+    vs = [v.get(c, (-1, 0.0))[1] for c in aligned.chunk_ids]
+    bs = [b.get(c, (-1, 0.0))[1] for c in aligned.chunk_ids]
+
+    def minmax(xs):
+        return [(x - min(xs)) / (max(xs) - min(xs)) for x in xs]
+
+    expected = [0.3 * x + 0.7 * y for x, y in zip(minmax(vs), minmax(bs))]
+    assert np.allclose(fuse_scores(aligned, [0.3, 0.7], "weighted"), expected)
+
+    def rrf(rank):
+        return 1 / (60 + rank + 1) if rank >= 0 else 0
+
+    expected = [0.5 * rrf(v.get(c, (-1,))[0]) + 0.5 * rrf(b.get(c, (-1,))[0]) for c in aligned.chunk_ids]
+    fused = fuse_scores(aligned, [0.5, 0.5], "rrf")
+    assert np.allclose(fused, expected)
+    top = rank_fused(fused, 5)
+    assert list(fused[top]) == sorted(fused, reverse=True)[:5]
+
+
+def test_registered_fusers_match_reference_formulas():
+
+    assert {"weighted", "sigmoid", "rrf", "zscore", "combsum", "combmnz", "dbsf"} <= set(available_fusers())
+    with pytest.raises(ValueError):
+        get_fuser("borda")
+
+    rng = random.Random(1)
+    ids = [str(i) for i in range(30)]
+    legs = [
+        [{"id": i, "document": i, "vector_score": rng.random()} for i in rng.sample(ids, 18)],
+        [{"id": i, "document": i, "bm25_score": rng.random() * 20} for i in rng.sample(ids, 18)],
+    ]
+    aligned = align_candidates(legs, FIELDS)
+    weights = [0.4, 0.6]
+    hits = [{r["id"]: r[f[0]] for r in leg} for leg, f in zip(legs, FIELDS)]
+
+    def per_leg(normalize, absent):
+        fused = np.zeros(len(aligned))
+        for w, leg_hits in zip(weights, hits):
+            values = list(leg_hits.values())
+            for j, chunk in enumerate(aligned.chunk_ids):
+                fused[j] += w * (normalize(leg_hits[chunk], values) if chunk in leg_hits else absent(values, normalize))
+        return fused
+
+    def minmax(x, values):
+        return (x - min(values)) / (max(values) - min(values))
+
+    def zscore(x, values):
+        return (x - np.mean(values)) / np.std(values)
+
+    def dbsf(x, values):
+        mean, std = np.mean(values), np.std(values)
+        return min(max((x - (mean - 3 * std)) / (6 * std), 0.0), 1.0)
+
+    combsum = per_leg(minmax, lambda values, f: 0.0)
+    assert np.allclose(fuse_scores(aligned, weights, "combsum"), combsum)
+    assert np.allclose(fuse_scores(aligned, weights, "combmnz"), combsum * aligned.present.sum(axis=0))
+    assert np.allclose(
+        fuse_scores(aligned, weights, "zscore"),
+        per_leg(zscore, lambda values, f: min(f(v, values) for v in values))
+    )
+    fused = fuse_scores(aligned, weights, "dbsf")
+    assert np.allclose(fused, per_leg(dbsf, lambda values, f: 0.0))
+    assert fused.min() >= 0 and fused.max() <= 1
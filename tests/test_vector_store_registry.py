@@ -0,0 +1,105 @@
+"""
+向量存储注册表测试
+验证同一 (集合, 连接) 并发获取只创建一个 PGVector 实例、复用 storage.database.db 的 Engine、
+慢速创建不阻塞其他集合，以及按集合移除
+"""
+import sys
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加 src 到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_core.embeddings import Embeddings
+
+from storage.database import db
+from tools import vector_store
+
+DB_URL = "postgresql+psycopg://user@localhost:5432/vector_db"
+
+
+class FakeEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [0.0]
+
+
+def _setup(monkeypatch):
+    created = []
+    lock = threading.Lock()
+
+    class FakePGVector:
+        def __init__(self, collection_name, connection, embeddings, use_jsonb):
+            time.sleep(0.02)  # 模拟集合查找与建表
+            self.collection_name = collection_name
+            self.connection = connection
+            with lock:
+                created.append(collection_name)
+
+    engine = object()
+    monkeypatch.setenv("PGDATABASE_URL", DB_URL)
+    monkeypatch.setattr(db, "get_engine", lambda: engine)
+    monkeypatch.setattr(vector_store, "_vector_store", FakePGVector)
+    monkeypatch.setattr(vector_store, "_store_registry", {})
+    monkeypatch.setattr(vector_store, "_store_pending", {})
+    return created, engine
+
+
+def test_concurrent_calls_share_one_store_and_engine(monkeypatch):
+    created, engine = _setup(monkeypatch)
+    embeddings = FakeEmbeddings()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        stores = list(pool.map(lambda _: vector_store.get_vector_store("kb", embeddings=embeddings), range(16)))
+    assert created == ["kb"]
+    assert all(store is stores[0] for store in stores)
+    assert stores[0].connection is engine
+
+    other = vector_store.get_vector_store("other", embeddings=embeddings)
+    assert other is not stores[0] and other.connection is engine
+    assert vector_store.get_vector_store_stats()["collections"] == ["kb", "other"]
+
+
+def test_forget_and_warm(monkeypatch):
+    created, _ = _setup(monkeypatch)
+    monkeypatch.setattr(vector_store, "_embeddings_client", FakeEmbeddings())
+    assert vector_store.warm_vector_stores(["kb", "faq"]) == ["kb", "faq"]
+    vector_store.get_vector_store("kb")
+    assert created == ["kb", "faq"]
+
+    vector_store.forget_vector_store("kb")
+    vector_store.get_vector_store("kb")
+    assert created == ["kb", "faq", "kb"]
+
+
+def test_slow_construction_does_not_block_other_collections(monkeypatch):
+    created, _ = _setup(monkeypatch)
+    embeddings = FakeEmbeddings()
+    kb = vector_store.get_vector_store("kb", embeddings=embeddings)
+
+    release = threading.Event()
+    started = threading.Event()
+    FakePGVector = vector_store._vector_store
+
+    class SlowPGVector(FakePGVector):
+        def __init__(self, collection_name, **kwargs):
+            if collection_name == "slow":
+                started.set()
+                release.wait(5)
+            super().__init__(collection_name, **kwargs)
+
+    monkeypatch.setattr(vector_store, "_vector_store", SlowPGVector)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        slow = [pool.submit(vector_store.get_vector_store, "slow", embeddings=embeddings) for _ in range(2)]
+        assert started.wait(2)
+        start = time.perf_counter()
+        assert vector_store.get_vector_store("kb", embeddings=embeddings) is kb
+        assert vector_store.get_vector_store("other", embeddings=embeddings) is not kb
+        assert time.perf_counter() - start < 0.5
+        release.set()
+        assert slow[0].result(timeout=2) is slow[1].result(timeout=2)
+    assert created.count("slow") == 1